@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from __future__ import division
+from SearchEngine import ACCUMULATORS_SCORING
+from SearchEngine import SCORINGS
+from SearchEngine import SearchEngine
+from time import time as getTime
+import argparse
+import bisect
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+
+# the CFC collection has 1239 documents in 6 files, one per year, and 100
+# queries. A collection of scale S has S times as many documents
+CFC_YEARS = range(74, 80)
+CFC_DOCUMENTS = 1239
+CFC_QUERIES = 100
+# the vocabulary of a collection of scale 1, it grows with the square root of
+# the scale, like Heaps' law predicts
+CFC_VOCABULARY = 5000
+
+SCALES = [1, 10, 100]
+BENCHMARK_PATH = "benchmark.json"
+PERCENTILES = [50, 95, 99]
+
+class ZipfSampler(object):
+    """
+    Draws words from a vocabulary with a Zipfian distribution: the word of
+    rank r is drawn with probability proportional to 1 / r ** exponent.
+    """
+    def __init__(self, vocabularySize, exponent=1.0, rng=random):
+        """
+        Constructor method.
+
+        param vocabularySize: the amount of distinct words.
+        param exponent: the exponent of the distribution.
+        param rng: the random.Random object used to draw the words.
+        """
+        self.rng = rng
+        self.words = [self.makeWord(rank) for rank in xrange(vocabularySize)]
+        self.cumulative = []
+        total = 0
+        for rank in xrange(1, vocabularySize + 1):
+            total += 1 / rank ** exponent
+            self.cumulative.append(total)
+        self.total = total
+
+    @staticmethod
+    def makeWord(rank):
+        """
+        param rank: the rank of the word in the vocabulary.
+        return: a distinct lowercase word for each rank, made of letters only
+        so the Parser keeps it whole, and never a stop word.
+        """
+        letters = []
+        rank += 1
+        while rank:
+            rank, digit = divmod(rank - 1, 26)
+            letters.append(chr(ord('a') + digit))
+        return "z" + "".join(reversed(letters))
+
+    def word(self):
+        """
+        return: a word drawn from the distribution.
+        """
+        iii = bisect.bisect(self.cumulative, self.rng.random() * self.total)
+        return self.words[min(iii, len(self.words) - 1)]
+
+    def text(self, nWords):
+        """
+        param nWords: the amount of words.
+        return: a string with the words, in lines of 10 words indented like
+        the continuation lines of the CFC files.
+        """
+        words = [self.word() for iii in xrange(nWords)]
+        lines = [" ".join(words[iii:iii + 10]) for iii in xrange(0, nWords, 10)]
+        return "\n   ".join(lines)
+
+def generateCollection(folder, scale=1, seed=0, exponent=1.0,
+        nQueries=CFC_QUERIES):
+    """
+    Write a synthetic collection in the format of the CFC collection, with
+    Zipfian words, and a query file with random relevant documents.
+
+    param folder: string containing the path to the folder of the files,
+    created if it doesn't exist.
+    param scale: the collection has about scale times the documents of the
+    CFC collection.
+    param seed: seed of the random numbers, the same seed and scale always
+    give the same collection.
+    param exponent: the exponent of the Zipfian distribution.
+    param nQueries: the amount of queries.
+    return: the amount of documents written.
+    """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    rng = random.Random(seed)
+    sampler = ZipfSampler(int(CFC_VOCABULARY * scale ** 0.5), exponent, rng)
+    nDocs = int(CFC_DOCUMENTS * scale)
+    perFile = -(-nDocs // len(CFC_YEARS))
+    docId = 1
+    for year in CFC_YEARS:
+        with open(os.path.join(folder, "cf{}".format(year)), "w") as fout:
+            for iii in xrange(perFile):
+                if docId > nDocs:
+                    break
+                fout.write("PN {:02d}{:03d}\nRN {:05d}\nAN {:08d}\n"
+                        .format(year, iii % 1000, docId, docId))
+                fout.write("AU Author-{}.\n".format(sampler.word()))
+                fout.write("TI {}.\n".format(sampler.text(rng.randint(5, 15))))
+                fout.write("SO Journal 19{}; 1(1): 1-2.\n".format(year))
+                fout.write("MJ {}: co.  {}: im.\n".format(
+                    sampler.word().upper(), sampler.word().upper()))
+                fout.write("MN {}: an.  {}\n".format(sampler.word().upper(),
+                    sampler.text(4)))
+                fout.write("{} {}\n\n".format(rng.choice(["AB", "EX"]),
+                    sampler.text(rng.randint(40, 200))))
+                docId += 1
+    with open(os.path.join(folder, "cfquery"), "w") as fout:
+        for qId in xrange(1, nQueries + 1):
+            fout.write("QN {:05d}\nQU {}?\n".format(qId,
+                sampler.text(rng.randint(5, 25))))
+            relevants = rng.sample(xrange(1, nDocs + 1), min(nDocs,
+                rng.randint(3, 40)))
+            fout.write("NR {:05d}\nRD {}\n\n".format(len(relevants),
+                "  ".join("{} 1".format(rel) for rel in relevants)))
+    return nDocs
+
+def percentile(values, p):
+    """
+    param values: a sorted list of numbers.
+    param p: the percentile, from 0 to 100.
+    return: the nearest rank p-th percentile of the values.
+    """
+    if not values:
+        return 0
+    rank = max(1, -(-p * len(values) // 100))
+    return values[int(rank) - 1]
+
+def peakRss():
+    """
+    return: the peak resident set size of the process, in kilobytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports it in bytes
+    if sys.platform == "darwin":
+        peak //= 1024
+    return peak
+
+class Quiet(object):
+    """
+    Context manager that discards what is printed to the standard output,
+    so the messages of the search engine don't mix with the results.
+    """
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+
+    def __exit__(self, *args):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+def timeQueries(eng, queries, K, repeats):
+    """
+    Process the queries, one at a time.
+
+    param eng: a SearchEngine.SearchEngine object with the index loaded.
+    param queries: a list of util.Query objects.
+    param K: the size of the rankings.
+    param repeats: how many times each query is processed.
+    return: a dict with the percentiles of the latency (in milliseconds),
+    and the queries per second.
+    """
+    latencies = []
+    start = getTime()
+    for iii in xrange(repeats):
+        for query in queries:
+            begin = getTime()
+            eng.processQuery(query, K)
+            latencies.append(1000 * (getTime() - begin))
+    elapsed = getTime() - start
+    latencies.sort()
+    stats = dict(("p{}".format(p), percentile(latencies, p))
+            for p in PERCENTILES)
+    stats["mean"] = sum(latencies) / len(latencies) if latencies else 0
+    stats["count"] = len(latencies)
+    stats["qps"] = len(latencies) / elapsed if elapsed else 0
+    return stats
+
+def benchmarkScale(args):
+    """
+    Benchmark a collection of one scale: generate it, then time createIndex,
+    saveIndex, loadIndex and the queries of each scoring. Runs in its own
+    process, so the peak memory is the one of this scale only.
+
+    param args: a tuple (folder, scale, seed, scorings, K, repeats,
+    workers).
+    return: a dict with the results.
+    """
+    folder, scale, seed, scorings, K, repeats, workers = args
+    result = {"scale": scale}
+
+    start = getTime()
+    result["documents"] = generateCollection(folder, scale, seed)
+    result["generate"] = getTime() - start
+
+    indexPath = os.path.join(folder, "cfcIndex.bin")
+    eng = SearchEngine(cacheSize=0)
+    with Quiet():
+        start = getTime()
+        eng.createIndex(folder, workers=workers)
+        result["createIndex"] = getTime() - start
+        result["terms"] = len(eng.invertedIndex)
+        result["postings"] = sum(len(lst) for lst in eng.invertedIndex.postings)
+        start = getTime()
+        eng.saveIndex(indexPath)
+        result["saveIndex"] = getTime() - start
+    result["indexBytes"] = os.path.getsize(indexPath)
+    result["peakRssCreateKb"] = peakRss()
+    del eng
+
+    queries = list(SearchEngine().parser.parseQueryFile(
+        os.path.join(folder, "cfquery")))
+    result["queries"] = {}
+    for scoring in scorings:
+        eng = SearchEngine(scoring, cacheSize=0)
+        with Quiet():
+            start = getTime()
+            eng.loadIndex(indexPath)
+            result.setdefault("loadIndex", getTime() - start)
+            result["queries"][scoring] = timeQueries(eng, queries, K, repeats)
+        eng.indexFile.close()
+    result["peakRssKb"] = peakRss()
+    return result
+
+def runBenchmark(scales=SCALES, scorings=(ACCUMULATORS_SCORING,), K=20,
+        repeats=1, seed=0, workers=1, folder=None):
+    """
+    Benchmark collections of each scale, each one in its own process.
+
+    param scales: a list with the scales of the collections.
+    param scorings: the scorings whose queries are timed, see
+    SearchEngine.setScoring.
+    param K: the size of the rankings.
+    param repeats: how many times each query is processed.
+    param seed: seed of the random numbers of the collections.
+    param workers: amount of processes parsing the files of the collections.
+    param folder: string containing the path to the folder where the
+    collections are generated, kept after the benchmark. If it's None they
+    are generated in a temporary folder, removed after the benchmark.
+    return: a dict with the settings, the environment and the results of
+    each scale, ready to be saved as JSON.
+    """
+    root = folder or tempfile.mkdtemp(prefix="cfcbench")
+    results = []
+    try:
+        for scale in scales:
+            print("Benchmarking the scale {}.".format(scale))
+            args = (os.path.join(root, "scale{}".format(scale)), scale, seed,
+                    list(scorings), K, repeats, workers)
+            pool = multiprocessing.Pool(1)
+            try:
+                results.append(pool.apply(benchmarkScale, (args,)))
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+            printResult(results[-1])
+    finally:
+        if folder is None:
+            shutil.rmtree(root, ignore_errors=True)
+    return {
+            "settings": {"scales": list(scales), "scorings": list(scorings),
+                "K": K, "repeats": repeats, "seed": seed, "workers": workers},
+            "environment": {"python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": multiprocessing.cpu_count()},
+            "results": results,
+            }
+
+def printResult(result):
+    """
+    Print the results of a scale, see benchmarkScale.
+
+    param result: a dict with the results.
+    return: None
+    """
+    print("\tdocuments: {}, terms: {}, postings: {}, index: {} bytes"
+            .format(result["documents"], result["terms"], result["postings"],
+                result["indexBytes"]))
+    print("\tcreateIndex: {:.3f} s, saveIndex: {:.3f} s, loadIndex: {:.5f} s"
+            .format(result["createIndex"], result["saveIndex"],
+                result["loadIndex"]))
+    for scoring, stats in sorted(result["queries"].iteritems()):
+        print("\t{}: p50 {:.3f} ms, p95 {:.3f} ms, p99 {:.3f} ms, {:.1f} queries/s"
+                .format(scoring, stats["p50"], stats["p95"], stats["p99"],
+                    stats["qps"]))
+    print("\tpeak RSS: {} KB".format(result["peakRssKb"]))
+
+def compareReports(old, new):
+    """
+    Print the change of the times and memory of each scale between two
+    benchmarks, to spot regressions.
+
+    param old: a dict with the previous benchmark, see runBenchmark.
+    param new: a dict with the current benchmark.
+    return: None
+    """
+    oldResults = dict((result["scale"], result) for result in old["results"])
+    for result in new["results"]:
+        before = oldResults.get(result["scale"])
+        if before is None:
+            continue
+        print("Scale {} compared to the previous benchmark:".format(result["scale"]))
+        metrics = [(key, before.get(key), result.get(key)) for key in
+                ["createIndex", "saveIndex", "loadIndex", "peakRssKb"]]
+        for scoring, stats in sorted(result["queries"].iteritems()):
+            oldStats = before["queries"].get(scoring, {})
+            for key in ["p50", "p95", "p99"]:
+                metrics.append(("{} {}".format(scoring, key),
+                    oldStats.get(key), stats[key]))
+        for name, oldValue, newValue in metrics:
+            if oldValue:
+                print("\t{}: {:+.1f}%".format(name,
+                    100 * (newValue - oldValue) / oldValue))
+
+def createParser():
+    description = """
+        Benchmark of the search engine on synthetic collections in the
+        format of the CFC collection, with Zipfian words. Times the
+        creation, saving and loading of the index, and the queries."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("-s", "--scales", type=int, nargs="+", default=SCALES,
+            dest="scales", help="""the scales of the collections, the amount
+            of documents relative to the CFC collection. Defaults to {}
+            """.format(" ".join(str(scale) for scale in SCALES)))
+    parser.add_argument("-sc", "--scorings", nargs="+", choices=SCORINGS,
+            default=[ACCUMULATORS_SCORING], dest="scorings",
+            help="""the scorings whose queries are timed. Defaults to {}
+            """.format(ACCUMULATORS_SCORING))
+    parser.add_argument("-rs", "--rankingsize", type=int, default=20,
+            dest="rSize", help="the size of the rankings. Defaults to 20")
+    parser.add_argument("-r", "--repeats", type=int, default=1,
+            dest="repeats", help="""how many times each query is processed.
+            Defaults to 1""")
+    parser.add_argument("-sd", "--seed", type=int, default=0, dest="seed",
+            help="seed of the random collections. Defaults to 0")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+            dest="workers", help="""the amount of processes parsing the
+            files. Defaults to 1""")
+    parser.add_argument("-d", "--folder", dest="folder", help="""folder
+            where the collections are generated and kept, by default they
+            are removed after the benchmark""")
+    parser.add_argument("-o", "--output", default=BENCHMARK_PATH,
+            dest="output", help="""the JSON file with the results. Defaults
+            to {}""".format(BENCHMARK_PATH))
+    parser.add_argument("-c", "--compare", dest="compare", help="""a JSON
+            file with the results of a previous benchmark, to compare with
+            the current one""")
+    return parser
+
+if __name__ == '__main__':
+    args = createParser().parse_args()
+    previous = None
+    if args.compare:
+        try:
+            with open(args.compare) as fin:
+                previous = json.load(fin)
+        except (IOError, ValueError) as e:
+            print("Could not read the benchmark at path: {}".format(args.compare))
+            print(e)
+            sys.exit(-1)
+    report = runBenchmark(args.scales, args.scorings, args.rSize,
+            args.repeats, args.seed, args.workers, args.folder)
+    with open(args.output, "w") as fout:
+        json.dump(report, fout, indent=2, sort_keys=True)
+    print("Results saved in the file: {}".format(args.output))
+    if previous:
+        compareReports(previous, report)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from util import Document
+import array
+
+def packStrings(strings):
+    """
+    Concatenate the strings in a single blob, addressed by an offsets array.
+
+    The i-th string is blob[offsets[i]:offsets[i + 1]].
+
+    param strings: an iterable of strings.
+    return: a tuple (array.array, string) with the offsets and the blob.
+    """
+    offsets = array.array("I", [0])
+    parts = []
+    total = 0
+    for string in strings:
+        if string is None: string = ''
+        total += len(string)
+        offsets.append(total)
+        parts.append(string)
+    return offsets, ''.join(parts)
+
+class DocumentStore(object):
+    """
+    The documents of an index, stored in columns. Each document has a row,
+    its position in the sorted order of the docIDs, and the docIDs, years and
+    norms are arrays indexed by row. The titles and authors are concatenated
+    in a single string blob, addressed by an offsets array, and only read
+    when a document is built.
+
+    The scoring methods read the norms straight from the array, and only
+    the documents of the results are built as util.Document objects. For
+    the code that needs whole documents, it's also a read only dict like
+    view, keyed by docID, with util.Document values built on every access.
+
+    Documents can't be added to the store, it's built at once from the
+    documents by fromDocuments.
+    """
+    def __init__(self, docIds=None, years=None, norms=None, stringOffsets=None,
+            blob='', base=0):
+        """
+        Constructor method. Without arguments creates an empty store.
+
+        param docIds: array.array of int32 with the sorted docIDs.
+        param years: array.array of int32 with the year of each document.
+        param norms: array.array of float64 with the norm of each document.
+        param stringOffsets: array.array of uint32 with the offsets of the
+        title and the authors of each document in blob, plus the end of the
+        blob, see packStrings.
+        param blob: a string (or mmap) with the titles and authors.
+        param base: offset of the first string in blob.
+        """
+        self.docIds = array.array("i") if docIds is None else docIds
+        self.years = array.array("i") if years is None else years
+        self.norms = array.array("d") if norms is None else norms
+        self.stringOffsets = (array.array("I", [0]) if stringOffsets is None
+                else stringOffsets)
+        self.blob = blob
+        self.base = base
+        # the docID to row table, built by the first call to rows
+        self.rowTable = None
+
+    @classmethod
+    def fromDocuments(cls, documents):
+        """
+        Build a store out of documents, in any order.
+
+        param documents: an iterable of util.Document objects.
+        return: a DocumentStore object.
+        """
+        documents = sorted(documents, key=lambda doc: doc.id)
+        strings = []
+        for doc in documents:
+            strings.append(doc.title)
+            strings.append(doc.authors)
+        stringOffsets, blob = packStrings(strings)
+        return cls(array.array("i", [doc.id for doc in documents]),
+                array.array("i", [int(doc.year) for doc in documents]),
+                array.array("d", [doc.norm for doc in documents]),
+                stringOffsets, blob)
+
+    @classmethod
+    def copyOf(cls, store):
+        """
+        Copy another store to memory, like a mapped one.
+
+        param store: a DocumentStore object.
+        return: a DocumentStore object.
+        """
+        return cls(array.array("i", store.docIds), array.array("i", store.years),
+                array.array("d", store.norms),
+                array.array("I", store.stringOffsets), store.stringBlob())
+
+    def stringBlob(self):
+        """
+        return: a string with the titles and authors of the documents.
+        """
+        return self.blob[self.base:self.base + self.stringOffsets[-1]]
+
+    def rows(self):
+        """
+        Get the table that maps each docID to the row of the document. The
+        docIDs of a collection are usually dense, like the RNs of the CFC
+        collection, so the table is an array indexed by docID, with -1 for
+        the docIDs that are not in the store. Otherwise it's a dict.
+
+        return: an array.array or dict, indexed by docID.
+        """
+        if self.rowTable is None:
+            docIds = self.docIds
+            if docIds and docIds[0] >= 0 and docIds[-1] < 4 * len(docIds) + 1024:
+                table = array.array("i", [-1]) * (docIds[-1] + 1)
+                for row, docId in enumerate(docIds):
+                    table[docId] = row
+            else:
+                table = dict((docId, row) for row, docId in enumerate(docIds))
+            self.rowTable = table
+        return self.rowTable
+
+    def row(self, docId):
+        """
+        return: the row of the document with the docID, or -1 if it's not in
+        the store.
+        """
+        if docId < 0:
+            return -1
+        try:
+            return self.rows()[docId]
+        except (IndexError, KeyError):
+            return -1
+
+    def readString(self, iii):
+        """
+        return: the iii-th string of the blob.
+        """
+        begin = self.base + self.stringOffsets[iii]
+        return self.blob[begin:self.base + self.stringOffsets[iii + 1]]
+
+    def document(self, row):
+        """
+        Build the util.Document of a row.
+
+        param row: the row of the document.
+        return: an util.Document object.
+        """
+        return Document(self.docIds[row], self.years[row],
+                self.readString(2 * row), self.readString(2 * row + 1),
+                self.norms[row])
+
+    def __len__(self):
+        return len(self.docIds)
+
+    def __contains__(self, docId):
+        return self.row(docId) >= 0
+
+    def __getitem__(self, docId):
+        row = self.row(docId)
+        if row < 0:
+            raise KeyError(docId)
+        return self.document(row)
+
+    def __iter__(self):
+        return self.iterkeys()
+
+    def get(self, docId, default=None):
+        try:
+            return self[docId]
+        except KeyError:
+            return default
+
+    def iterkeys(self):
+        return iter(self.docIds)
+
+    def itervalues(self):
+        for row in xrange(len(self.docIds)):
+            yield self.document(row)
+
+    def iteritems(self):
+        for row in xrange(len(self.docIds)):
+            yield self.docIds[row], self.document(row)
+
+    def keys(self):
+        return list(self.iterkeys())
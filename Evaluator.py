@@ -101,6 +101,25 @@ def interpolateRecallPoints(recallPoints):
             nRecallPoints.append((nPrecision, nRecall))
     return nRecallPoints
 
+def rankingOverlap(results, exactResults):
+    """
+    Calculate the fraction of the documents of an exact ranking that are
+    also in an approximate ranking, like the ones of the budgets of
+    SearchEngine.setBudget.
+
+    If the exact ranking is empty returns 1.0.
+
+    param results: a list of ids of documents returned by the approximate
+    query.
+    param exactResults: a list of ids of documents returned by the exact
+    query.
+    return: a number in the interval [0, 1].
+    """
+    if not exactResults:
+        return 1.0
+    found = set(results)
+    return sum(1 for docId in exactResults if docId in found) / len(exactResults)
+
 if __name__ == '__main__':
     # slides IR Baeza-Yates & Ribeiro-Neto
     recallPointsLst = []
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from itertools import izip
+import array
+
+# numpy is optional, without it the finalization runs in pure python
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def decodeGaps(data):
+    """
+    Vectorized version of Postings.decodeVByte, decodes a sequence of variable
+    byte encoded numbers at once with numpy.
+
+    param data: numpy array of uint8 with the encoded numbers.
+    return: a numpy array of int64 with the numbers.
+    """
+    ends = np.flatnonzero(data & 0x80)
+    gaps = (data & 0x7f).astype(np.int64)
+    # numbers of a single byte are the common case, only longer ones need
+    # their bytes shifted and summed
+    if len(ends) == len(data):
+        return gaps
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    # position of each byte in its number
+    numbers = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = 7 * (np.arange(len(data)) - starts[numbers])
+    return np.add.reduceat(gaps << shifts, starts)
+
+def toArray(typecode, values):
+    """
+    Copy a numpy array into an array.array.
+
+    param typecode: the typecode of the array.array, with the same item type
+    as values.
+    param values: a numpy array.
+    return: an array.array object.
+    """
+    arr = array.array(typecode)
+    arr.fromstring(values.tostring())
+    return arr
+
+class Finalizer(object):
+    """
+    Calculates the tf-idf weights, the norms of the documents and the upper
+    bounds of the terms of an index (see SearchEngine.finalizeIndex) with a
+    single pass over the posting lists, into arrays preallocated with one
+    entry per document or per posting.
+
+    Without numpy the squares of the weights are added to the norms one
+    posting at a time, as the lists are added, and the rows of the documents
+    of each list are kept, so the upper bounds are calculated from the final
+    norms without decoding the lists again. With numpy all the lists are
+    decoded and added to the norms at once, when the norms are asked for.
+
+    Both give exactly the same results: the squares of each document are
+    summed in the order the lists were added, and the squares and square
+    roots of the numpy version are calculated with pow, like python does.
+    """
+    def __init__(self, documents, useNumpy=True):
+        """
+        Constructor method.
+
+        param documents: the DocumentStore.DocumentStore of the index.
+        param useNumpy: whether or not to use numpy, if it's installed.
+        """
+        self.useNumpy = useNumpy and np is not None
+        self.documents = documents
+        nDocs = len(documents)
+        if self.useNumpy:
+            self.squares = np.zeros(nDocs, dtype=np.float64)
+            # the data, weights, factor and length of each list, decoded at
+            # once by the norms method
+            self.data = bytearray()
+            self.weights = array.array("f")
+            self.factors = array.array("d")
+            self.lengths = array.array("i")
+        else:
+            self.rows = documents.rows()
+            self.squares = array.array("d", [0]) * nDocs
+            # the rows and weights of each list
+            self.terms = []
+
+    def setTfIdfWeights(self, postings, idfs):
+        """
+        Replace the frequencies of the posting lists by the tf-idf weights.
+
+        param postings: a list of Postings.PostingList objects.
+        param idfs: a sequence with the idf of each list.
+        return: None
+        """
+        if not self.useNumpy:
+            for lst, idf in izip(postings, idfs):
+                lst.weights = array.array("f", [idf * freq for freq in lst.weights])
+            return
+        freqs = array.array("f")
+        lengths = []
+        for lst in postings:
+            freqs.extend(lst.weights)
+            lengths.append(len(lst))
+        # one multiplication for all the postings, in double precision just
+        # like the python version
+        weights = (np.repeat(np.asarray(idfs, dtype=np.float64), lengths)
+                * np.frombuffer(freqs, dtype=np.float32)).astype(np.float32)
+        start = 0
+        for lst, length in izip(postings, lengths):
+            lst.weights = toArray("f", weights[start:start + length])
+            start += length
+
+    def addTerm(self, lst, weights, factor=1):
+        """
+        Add the squares of the weights of a posting list to the norms.
+
+        param lst: the Postings.PostingList, only its docIDs are read.
+        param weights: array.array of float32 with the weights of the
+        documents of lst, the ones multiplied by the weight of the word in
+        the query.
+        param factor: the weights are multiplied by it before being squared.
+        return: None
+        """
+        if self.useNumpy:
+            self.data += lst.data
+            self.weights.extend(weights)
+            self.factors.append(factor)
+            self.lengths.append(len(weights))
+            return
+        squares = self.squares
+        rows = array.array("i", [self.rows[docId] for docId in lst.docIds()])
+        for row, weight in izip(rows, weights):
+            squares[row] += (weight * factor) **2
+        self.terms.append((rows, weights))
+
+    def norms(self):
+        """
+        Take the square roots of the sums of the squares of the weights.
+        Must be called after all the posting lists are added.
+
+        return: array.array of float64 with the norm of each document, in the
+        order of the rows.
+        """
+        if not self.useNumpy:
+            squares = self.squares
+            for row in xrange(len(squares)):
+                squares[row] = squares[row] **0.5
+            return squares
+
+        lengths = np.frombuffer(self.lengths, dtype=np.int32)
+        # the gaps of every list, the first gap of a list is its first docID,
+        # so the docIDs are the sums of the gaps since the start of the list
+        gaps = decodeGaps(np.frombuffer(self.data, dtype=np.uint8))
+        sums = np.cumsum(gaps)
+        self.starts = np.zeros(len(lengths), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=self.starts[1:])
+        before = np.zeros(len(lengths), dtype=np.int64)
+        before[1:] = sums[self.starts[1:] - 1]
+        docIds = sums - np.repeat(before, lengths)
+        self.rows = np.searchsorted(
+                np.frombuffer(self.documents.docIds, dtype=np.int32), docIds)
+        self.data = None
+
+        self.weights = np.frombuffer(self.weights, dtype=np.float32).astype(np.float64)
+        terms = self.weights * np.repeat(np.frombuffer(self.factors,
+            dtype=np.float64), lengths)
+        # add.at adds the squares one at a time, in the order of the lists
+        np.add.at(self.squares, self.rows,
+                np.power(terms, np.full(len(terms), 2.0)))
+        self.squares = np.power(self.squares, np.full(len(self.squares), 0.5))
+        return toArray("d", self.squares)
+
+    def maxScores(self):
+        """
+        Calculate the upper bound of each posting list, the greatest weight
+        divided by the norm of the document. Must be called after the norms.
+
+        return: array.array of float64 with the upper bound of each list, in
+        the order they were added.
+        """
+        norms = self.squares
+        if not self.useNumpy:
+            maxScores = array.array("d")
+            for rows, weights in self.terms:
+                maxScore = 0
+                for row, weight in izip(rows, weights):
+                    norm = norms[row]
+                    # documents with a null vector never get a similarity
+                    if norm and weight / norm > maxScore:
+                        maxScore = weight / norm
+                maxScores.append(maxScore)
+            self.terms = []
+            return maxScores
+
+        if not len(self.lengths):
+            return array.array("d")
+        postingNorms = norms[self.rows]
+        # documents with a null vector never get a similarity
+        valid = postingNorms != 0
+        ratios = np.zeros(len(postingNorms), dtype=np.float64)
+        ratios[valid] = self.weights[valid] / postingNorms[valid]
+        return toArray("d", np.maximum.reduceat(ratios, self.starts))
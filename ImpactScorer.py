@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from Stats import NULL_STATS
+import array
+import heapq
+
+# what the scoring does once the accumulators reach their budget: stop at
+# once, or keep adding the postings of the documents that already have an
+# accumulator
+QUIT_STRATEGY = "quit"
+CONTINUE_STRATEGY = "continue"
+STRATEGIES = [QUIT_STRATEGY, CONTINUE_STRATEGY]
+
+# amount of postings of an impact ordered list processed at a time, before
+# choosing again the list with the greatest impacts
+SEGMENT_SIZE = 32
+
+class ImpactScorer(object):
+    """
+    Scores queries score at a time, with impact ordered posting lists. The
+    posting lists are converted the first time a word is queried to arrays
+    of docIDs and impacts, the weight of the word in the document divided by
+    the norm of the document, sorted in decrescent impact.
+
+    The lists of the query are processed one segment at a time, always the
+    segment whose first posting has the greatest impact times the weight of
+    the word in the query, so the postings that contribute the most to the
+    similarities come first. The accumulators can be limited by a budget,
+    with the quit or continue strategies, and the postings processed by
+    another one. Without budgets every posting is processed and the ranking
+    is the exact one, apart from the rounding of the sums; with budgets the
+    latency and memory of a query are bounded, and the ranking is an
+    approximation of the exact one.
+    """
+    def __init__(self, documents, invertedIndex, queryWeight, documentWeights,
+            missingWord, maxAccumulators=0, maxPostings=0,
+            strategy=QUIT_STRATEGY):
+        """
+        Constructor method.
+
+        param documents: the SearchEngine.documents of the index.
+        param invertedIndex: the SearchEngine.invertedIndex of the index.
+        param queryWeight: function that receives the frequency of a word in
+        the query and its idf, and returns the weight of the word in the
+        query. See SearchEngine.queryWeight.
+        param documentWeights: function that receives a posting list, and
+        returns the posting list with the weights that are multiplied by the
+        weight of the word in the query. See SearchEngine.documentWeights.
+        param missingWord: function called with each word of a query that is
+        not in the index. See SearchEngine.missingWord.
+        param maxAccumulators: the budget of accumulators of a query, 0 for
+        no budget.
+        param maxPostings: the budget of postings processed by a query, 0
+        for no budget.
+        param strategy: one of STRATEGIES, what to do when the accumulators
+        reach their budget.
+        """
+        self.documents = documents
+        self.invertedIndex = invertedIndex
+        self.queryWeight = queryWeight
+        self.documentWeights = documentWeights
+        self.missingWord = missingWord
+        self.setBudget(maxAccumulators, maxPostings, strategy)
+
+        # term ID keys and (idf, docIDs, impacts) values
+        self.postings = {}
+
+    def setBudget(self, maxAccumulators=0, maxPostings=0,
+            strategy=QUIT_STRATEGY):
+        """
+        Change the budgets of the queries, see the constructor.
+
+        Raises a ValueError if the strategy is unknown or a budget is
+        negative.
+
+        return: None
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError("Unknown accumulator strategy: {}".format(strategy))
+        if maxAccumulators < 0 or maxPostings < 0:
+            raise ValueError("The budgets can't be negative")
+        self.maxAccumulators = maxAccumulators
+        self.maxPostings = maxPostings
+        self.strategy = strategy
+
+    def getPostings(self, termId):
+        """
+        Get the impact ordered posting list of a term.
+
+        param termId: the term ID of the word in the inverted index.
+        return: a tuple (idf, docIds, impacts), where docIds is an
+        array.array of int32 and impacts an array.array of float64, sorted
+        in decrescent impact, and then increasing docID.
+        """
+        try:
+            return self.postings[termId]
+        except KeyError:
+            pass
+        idf = self.invertedIndex.idf(termId)
+        norms = self.documents.norms
+        rows = self.documents.rows()
+        pairs = []
+        for docId, weight in self.documentWeights(
+                self.invertedIndex.postingList(termId)):
+            norm = norms[rows[docId]]
+            # documents with a null vector never get a similarity
+            if norm:
+                pairs.append((-weight / norm, docId))
+        pairs.sort()
+        docIds = array.array("i", [docId for impact, docId in pairs])
+        impacts = array.array("d", [-impact for impact, docId in pairs])
+        result = (idf, docIds, impacts)
+        self.postings[termId] = result
+        return result
+
+    def score(self, qCounter, K, stats=NULL_STATS):
+        """
+        Get the top K documents most similar to the query, within the
+        budgets.
+
+        param qCounter: a collections.Counter with the frequency of the words
+        of the query.
+        param K: get the K most similar documents.
+        param stats: a Stats.Stats object that counts the postings scanned,
+        the accumulators created and the segments processed.
+        return: a list of tuples (similarity, util.Document) ordered in
+        decrescent similarity, then decrescent docID.
+        """
+        if K <= 0:
+            return []
+
+        # a (weight of the word in the query, docIDs, impacts) tuple for each
+        # word, and a max heap with the next segment of each list
+        terms = []
+        segments = []
+        for word in sorted(qCounter.iterkeys()):
+            termId = self.invertedIndex.termId(word)
+            if termId < 0:
+                self.missingWord(word)
+                continue
+            idf, docIds, impacts = self.getPostings(termId)
+            if not docIds:
+                continue
+            qWeight = self.queryWeight(qCounter[word], idf)
+            segments.append((-qWeight * impacts[0], len(terms), 0))
+            terms.append((qWeight, docIds, impacts))
+        heapq.heapify(segments)
+
+        accumulators = {}
+        maxAccumulators = self.maxAccumulators
+        maxPostings = self.maxPostings
+        quitting = self.strategy == QUIT_STRATEGY
+        # whether new accumulators can still be created
+        growing = True
+        postings = 0
+        nSegments = 0
+        with stats.timer("traverse"):
+            while segments:
+                if maxPostings and postings >= maxPostings:
+                    break
+                impact, iii, start = heapq.heappop(segments)
+                qWeight, docIds, impacts = terms[iii]
+                end = min(start + SEGMENT_SIZE, len(docIds))
+                if maxPostings:
+                    end = min(end, start + maxPostings - postings)
+                nSegments += 1
+                for jjj in xrange(start, end):
+                    docId = docIds[jjj]
+                    acc = accumulators.get(docId)
+                    if acc is not None:
+                        accumulators[docId] = acc + qWeight * impacts[jjj]
+                    elif growing:
+                        accumulators[docId] = qWeight * impacts[jjj]
+                        if maxAccumulators and len(accumulators) >= maxAccumulators:
+                            growing = False
+                            if quitting:
+                                end = jjj + 1
+                                break
+                postings += end - start
+                if not growing and quitting:
+                    break
+                if end < len(docIds):
+                    heapq.heappush(segments,
+                            (-qWeight * impacts[end], iii, end))
+        stats.count("postingsScanned", postings)
+        stats.count("accumulators", len(accumulators))
+        stats.count("segments", nSegments)
+
+        with stats.timer("select"):
+            # same order of the heap of SearchEngine.selectTopK
+            top = heapq.nlargest(K, ((acc, docId)
+                for docId, acc in accumulators.iteritems()))
+        return [(acc, self.documents[docId]) for acc, docId in top]
@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from DocumentStore import DocumentStore
+from InvertedIndex import InvertedIndex
+from Lexicon import BLOCK_SIZE
+from Lexicon import Lexicon
+from Postings import PostingList
+import array
+import mmap
+import struct
+import sys
+
+# every binary index starts with this magic string, followed by the version
+# of the format, so old or foreign files are rejected before being mapped
+MAGIC = b"CFCINDEX"
+VERSION = 11
+
+# bits of the flags field of the header
+RAW_FREQUENCIES_FLAG = 1
+POSITIONS_FLAG = 2
+FIELDS_FLAG = 4
+
+# sections of the file, in the order they are written. Each one is a packed
+# little endian array, the header holds the offset of each of them
+SECTIONS = [
+            "docIds",           # int32, sorted document ids
+            "docYears",         # int32, year of each document
+            "docNorms",         # float64, norm of each document
+            "docStrings",       # uint32, offsets of titles and authors
+            "docBlob",          # bytes, titles and authors of the documents
+            "termBlocks",       # uint32, offsets of the blocks of terms
+            "termBlob",         # bytes, the front coded sorted terms, see
+                                # Lexicon.Lexicon
+            "termIdfs",         # float64, idf of each term
+            "termStarts",       # uint32, first posting of each term
+            "termDataStarts",   # uint32, first byte of the docIDs of each term
+            "termLastDocIds",   # int32, greatest docID of each term
+            "termMaxScores",    # float64, upper bound of each term, see
+                                # SearchEngine.calculateMaxScores
+            "postingData",      # bytes, variable byte docID gaps of the lists
+            "postingWeights",   # float32, weights of all the posting lists
+            "termSkipStarts",   # uint32, first skip pointer of each term
+            "skipDocIds",       # int32, docIDs of the skip pointers
+            "skipOffsets",      # uint32, offsets of the skip pointers in the
+                                # docIDs of their list
+            "termPositionStarts",   # uint32, first byte of the positions of
+                                    # each term, empty if the index is not
+                                    # positional
+            "positionData",     # bytes, the positions of the postings of the
+                                # lists, see Positions.encodePositions
+            "fieldTermBlocks",  # uint32, offsets of the blocks of the terms
+                                # of the field index, empty if the index has
+                                # no fields
+            "fieldTermBlob",    # bytes, the front coded sorted terms of the
+                                # field index, see Parser.fieldKey
+            "fieldTermStarts",  # uint32, first posting of each field term
+            "fieldTermDataStarts",  # uint32, first byte of the docIDs of
+                                    # each field term
+            "fieldTermLastDocIds",  # int32, greatest docID of each field term
+            "fieldPostingData", # bytes, variable byte docID gaps of the lists
+                                # of the field index
+            "fieldPostingFreqs",    # float32, frequencies of the terms of
+                                    # the field index in the documents
+                ]
+
+# magic, version, flags, names of the weighting and of the normalizer, amount
+# of documents, terms and postings, interval of the skip pointers (0 if there
+# are none), number of the shard and amount of shards (0 and 1 for a whole
+# index), amount of terms of the field index, then the offsets
+HEADER = struct.Struct("<8sII16s16sIIIIIII" + "Q" * len(SECTIONS))
+
+def toBytes(arr):
+    """
+    Get the little endian representation of an array.array.
+
+    param arr: an array.array object.
+    return: a string with the packed array.
+    """
+    if sys.byteorder == "big":
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tostring()
+
+def fromBytes(typecode, data):
+    """
+    Inverse of toBytes, builds an array.array from a little endian string.
+
+    param typecode: the typecode of the array.
+    param data: a string with the packed array.
+    return: an array.array object.
+    """
+    arr = array.array(typecode)
+    arr.fromstring(data)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+def isIndexFile(path):
+    """
+    Check if the file in the path is a binary index, by looking at its magic
+    string.
+
+    If it fails to open the file the exception is not handled.
+
+    param path: string containing the path to the file.
+    return: True if the file starts with the binary index magic string, False
+    otherwise.
+    """
+    with open(path, "rb") as fin:
+        return fin.read(len(MAGIC)) == MAGIC
+
+def fieldSections(fieldIndex):
+    """
+    Get the sections of the field index of writeIndex, the lists are
+    written without skip pointers, positions or upper bounds.
+
+    param fieldIndex: an InvertedIndex.InvertedIndex object with the terms of
+    the fields, or None if the index has no fields.
+    return: a list with the data of the sections, from fieldTermBlocks on.
+    """
+    if fieldIndex is None:
+        return [b""] * 7
+    lexicon = Lexicon.fromTerms(fieldIndex.iterkeys())
+    starts = array.array("I", [0])
+    dataStarts = array.array("I", [0])
+    lastDocIds = array.array("i")
+    postingData = bytearray()
+    postingFreqs = array.array("f")
+    for termId in xrange(len(fieldIndex)):
+        lst = fieldIndex.postingList(termId)
+        postingData += lst.data
+        postingFreqs.extend(lst.weights)
+        lastDocIds.append(lst.lastDocId)
+        starts.append(len(postingFreqs))
+        dataStarts.append(len(postingData))
+    return [
+            toBytes(lexicon.blockOffsets),
+            lexicon.data,
+            toBytes(starts),
+            toBytes(dataStarts),
+            toBytes(lastDocIds),
+            str(postingData),
+            toBytes(postingFreqs),
+            ]
+
+def writeIndex(path, documents, invertedIndex, rawFrequencies=False,
+        weighting="tfidf", skipInterval=0, normalizer="none", shard=0,
+        nShards=1, fieldIndex=None):
+    """
+    Write the documents and the inverted index to path, in the binary
+    format read by the IndexFile class.
+
+    If it fails in opening the file the exception is not handled.
+
+    param path: string containing the path of the file to be written.
+    param documents: a DocumentStore.DocumentStore object, its columns are
+    written as they are.
+    param invertedIndex: an InvertedIndex.InvertedIndex object, the terms
+    are written in the order of their term IDs, with their positions if the
+    index is positional.
+    param rawFrequencies: whether the posting lists hold raw frequencies
+    instead of tf-idf weights.
+    param weighting: the name of the Weighting used to calculate the idfs
+    and norms.
+    param skipInterval: the interval of the skip pointers of the posting
+    lists, 0 if they have none. Lists without skip pointers get them.
+    param normalizer: the name of the Normalizer applied to the words of the
+    documents, the same one must be applied to the words of the queries.
+    param shard: the number of the shard, if the index is one of the shards
+    of a collection, see SearchEngine.splitShards.
+    param nShards: the amount of shards of the collection, 1 for a whole
+    index.
+    param fieldIndex: an InvertedIndex.InvertedIndex object with the terms
+    of the fields of the documents, see Parser.fieldTerms, or None if the
+    index has no fields.
+    return: None
+    """
+    # the lexicon of an in memory index is written as it is
+    lexicon = invertedIndex.lexicon
+    if not isinstance(lexicon.data, bytes):
+        lexicon = Lexicon.fromTerms(lexicon)
+    idfs = array.array("d")
+    starts = array.array("I", [0])
+    dataStarts = array.array("I", [0])
+    lastDocIds = array.array("i")
+    termMaxScores = array.array("d")
+    postingData = bytearray()
+    postingWeights = array.array("f")
+    skipStarts = array.array("I", [0])
+    skipDocIds = array.array("i")
+    skipOffsets = array.array("I")
+    positional = invertedIndex.hasPositions()
+    positionStarts = array.array("I", [0] if positional else [])
+    positionData = bytearray()
+    for termId in xrange(len(invertedIndex)):
+        idf = invertedIndex.idf(termId)
+        lst = invertedIndex.postingList(termId)
+        if skipInterval:
+            if lst.skips is None or lst.skips[0] != skipInterval:
+                lst.addSkips(skipInterval)
+            interval, lstSkipDocIds, lstSkipOffsets = lst.skips
+            skipDocIds.extend(lstSkipDocIds)
+            skipOffsets.extend(lstSkipOffsets)
+        skipStarts.append(len(skipDocIds))
+        idfs.append(idf)
+        # the compressed lists are copied as they are, without decoding
+        postingData += lst.data
+        postingWeights.extend(lst.weights)
+        lastDocIds.append(lst.lastDocId)
+        termMaxScores.append(invertedIndex.maxScore(termId))
+        starts.append(len(postingWeights))
+        dataStarts.append(len(postingData))
+        if positional:
+            positionData += invertedIndex.positionData(termId)
+            positionStarts.append(len(positionData))
+
+    data = [
+            toBytes(documents.docIds),
+            toBytes(documents.years),
+            toBytes(documents.norms),
+            toBytes(documents.stringOffsets),
+            documents.stringBlob(),
+            toBytes(lexicon.blockOffsets),
+            lexicon.data,
+            toBytes(idfs),
+            toBytes(starts),
+            toBytes(dataStarts),
+            toBytes(lastDocIds),
+            toBytes(termMaxScores),
+            str(postingData),
+            toBytes(postingWeights),
+            toBytes(skipStarts),
+            toBytes(skipDocIds),
+            toBytes(skipOffsets),
+            toBytes(positionStarts),
+            str(positionData),
+            ] + fieldSections(fieldIndex)
+
+    # the sections are written one after the other, right after the header
+    offsets = []
+    offset = HEADER.size
+    for section in data:
+        offsets.append(offset)
+        offset += len(section)
+
+    with open(path, "wb") as fout:
+        flags = RAW_FREQUENCIES_FLAG if rawFrequencies else 0
+        if positional:
+            flags |= POSITIONS_FLAG
+        if fieldIndex is not None:
+            flags |= FIELDS_FLAG
+        nFieldTerms = 0 if fieldIndex is None else len(fieldIndex)
+        fout.write(HEADER.pack(MAGIC, VERSION, flags, weighting, normalizer,
+            len(documents), len(invertedIndex), len(postingWeights), skipInterval,
+            shard, nShards, nFieldTerms, *offsets))
+        for section in data:
+            fout.write(section)
+
+class IndexFile(object):
+    """
+    A binary index file opened with mmap. The numeric columns of the
+    documents and of the term dictionary are copied in a single read each,
+    while titles, authors, terms and posting lists are only read from the
+    mapping when they are accessed, so opening the index is cheap regardless
+    of its size.
+    """
+    def __init__(self, path):
+        """
+        Constructor method. Opens and maps the file in the path.
+
+        If it fails to open the file the exception is not handled.
+
+        param path: string containing the path to the index file.
+        """
+        self.path = path
+        self.fin = open(path, "rb")
+        self.mm = mmap.mmap(self.fin.fileno(), 0, access=mmap.ACCESS_READ)
+
+        fields = HEADER.unpack_from(self.mm, 0)
+        magic, version, flags, weighting, normalizer = fields[:5]
+        nDocs, nTerms, nPostings, skipInterval, shard, nShards = fields[5:11]
+        nFieldTerms = fields[11]
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("{} is not a binary index file".format(path))
+        if version != VERSION:
+            self.close()
+            raise ValueError("{} has version {} of the index format, expected {}. Please create the index again."
+                    .format(path, version, VERSION))
+        self.rawFrequencies = bool(flags & RAW_FREQUENCIES_FLAG)
+        self.positional = bool(flags & POSITIONS_FLAG)
+        self.weighting = weighting.rstrip(b"\0")
+        self.normalizer = normalizer.rstrip(b"\0")
+        self.nDocs = nDocs
+        self.nTerms = nTerms
+        self.nPostings = nPostings
+        self.skipInterval = skipInterval
+        self.shard = shard
+        self.nShards = nShards
+        self.offsets = dict(zip(SECTIONS, fields[12:]))
+
+        self.docIds = self.readArray("docIds", "i", nDocs)
+        self.docYears = self.readArray("docYears", "i", nDocs)
+        self.docNorms = self.readArray("docNorms", "d", nDocs)
+        self.docStrings = self.readArray("docStrings", "I", 2 * nDocs + 1)
+        nBlocks = (nTerms + BLOCK_SIZE - 1) // BLOCK_SIZE
+        self.lexicon = Lexicon(nTerms,
+                self.readArray("termBlocks", "I", nBlocks + 1), self.mm,
+                self.offsets["termBlob"])
+        self.termIdfs = self.readArray("termIdfs", "d", nTerms)
+        self.termStarts = self.readArray("termStarts", "I", nTerms + 1)
+        self.termDataStarts = self.readArray("termDataStarts", "I", nTerms + 1)
+        self.termLastDocIds = self.readArray("termLastDocIds", "i", nTerms)
+        self.termMaxScores = self.readArray("termMaxScores", "d", nTerms)
+        self.termSkipStarts = self.readArray("termSkipStarts", "I", nTerms + 1)
+        if self.positional:
+            self.termPositionStarts = self.readArray("termPositionStarts", "I",
+                    nTerms + 1)
+
+        self.documents = MappedDocuments(self)
+        self.invertedIndex = MappedInvertedIndex(self)
+        self.fieldIndex = None
+        if flags & FIELDS_FLAG:
+            nBlocks = (nFieldTerms + BLOCK_SIZE - 1) // BLOCK_SIZE
+            fieldLexicon = Lexicon(nFieldTerms,
+                    self.readArray("fieldTermBlocks", "I", nBlocks + 1),
+                    self.mm, self.offsets["fieldTermBlob"])
+            self.fieldTermStarts = self.readArray("fieldTermStarts", "I",
+                    nFieldTerms + 1)
+            self.fieldTermDataStarts = self.readArray("fieldTermDataStarts",
+                    "I", nFieldTerms + 1)
+            self.fieldTermLastDocIds = self.readArray("fieldTermLastDocIds",
+                    "i", nFieldTerms)
+            self.fieldIndex = MappedFieldIndex(self, fieldLexicon)
+
+    def close(self):
+        """
+        Unmap and close the index file.
+
+        return: None
+        """
+        self.mm.close()
+        self.fin.close()
+
+    def readArray(self, section, typecode, length, start=0):
+        """
+        Copy part of a numeric section of the file into an array.array.
+
+        param section: the name of the section, one of SECTIONS.
+        param typecode: the typecode of the elements of the section.
+        param length: amount of elements to read.
+        param start: index of the first element to read.
+        return: an array.array object.
+        """
+        itemsize = array.array(typecode).itemsize
+        begin = self.offsets[section] + start * itemsize
+        return fromBytes(typecode, self.mm[begin:begin + length * itemsize])
+
+    def readPostings(self, iii):
+        """
+        Read the posting list of the iii-th term of the dictionary.
+
+        The compressed docIDs and the weights are copied out of the mapping,
+        but they are only decoded when the list is iterated.
+
+        param iii: index of the term.
+        return: a Postings.PostingList object.
+        """
+        start = self.termStarts[iii]
+        length = self.termStarts[iii + 1] - start
+        weights = self.readArray("postingWeights", "f", length, start)
+        begin = self.offsets["postingData"]
+        data = bytearray(self.mm[begin + self.termDataStarts[iii]:
+            begin + self.termDataStarts[iii + 1]])
+        skips = None
+        if self.skipInterval:
+            start = self.termSkipStarts[iii]
+            length = self.termSkipStarts[iii + 1] - start
+            skips = (self.skipInterval,
+                    self.readArray("skipDocIds", "i", length, start),
+                    self.readArray("skipOffsets", "I", length, start))
+        return PostingList(data, weights, self.termLastDocIds[iii], skips)
+
+    def readPositions(self, iii):
+        """
+        Read the positions of the postings of the iii-th term of the
+        dictionary, copied out of the mapping. Only positional indexes have
+        them.
+
+        param iii: index of the term.
+        return: a bytearray with the encoded positions, see
+        Positions.encodePositions.
+        """
+        begin = self.offsets["positionData"]
+        return bytearray(self.mm[begin + self.termPositionStarts[iii]:
+            begin + self.termPositionStarts[iii + 1]])
+
+    def readFieldPostings(self, iii):
+        """
+        Read the posting list of the iii-th term of the field index, see
+        the readPostings method.
+
+        param iii: index of the term.
+        return: a Postings.PostingList object, with the frequencies as
+        weights.
+        """
+        start = self.fieldTermStarts[iii]
+        length = self.fieldTermStarts[iii + 1] - start
+        freqs = self.readArray("fieldPostingFreqs", "f", length, start)
+        begin = self.offsets["fieldPostingData"]
+        data = bytearray(self.mm[begin + self.fieldTermDataStarts[iii]:
+            begin + self.fieldTermDataStarts[iii + 1]])
+        return PostingList(data, freqs, self.fieldTermLastDocIds[iii])
+
+class MappedDocuments(DocumentStore):
+    """
+    Read only view of the documents of an IndexFile. The docIDs, years and
+    norms are the columns of the file, and the titles and authors are read
+    from the mapping when a document is built.
+    """
+    def __init__(self, indexFile):
+        super(MappedDocuments, self).__init__(indexFile.docIds,
+                indexFile.docYears, indexFile.docNorms, indexFile.docStrings,
+                indexFile.mm, indexFile.offsets["docBlob"])
+        self.indexFile = indexFile
+
+class MappedInvertedIndex(InvertedIndex):
+    """
+    Read only view of the inverted index of an IndexFile. The lexicon, idfs
+    and upper bounds are the columns of the file, and the posting lists are
+    read from the file on every access, like the positions of the terms of
+    a positional index.
+    """
+    def __init__(self, indexFile):
+        super(MappedInvertedIndex, self).__init__(indexFile.lexicon,
+                indexFile.termIdfs, None, indexFile.termMaxScores)
+        self.indexFile = indexFile
+
+    def postingList(self, termId):
+        return self.indexFile.readPostings(termId)
+
+    def documentFrequency(self, termId):
+        starts = self.indexFile.termStarts
+        return starts[termId + 1] - starts[termId]
+
+    def hasPositions(self):
+        return self.indexFile.positional
+
+    def positionData(self, termId):
+        return self.indexFile.readPositions(termId)
+
+class MappedFieldIndex(InvertedIndex):
+    """
+    Read only view of the field index of an IndexFile, its posting lists are
+    read from the file on every access. The terms have no idfs.
+    """
+    def __init__(self, indexFile, lexicon):
+        super(MappedFieldIndex, self).__init__(lexicon,
+                array.array("d", [0]) * len(lexicon), None)
+        self.indexFile = indexFile
+
+    def postingList(self, termId):
+        return self.indexFile.readFieldPostings(termId)
+
+    def documentFrequency(self, termId):
+        starts = self.indexFile.fieldTermStarts
+        return starts[termId + 1] - starts[termId]
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from Lexicon import Lexicon
+import array
+
+class InvertedIndex(object):
+    """
+    An inverted index addressed by dense integer term IDs. The terms are kept
+    in a Lexicon, that gives each one its position in the sorted order of the
+    terms as term ID, and the idfs, the posting lists and the upper bounds of
+    the terms (see SearchEngine.calculateMaxScores) are columns indexed by
+    term ID: two float64 arrays and a list. A positional index also has the
+    encoded positions of the postings of each term in a list of bytearrays,
+    see the Positions module.
+
+    For the code that only needs words, it's also a read only dict like
+    view, keyed by word, with (idf, Postings.PostingList) values.
+
+    Terms can't be added to the index, it's built at once from a dict with
+    word keys by fromDict, and changed by building a new one from the dict
+    returned by toDict.
+    """
+    def __init__(self, lexicon=None, idfs=None, postings=None, maxScores=None,
+            positions=None):
+        """
+        Constructor method. Without arguments creates an empty index.
+
+        param lexicon: a Lexicon object with the terms.
+        param idfs: array.array of float64 with the idf of each term.
+        param postings: list with the Postings.PostingList of each term.
+        param maxScores: array.array of float64 with the upper bound of each
+        term. Defaults to zeros.
+        param positions: list with a bytearray with the positions of each
+        term, or None if the index is not positional.
+        """
+        self.lexicon = Lexicon() if lexicon is None else lexicon
+        self.idfs = array.array("d") if idfs is None else idfs
+        self.postings = [] if postings is None else postings
+        if maxScores is None:
+            maxScores = array.array("d", [0]) * len(self.lexicon)
+        self.maxScores = maxScores
+        self.positions = positions
+
+    @classmethod
+    def fromDict(cls, invertedIndex, positions=None):
+        """
+        Build the index out of a dict, giving new term IDs to the terms.
+
+        param invertedIndex: a dict with word keys and (idf,
+        Postings.PostingList) values.
+        param positions: a dict with word keys and bytearray values, with the
+        positions of the postings of each word, or None if the index is not
+        positional.
+        return: an InvertedIndex object, with null upper bounds.
+        """
+        terms = sorted(invertedIndex.iterkeys())
+        idfs = array.array("d")
+        postings = []
+        for term in terms:
+            idf, lst = invertedIndex[term]
+            idfs.append(idf)
+            postings.append(lst)
+        if positions is not None:
+            positions = [positions[term] for term in terms]
+        return cls(Lexicon.fromTerms(terms), idfs, postings, None, positions)
+
+    @classmethod
+    def copyOf(cls, index):
+        """
+        Copy another index to memory, like a mapped one. The term IDs are the
+        same ones.
+
+        param index: an InvertedIndex object.
+        return: an InvertedIndex object.
+        """
+        lexicon = Lexicon.fromTerms(index.iterkeys())
+        postings = [index.postingList(termId) for termId in xrange(len(index))]
+        positions = None
+        if index.hasPositions():
+            positions = [index.positionData(termId)
+                    for termId in xrange(len(index))]
+        return cls(lexicon, array.array("d", index.idfs), postings,
+                array.array("d", index.maxScores), positions)
+
+    def toDict(self):
+        """
+        return: a dict with word keys and (idf, Postings.PostingList) values,
+        sharing the posting lists of the index.
+        """
+        return dict(self.iteritems())
+
+    def __len__(self):
+        return len(self.lexicon)
+
+    def __contains__(self, word):
+        return self.termId(word) >= 0
+
+    def __getitem__(self, word):
+        termId = self.termId(word)
+        if termId < 0:
+            raise KeyError(word)
+        return self.idfs[termId], self.postingList(termId)
+
+    def __iter__(self):
+        return self.iterkeys()
+
+    def termId(self, word):
+        """
+        param word: string containing the word.
+        return: the term ID of the word, or -1 if it's not in the index.
+        """
+        return self.lexicon.find(word)
+
+    def term(self, termId):
+        """
+        return: the word with the term ID.
+        """
+        return self.lexicon.term(termId)
+
+    def idf(self, termId):
+        """
+        return: the idf of the term.
+        """
+        return self.idfs[termId]
+
+    def postingList(self, termId):
+        """
+        return: the Postings.PostingList of the term.
+        """
+        return self.postings[termId]
+
+    def documentFrequency(self, termId):
+        """
+        return: the amount of documents with the term, the length of its
+        posting list.
+        """
+        return len(self.postings[termId])
+
+    def hasPositions(self):
+        """
+        return: True if the index has the positions of the words, False
+        otherwise.
+        """
+        return self.positions is not None
+
+    def positionData(self, termId):
+        """
+        return: a bytearray with the positions of the postings of the term,
+        see Positions.encodePositions.
+        """
+        return self.positions[termId]
+
+    def maxScore(self, termId):
+        """
+        return: the upper bound of the normalized weights of the term.
+        """
+        return self.maxScores[termId]
+
+    def get(self, word, default=None):
+        try:
+            return self[word]
+        except KeyError:
+            return default
+
+    def iterkeys(self):
+        return iter(self.lexicon)
+
+    def itervalues(self):
+        for termId in xrange(len(self)):
+            yield self.idfs[termId], self.postingList(termId)
+
+    def iteritems(self):
+        for termId, term in enumerate(self.lexicon):
+            yield term, (self.idfs[termId], self.postingList(termId))
+
+    def keys(self):
+        return list(self.iterkeys())
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from Postings import encodeVByte
+import array
+import bisect
+
+# amount of terms in each front coded block of a Lexicon
+BLOCK_SIZE = 16
+
+class Lexicon(object):
+    """
+    A compact dictionary of the terms of an index, that maps each term to a
+    dense integer term ID, its position in the sorted order of the terms.
+
+    The terms are front coded in blocks of BLOCK_SIZE terms: the first term of
+    a block is stored whole, and each of the next ones as the length of the
+    prefix it shares with the term before it and the rest of the term. A term
+    is found with a binary search over the first terms of the blocks, kept
+    in a list once the first term is looked up, followed by a scan of a
+    single block.
+    """
+    def __init__(self, count=0, blockOffsets=None, data=b"", base=0):
+        """
+        Constructor method.
+
+        param count: the amount of terms.
+        param blockOffsets: array.array with the offset of each block in
+        data, plus the end of the last block.
+        param data: a string (or mmap) with the front coded blocks.
+        param base: offset of the first block in data.
+        """
+        self.count = count
+        self.blockOffsets = (array.array("I", [0]) if blockOffsets is None
+                else blockOffsets)
+        self.data = data
+        self.base = base
+        # the first term of each block, read by the first call to find
+        self.firstTerms = None
+
+    @classmethod
+    def fromTerms(cls, terms):
+        """
+        Build a lexicon out of sorted terms.
+
+        param terms: an iterable of distinct strings, in sorted order.
+        return: a Lexicon object.
+        """
+        blockOffsets = array.array("I", [0])
+        data = bytearray()
+        count = 0
+        previous = b""
+        for term in terms:
+            if count % BLOCK_SIZE == 0:
+                if count:
+                    blockOffsets.append(len(data))
+                prefix = 0
+            else:
+                prefix = 0
+                limit = min(len(previous), len(term))
+                while prefix < limit and previous[prefix] == term[prefix]:
+                    prefix += 1
+                encodeVByte(prefix, data)
+            encodeVByte(len(term) - prefix, data)
+            data += term[prefix:]
+            previous = term
+            count += 1
+        if count:
+            blockOffsets.append(len(data))
+        return cls(count, blockOffsets, bytes(data))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for block in xrange(len(self.blockOffsets) - 1):
+            for term in self.decodeBlock(block):
+                yield term
+
+    def __contains__(self, word):
+        return self.find(word) >= 0
+
+    def readBlock(self, block):
+        """
+        return: a string with the bytes of the block.
+        """
+        begin = self.base + self.blockOffsets[block]
+        end = self.base + self.blockOffsets[block + 1]
+        return self.data[begin:end]
+
+    def firstTerm(self, block):
+        """
+        return: the first term of the block, the only one stored whole.
+        """
+        chunk = self.readBlock(block)
+        length, pos = self.readNumber(bytearray(chunk), 0)
+        return chunk[pos:pos + length]
+
+    def iterBlock(self, block):
+        """
+        Decode the terms of a block one at a time.
+
+        yield: the terms of the block, in sorted order.
+        """
+        chunk = self.readBlock(block)
+        # the lengths are read from the bytearray, the terms sliced out of
+        # the string
+        raw = bytearray(chunk)
+        readNumber = self.readNumber
+        length, pos = readNumber(raw, 0)
+        term = chunk[pos:pos + length]
+        pos += length
+        yield term
+        end = len(raw)
+        while pos < end:
+            prefix, pos = readNumber(raw, pos)
+            length, pos = readNumber(raw, pos)
+            term = term[:prefix] + chunk[pos:pos + length]
+            pos += length
+            yield term
+
+    def decodeBlock(self, block):
+        """
+        return: a list with the terms of the block.
+        """
+        return list(self.iterBlock(block))
+
+    @staticmethod
+    def readNumber(raw, pos):
+        """
+        Decode a single variable byte number.
+
+        param raw: a bytearray.
+        param pos: position of the first byte of the number.
+        return: a tuple (number, position after the number).
+        """
+        number = 0
+        shift = 0
+        while True:
+            byte = raw[pos]
+            pos += 1
+            if byte & 0x80:
+                return number | ((byte & 0x7f) << shift), pos
+            number |= byte << shift
+            shift += 7
+
+    def term(self, termId):
+        """
+        return: the term with the term ID. An IndexError is raised if there's
+        no such term.
+        """
+        if not 0 <= termId < self.count:
+            raise IndexError(termId)
+        block, iii = divmod(termId, BLOCK_SIZE)
+        return self.decodeBlock(block)[iii]
+
+    def find(self, word):
+        """
+        Get the term ID of a word.
+
+        param word: string containing the word.
+        return: the term ID, or -1 if the word is not in the lexicon.
+        """
+        if self.firstTerms is None:
+            self.firstTerms = [self.firstTerm(block)
+                    for block in xrange(len(self.blockOffsets) - 1)]
+        # the last block whose first term is not greater than the word
+        block = bisect.bisect_right(self.firstTerms, word) - 1
+        if block < 0:
+            return -1
+        # the terms of the block are sorted, the scan stops at the first one
+        # that is not smaller than the word
+        for iii, term in enumerate(self.iterBlock(block)):
+            if term >= word:
+                if term == word:
+                    return block * BLOCK_SIZE + iii
+                break
+        return -1
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+# default maximum amount of words kept in the memo cache of a normalizer
+DEFAULT_CACHE_SIZE = 1 << 16
+
+class NoNormalizer(object):
+    """
+    The identity normalization, words are only lower cased by the tokenizer,
+    so "patient" and "patients" are different terms.
+
+    Normalizers are applied to the words of the documents when the index is
+    created, and to the words of the queries, so both end up with the same
+    terms. The normalization of each word is memoized in a cache, since the
+    amount of distinct words of a collection is small compared to the amount
+    of words, and normalizing is much slower than a dict lookup. The cache is
+    bounded, it's emptied when it gets full.
+    """
+    name = "none"
+
+    def __init__(self, cacheSize=DEFAULT_CACHE_SIZE):
+        """
+        Constructor method.
+
+        param cacheSize: maximum amount of words kept in the memo cache.
+        """
+        self.cacheSize = cacheSize
+        # word keys and normalized term values
+        self.cache = {}
+
+    def __call__(self, word):
+        """
+        Get the normalized term of a word, from the memo cache if possible.
+
+        param word: a lower case string.
+        return: a string with the term.
+        """
+        try:
+            return self.cache[word]
+        except KeyError:
+            pass
+        if len(self.cache) >= self.cacheSize:
+            self.cache.clear()
+        term = self.normalize(word)
+        self.cache[word] = term
+        return term
+
+    def normalize(self, word):
+        """
+        Normalize a word, without looking at the cache.
+
+        param word: a lower case string.
+        return: a string with the term.
+        """
+        return word
+
+class PorterStemmer(NoNormalizer):
+    """
+    The Porter stemming algorithm (M.F. Porter, An algorithm for suffix
+    stripping, 1980), it removes the inflectional and derivational suffixes
+    of english words in five steps:
+        "patients" -> "patient", "generalizations" -> "gener".
+
+    The stems are not always words, but related words usually share the
+    same stem.
+    """
+    name = "porter"
+
+    # (suffix, replacement) rules of the steps 2 and 3, applied if the
+    # measure of the stem is greater than 0
+    STEP2 = [
+                ("ational", "ate"), ("tional", "tion"), ("enci", "ence"),
+                ("anci", "ance"), ("izer", "ize"), ("abli", "able"),
+                ("alli", "al"), ("entli", "ent"), ("eli", "e"),
+                ("ousli", "ous"), ("ization", "ize"), ("ation", "ate"),
+                ("ator", "ate"), ("alism", "al"), ("iveness", "ive"),
+                ("fulness", "ful"), ("ousness", "ous"), ("aliti", "al"),
+                ("iviti", "ive"), ("biliti", "ble"),
+            ]
+    STEP3 = [
+                ("icate", "ic"), ("ative", ""), ("alize", "al"),
+                ("iciti", "ic"), ("ical", "ic"), ("ful", ""), ("ness", ""),
+            ]
+    # suffixes of the step 4, removed if the measure of the stem is greater
+    # than 1
+    STEP4 = [
+                "al", "ance", "ence", "er", "ic", "able", "ible", "ant",
+                "ement", "ment", "ent", "ion", "ou", "ism", "ate", "iti", "ous",
+                "ive", "ize",
+            ]
+
+    def isConsonant(self, word, iii):
+        """
+        return: True if the iii-th letter of the word is a consonant. A y is a
+        consonant at the start of the word or after a vowel.
+        """
+        letter = word[iii]
+        if letter in "aeiou":
+            return False
+        if letter == "y":
+            return iii == 0 or not self.isConsonant(word, iii - 1)
+        return True
+
+    def measure(self, stem):
+        """
+        return: the measure of the stem, the m in its [C](VC)^m[V] form, where
+        C and V are sequences of consonants and vowels.
+        """
+        m = 0
+        previousVowel = False
+        for iii in xrange(len(stem)):
+            vowel = not self.isConsonant(stem, iii)
+            if previousVowel and not vowel:
+                m += 1
+            previousVowel = vowel
+        return m
+
+    def hasVowel(self, stem):
+        """
+        return: True if the stem contains a vowel.
+        """
+        for iii in xrange(len(stem)):
+            if not self.isConsonant(stem, iii):
+                return True
+        return False
+
+    def endsWithDoubleConsonant(self, stem):
+        """
+        return: True if the stem ends with two equal consonants.
+        """
+        return (len(stem) >= 2 and stem[-1] == stem[-2]
+                and self.isConsonant(stem, len(stem) - 1))
+
+    def endsWithCvc(self, stem):
+        """
+        return: True if the stem ends with consonant, vowel, consonant, and
+        the last consonant is not w, x or y. Like in "hop" or "fil".
+        """
+        return (len(stem) >= 3 and self.isConsonant(stem, len(stem) - 3)
+                and not self.isConsonant(stem, len(stem) - 2)
+                and self.isConsonant(stem, len(stem) - 1)
+                and stem[-1] not in "wxy")
+
+    def replaceSuffix(self, word, rules, minMeasure):
+        """
+        Apply the rule with the longest suffix of the word, if the measure of
+        the stem left is greater than minMeasure.
+
+        param word: the word.
+        param rules: a list of (suffix, replacement) tuples.
+        param minMeasure: the measure of the stem must be greater than it.
+        return: the word with the suffix replaced, or the word itself.
+        """
+        best = None
+        for suffix, replacement in rules:
+            if word.endswith(suffix) and (best is None or len(suffix) > len(best[0])):
+                best = suffix, replacement
+        if best is None:
+            return word
+        suffix, replacement = best
+        stem = word[:-len(suffix)]
+        if self.measure(stem) > minMeasure:
+            return stem + replacement
+        return word
+
+    def normalize(self, word):
+        if len(word) <= 2:
+            return word
+
+        # step 1a, plurals
+        if word.endswith("sses"):
+            word = word[:-2]
+        elif word.endswith("ies"):
+            word = word[:-2]
+        elif word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+
+        # step 1b, past tenses and gerunds
+        if word.endswith("eed"):
+            if self.measure(word[:-3]) > 0:
+                word = word[:-1]
+        else:
+            for suffix in ("ed", "ing"):
+                if word.endswith(suffix) and self.hasVowel(word[:-len(suffix)]):
+                    word = word[:-len(suffix)]
+                    if word.endswith(("at", "bl", "iz")):
+                        word += "e"
+                    elif (self.endsWithDoubleConsonant(word)
+                            and word[-1] not in "lsz"):
+                        word = word[:-1]
+                    elif self.measure(word) == 1 and self.endsWithCvc(word):
+                        word += "e"
+                    break
+
+        # step 1c
+        if word.endswith("y") and self.hasVowel(word[:-1]):
+            word = word[:-1] + "i"
+
+        # steps 2 and 3, derivational suffixes
+        word = self.replaceSuffix(word, self.STEP2, 0)
+        word = self.replaceSuffix(word, self.STEP3, 0)
+
+        # step 4, the ion suffix is only removed after s or t
+        suffixes = [suffix for suffix in self.STEP4 if word.endswith(suffix)]
+        if suffixes:
+            suffix = max(suffixes, key=len)
+            stem = word[:-len(suffix)]
+            if self.measure(stem) > 1 and (suffix != "ion"
+                    or stem.endswith(("s", "t"))):
+                word = stem
+
+        # step 5, final e and double l
+        if word.endswith("e"):
+            stem = word[:-1]
+            m = self.measure(stem)
+            if m > 1 or (m == 1 and not self.endsWithCvc(stem)):
+                word = stem
+        if (word.endswith("ll") and self.measure(word) > 1):
+            word = word[:-1]
+
+        return word
+
+class Lemmatizer(NoNormalizer):
+    """
+    A lemmatizer like normalization, that keeps the terms readable: the
+    lemmas of irregular words are looked up in a table, read from a file with
+    a "word lemma" pair per line, and the regular plurals are reduced to the
+    singular:
+        "patients" -> "patient", "studies" -> "study", "children" -> "child".
+
+    Unlike the stemmer it doesn't join derived words, "generalization" and
+    "general" are different terms.
+    """
+    name = "lemma"
+
+    def __init__(self, cacheSize=DEFAULT_CACHE_SIZE, path="lemmas.txt"):
+        """
+        Constructor method. The table is only read when the first word is
+        normalized.
+
+        param cacheSize: maximum amount of words kept in the memo cache.
+        param path: string containing the path to the file with the table of
+        lemmas.
+        """
+        super(Lemmatizer, self).__init__(cacheSize)
+        self.path = path
+        self.lemmas = None
+
+    def readLemmas(self):
+        """
+        Read the table of lemmas from self.path. If it fails to open the file
+        the exception is not handled.
+
+        return: a dict with word keys and lemma values.
+        """
+        lemmas = {}
+        with open(self.path) as fin:
+            for line in fin:
+                pair = line.split()
+                if len(pair) == 2 and not line.startswith("#"):
+                    word, lemma = pair
+                    lemmas[word.lower()] = lemma.lower()
+        return lemmas
+
+    def normalize(self, word):
+        if self.lemmas is None:
+            self.lemmas = self.readLemmas()
+        try:
+            return self.lemmas[word]
+        except KeyError:
+            pass
+        if len(word) <= 3:
+            return word
+        if word.endswith("ies"):
+            return word[:-3] + "y"
+        if word.endswith("sses"):
+            return word[:-2]
+        # words like "status", "fibrosis" and "serious" are not plurals
+        if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+            return word[:-1]
+        return word
+
+# the normalizers that can be chosen by name
+NORMALIZERS = dict((normalizer.name, normalizer)
+        for normalizer in [NoNormalizer(), PorterStemmer(), Lemmatizer()])
+NORMALIZER_NAMES = sorted(NORMALIZERS.iterkeys())
+DEFAULT_NORMALIZER = NoNormalizer.name
@@ -2,13 +2,69 @@
 #coding: utf-8
 
 from collections import Counter
+from Normalizer import DEFAULT_NORMALIZER
+from Normalizer import NORMALIZERS
+from Positions import FIELD_POSITION_GAP
 from util import Document
 from util import Query
 import re
+import sys
+import time
+
+# what is considered a word by the tokenize method
+WORD_REGEX = r"[a-zA-Z']+"
+# regex for separating the attributes of the documents from content
+DOC_LINE_REGEX = r"^((?P<attr>(PN|RN|AN|AU|TI|SO|MJ|MN|AB|EX|RF|CT))\s+)?(?P<content>(.*\w+.*)*)"
+# regex for separating the attributes of the queries from content
+QUERY_LINE_REGEX = r"^\s*(?P<attr>QN|QU|NR|RD)?\s*(?P<content>(.*\w+.*)*)"
+# the attributes of the documents whose words are indexed
+INDEXED_ATTRS = ["TI", "AB", "EX", "MJ", "MN"]
+# the attributes of the documents that are never used, skipped by default by
+# the parseFile method
+UNUSED_ATTRS = ["RF", "CT", "SO"]
+# the fields of the field index, used by the field:term operators of the
+# queries, and the attributes of the fields whose words are tokenized like
+# the ones of the documents. The authors and the year have their own terms
+TEXT_FIELDS = [("ti", "TI"), ("mj", "MJ"), ("mn", "MN")]
+AUTHOR_FIELD = "au"
+YEAR_FIELD = "year"
+FIELDS = [field for field, attr in TEXT_FIELDS] + [AUTHOR_FIELD, YEAR_FIELD]
+# separates the field from the word in the terms of the field index
+FIELD_SEP = ":"
+
+# the year of a document in its paper number (PN)
+YEAR_SEP = re.compile(r"(?P<year>\d{2})(?P<idInYear>\d{3})")
+# the relevant documents of a query and their grades (RD)
+RELEVANT_SEP = re.compile(r"(?P<docId>\d+)\s*(?P<grades>\d+)")
+
+def fieldKey(field, word):
+    """
+    param field: one of FIELDS.
+    param word: a word of the field, an author name or a year.
+    return: the term of the word of the field in the field index.
+    """
+    return "{}{}{}".format(field, FIELD_SEP, word)
+
+def authorNames(string):
+    """
+    Get the names an author is searched by: the name as it appears in the
+    documents, like Hoiby-N, and the surname alone, both in lower case.
+
+    param string: the name of an author, with or without the final dot.
+    return: a list of strings.
+    """
+    name = string.strip().rstrip(".").lower()
+    if not name:
+        return []
+    surname = name.split("-")[0]
+    return [name] if surname == name or not surname else [name, surname]
 
 class Parser:
-    def __init__(self, stopWordsPath="sw.txt"):
+    def __init__(self, stopWordsPath="sw.txt", normalizer=DEFAULT_NORMALIZER):
         self.stopWords = self.readStopWords(stopWordsPath)
+        # compiled once, tokenize is called for every field of every document
+        self.tokenizer = re.compile(WORD_REGEX)
+        self.setNormalizer(normalizer)
 
         self.cfcCollectionAttrs = [
                     "PN",       # paper number
@@ -31,25 +87,19 @@ class Parser:
                     "RD",       # relevant documents
                         ]
 
-    def initializeLastItem(self, attrList, lastItem) :
-        """
-        Helper method, to reinitialize a dictionary containing the data from a
-        CFC collection document or query. Used by the file parsers
-
-        param doc: a dict.
-        return: the reinitialized dict.
-        """
-        for attr in attrList:
-            lastItem[attr] = ''
-        lastItem["lastAttr"] = ''
-        return lastItem
-
-    def parseCFCFile(self, path, regex, lastItemAttrs, treatLastItemFunction):
+    def parseCFCFile(self, path, regex, lastItemAttrs, treatLastItemFunction,
+            skippedAttrs=()):
         """
         CFC Collection specific file parser. It's a internal generic file
         parser, users should use the parseFile or parseQueryFile methods
         instead of this one.
 
+        The file is streamed one line at a time. The content of each line is
+        appended to a list of lines of the last attribute seen, and the lines
+        of each attribute are only joined, separated by spaces, when the item
+        ends with an empty line. An item at the end of the file that isn't
+        followed by an empty line is ignored.
+
         If it fails to open the file, does not attempt to treat the exception.
 
         param path: string containig the path to the file to parse.
@@ -57,38 +107,64 @@ class Parser:
         content.  The regex must contain a named attribute called "attr" and
         another called "content".
         param lastItemAttrs: a list containing the attributes of the items
-        present in the file for usel of self.initializeLastItem method.
+        present in the file.
         param treatLastItemFunction: a function to be called when we finish
         parsing an item from the path. The function should receive a dict
-        containing the data of the file, and return a result to be yielded by
-        this method.
+        containing the data of the file, with the content of each attribute
+        of the item, and return a result to be yielded by this method.
+        param skippedAttrs: a list of attributes whose content is not kept,
+        they are always empty in the dict given to treatLastItemFunction.
         yield: results of treatLastItemFunction for each item in the file on
         the param path.
         """
-        fin = open(path)
-        # helper funcion to reset the dict used for parsing the fin. Last doc
-        # holds the temporary data of the current document being parsed
-        lastItem = self.initializeLastItem(lastItemAttrs, {})
+        # compiled once per file, it's matched against every line
+        sep = re.compile(regex)
+        # the lines of content of each attribute of the item being parsed,
+        # None for the skipped attributes
+        lines = dict((attr, None if attr in skippedAttrs else [])
+                for attr in lastItemAttrs)
+        lastAttr = ''
 
+        fin = open(path)
         for line in fin:
             line = line.strip()
-            # if there's content in the line we haven't finished parsing a doc
-            if line and fin:
-                # add the content of the line to the correct attr in the
-                # lastItem dict
-                lastItem = self.parseLine(line, lastItem, regex)
-
-            # else we finished reading a doc
-            else:
-                if self.isEmptyItem(lastItem): continue
-
-                result = treatLastItemFunction(lastItem)
-                lastItem = self.initializeLastItem(lastItemAttrs, lastItem)
-
-                yield result
+            # if there's content in the line we haven't finished parsing an
+            # item
+            if line:
+                # separate a possible attribute from content, with the regex.
+                # In the case there's an attribute in the line, we know we
+                # have finished the last attribute we have seen, otherwise the
+                # content belongs to the last attribute seen
+                match = sep.match(line)
+                attr = match.group("attr")
+                if attr:
+                    lastAttr = attr
+                # lines before the first attribute are ignored, like the
+                # strange ^Z lines in the end of some files
+                if not lastAttr: continue
+                attrLines = lines[lastAttr]
+                if attrLines is None: continue
+                content = match.group("content").strip()
+                if content:
+                    attrLines.append(content)
+
+            # else we finished reading an item, unless no attribute was seen,
+            # since some files have double empty lines between documents
+            elif lastAttr:
+                lastItem = {"lastAttr": lastAttr}
+                for attr, attrLines in lines.iteritems():
+                    if attrLines:
+                        lastItem[attr] = ' '.join(attrLines)
+                        del attrLines[:]
+                    else:
+                        lastItem[attr] = ''
+                lastAttr = ''
+
+                yield treatLastItemFunction(lastItem)
         fin.close()
 
-    def parseFile(self, path):
+    def parseFile(self, path, skippedAttrs=UNUSED_ATTRS, positions=False,
+            fields=False):
         """
         Wrapper method for the self.parseCFCFile method, for parsing the proper
         file containng the documents from the CFC collection.
@@ -97,62 +173,38 @@ class Parser:
         in the path.
 
         param path: string containing the path to the file.
+        param skippedAttrs: a list of attributes of the documents that are
+        not kept by the parser. Defaults to the attributes never used by the
+        search engine (RF, CT and SO).
+        param positions: whether to get the positions of the words in the
+        documents instead of their frequencies, see the treatLastDocPositions
+        method.
+        param fields: whether to also get the terms of the fields of the
+        documents, see the fieldTerms method.
         yield: each query found in the file, the returned objects are tuples of
         the kind (util.Document, collections.Counter). The counter is a dict
-        with word keys and frequency values.
+        with word keys and frequency values. With positions the tuples are of
+        the kind (util.Document, dict), the dict has word keys and lists of
+        positions as values. With fields the tuples get a third item, the
+        collections.Counter of the terms of the fields.
         """
         print("Processing file: {}".format(path))
         # regex for separating the attributes of the document from content
-        regex = r"^((?P<attr>(PN|RN|AN|AU|TI|SO|MJ|MN|AB|EX|RF|CT))\s+)?(?P<content>(.*\w+.*)*)"
+        regex = DOC_LINE_REGEX
         # attrs present in the cfc collection documents
         attrs = self.cfcCollectionAttrs
         # helper function to deal with the parsed data. Transforms the data
         # parsed in a tpuple of util.Document object and a Counter with the
         # frequency of the words in the document
-        function = self.treatLastDoc
-        for result in self.parseCFCFile(path, regex, attrs, function):
+        function = self.treatLastDocPositions if positions else self.treatLastDoc
+        if fields:
+            treatLastDoc = function
+            function = lambda lastDoc: (treatLastDoc(lastDoc)
+                    + (self.fieldTerms(lastDoc),))
+        for result in self.parseCFCFile(path, regex, attrs, function,
+                skippedAttrs):
             yield result
 
-    def parseLine(self, line, lastItem, regex):
-        """
-        Parse a single line of a CFC file, adding the content of the line to
-        the last seen attribute.
-
-        The regex should have a named field called "attr" and another
-        "content". If an attr is found in the line, updates a "lastItem" entry
-        in the lastItem dict, with the attr found.
-
-        param line: a string containing the line to be parsed.
-        param lastItem: a dict that will contain the temporary data of the item
-        being parsed.
-        param regex: a string containing a regex to parse the line. Must have a
-        named fields "attr" and "content".
-
-        return: the param lastItem dict, updated with the param line.
-        """
-        assert type(lastItem) == dict
-        sep = re.compile(regex)
-        # separate a possible attribute from content, with a regex
-        match = sep.match(line)
-        assert match
-
-        # groups named in the sep regex
-        attr = match.group("attr")
-        content = match.group("content")
-
-        # in the case there's an attribute in the line, we know we have
-        # finished the last attribute we have seen, otherwise we append to
-        # the last attribute seen
-        if attr:
-            lastItem["lastAttr"] = attr
-        lastAttr = lastItem["lastAttr"]
-        # assert lastAttr # buggy because of strange ^Z lines in the end of some files
-        # add the content of the line to the lastAttr seen
-        if lastAttr:
-            lastItem[lastAttr] = (' '.join([lastItem[lastAttr], content.strip()])).strip()
-
-        return lastItem
-
     def parseQueryFile(self, path):
         """
         Wrapper method for the self.parseCFCFile method, for parsing the query
@@ -166,7 +218,7 @@ class Parser:
         util.Query objects.
         """
         # regex for separating the attributes from the content
-        regex = r"^\s*(?P<attr>QN|QU|NR|RD)?\s*(?P<content>(.*\w+.*)*)"
+        regex = QUERY_LINE_REGEX
         # list of attributes present in the cfc query file
         attrs = self.cfcQueryAttrs
         # helper function that deals with the data parsed and transforms it on
@@ -175,10 +227,23 @@ class Parser:
         for result in self.parseCFCFile(path, regex, attrs, function):
             yield result
 
-    def tokenize(self, string, regex=r"[a-zA-Z']+"):
+    def setNormalizer(self, name):
+        """
+        Choose the normalization applied to the words by the tokenize and
+        countWords methods, one of Normalizer.NORMALIZERS.
+
+        param name: string containing the name of the normalizer.
+        return: None
+        """
+        if name not in NORMALIZERS:
+            raise ValueError("Unknown normalizer: {}".format(name))
+        self.normalizer = NORMALIZERS[name]
+
+    def tokenize(self, string, regex=WORD_REGEX):
         """
         Get a list with the words in the string, while also removing the stop
-        words defined in the creation of the class.
+        words defined in the creation of the class. The words that are not
+        stop words are normalized with self.normalizer.
 
         param string: string with the content to be tokenized.
         param regex: string containing a regex of what is considered a word.
@@ -186,18 +251,81 @@ class Parser:
         return: a list of strings containing the non stop words words, from the
         string param.
         """
-        # regex for separating the words in the content
-        tokenizer = re.compile(regex)
-        # get the words that match the regex and set them to lower case
-        words = [word.lower() for word in tokenizer.findall(string)]
+        tokenizer = self.tokenizer if regex == WORD_REGEX else re.compile(regex)
+        stopWords = self.stopWords
+        # the string is set to lower case at once, the words matched by the
+        # regex are the same, and the stop words are filtered in the same pass
+        words = [word for word in tokenizer.findall(string.lower())
+                if word not in stopWords]
+        if self.normalizer.name == DEFAULT_NORMALIZER:
+            return words
+        normalize = self.normalizer
+        return [normalize(word) for word in words]
+
+    def countWords(self, string, counter):
+        """
+        Tokenize the string like the tokenize method, adding the frequencies
+        of the words straight to a counter, without building a list of words.
 
-        # removal of the stop words defined in the __init__ method from the
-        # list of words
-        for sw in self.stopWords.intersection(words):
-            while sw in words:
-                words.remove(sw)
+        param string: string with the content to be tokenized.
+        param counter: a collections.Counter where the frequencies of the
+        words are added.
+        return: None
+        """
+        stopWords = self.stopWords
+        get = counter.get
+        if self.normalizer.name == DEFAULT_NORMALIZER:
+            for word in self.tokenizer.findall(string.lower()):
+                if word not in stopWords:
+                    counter[word] = get(word, 0) + 1
+            return
+        normalize = self.normalizer
+        for word in self.tokenizer.findall(string.lower()):
+            if word not in stopWords:
+                word = normalize(word)
+                counter[word] = get(word, 0) + 1
+
+    def addWordPositions(self, string, positions, start=0):
+        """
+        Tokenize the string like the tokenize method, adding the positions of
+        the words to a dict. The stop words are left out, but they take up
+        their positions, so the distances between the words are the ones in
+        the string.
 
-        return words
+        param string: string with the content to be tokenized.
+        param positions: a dict where the position of each word is appended
+        to the list of its positions.
+        param start: the position of the first word of the string.
+        return: the position after the last word of the string.
+        """
+        stopWords = self.stopWords
+        normalize = self.normalizer
+        plain = normalize.name == DEFAULT_NORMALIZER
+        position = start
+        for word in self.tokenizer.findall(string.lower()):
+            if word not in stopWords:
+                if not plain:
+                    word = normalize(word)
+                try:
+                    positions[word].append(position)
+                except KeyError:
+                    positions[word] = [position]
+            position += 1
+        return position
+
+    def tokenizePositions(self, string):
+        """
+        Tokenize the string like the tokenize method, keeping the position of
+        each word, see the addWordPositions method.
+
+        param string: string with the content to be tokenized.
+        return: a list of tuples (position, word), in the order of the words
+        in the string.
+        """
+        positions = {}
+        self.addWordPositions(string, positions)
+        return sorted((position, word)
+                for word, lst in positions.iteritems() for position in lst)
 
     def readStopWords(self, path):
         """
@@ -234,47 +362,76 @@ class Parser:
         """
         total = Counter()
 
-        # the list of relevant attributes to tokenize. Tokenize also
-        # removes stop words defined in the init method
-        relevant = ["TI", "AB", "EX", "MJ", "MN"]
-        for attr in relevant:
+        # the relevant attributes to tokenize. The words of all of them are
+        # counted in the same counter, without the stop words defined in the
+        # init method
+        for attr in INDEXED_ATTRS:
             content = lastDoc[attr]
             assert type(content) == str
-            words = self.tokenize(content)
-            counter = Counter(words)
-            total +=  counter
+            self.countWords(content, total)
+
+        result = self.makeDocument(lastDoc), total
+        return result
 
+    def makeDocument(self, lastDoc):
+        """
+        Helper method that builds the util.Document object of the data in the
+        lastDoc dict, with a norm of 0.
+
+        param lastDoc: a dict containing the data parsed.
+        return: an util.Document object.
+        """
         # form the Document object return
         docId = int(lastDoc["RN"])
 
         # get the year of publishment
-        regex = r"(?P<year>\d{2})(?P<idInYear>\d{3})"
-        sep = re.compile(regex)
-        match = sep.match(lastDoc["PN"])
+        match = YEAR_SEP.match(lastDoc["PN"])
         year = int(match.group("year"))
 
         title = lastDoc["TI"]
         authors = lastDoc["AU"]
         tempNorm = 0 # irrelevant norm to be udated in the future
-        doc = Document(docId, year, title, authors, tempNorm)
+        return Document(docId, year, title, authors, tempNorm)
 
-        result = doc, total
-        return result
+    def treatLastDocPositions(self, lastDoc):
+        """
+        Version of the treatLastDoc method that keeps the positions of the
+        words in the document, for a positional index. The fields are
+        numbered one after the other, FIELD_POSITION_GAP positions apart.
 
-    def isEmptyItem(self, lastItem):
+        param lastDoc: a dict containing the data parsed.
+        return: a tuple (util.Document, dict). The dict has word keys and
+        sorted lists of positions as values.
         """
-        Helper method to know if the last item parsed is empty or not. Needed
-        because some files have double empty lines between documents.
+        positions = {}
+        position = 0
+        for attr in INDEXED_ATTRS:
+            content = lastDoc[attr]
+            assert type(content) == str
+            position = self.addWordPositions(content, positions,
+                    position) + FIELD_POSITION_GAP
+        return self.makeDocument(lastDoc), positions
 
-        param lastItem: a dict with the data of the last item parsed.
+    def fieldTerms(self, lastDoc):
+        """
+        Helper method that gets the terms of the field index of the document
+        in the lastDoc dict: the words of its title and subjects, tokenized
+        like the ones of the document, the names of its authors, see the
+        authorNames function, and its year. See the fieldKey function.
 
-        return: True if the lastItem dict has a single key with a value that
-        evaluates to True, False otherwise.
+        param lastDoc: a dict containing the data parsed.
+        return: a collections.Counter with the frequencies of the terms.
         """
-        for key in lastItem.iterkeys():
-            if lastItem[key]:
-                return False
-        return True
+        terms = Counter()
+        for field, attr in TEXT_FIELDS:
+            for word in self.tokenize(lastDoc[attr]):
+                terms[fieldKey(field, word)] += 1
+        for author in lastDoc["AU"].split():
+            for name in authorNames(author):
+                terms[fieldKey(AUTHOR_FIELD, name)] += 1
+        year = int(YEAR_SEP.match(lastDoc["PN"]).group("year"))
+        terms[fieldKey(YEAR_FIELD, year)] += 1
+        return terms
 
     def treatLastQuery(self, lastQuery):
         """
@@ -287,10 +444,8 @@ class Parser:
         queryId = int(lastQuery["QN"])
         queryString = lastQuery["QU"]
 
-        sep = re.compile(r"(?P<docId>\d+)\s*(?P<grades>\d+)")
-
         relevants = []
-        for pair in sep.findall(lastQuery["RD"]):
+        for pair in RELEVANT_SEP.findall(lastQuery["RD"]):
             docId, grades = pair
             docId = int(docId)
             relevants.append(docId)
@@ -298,8 +453,73 @@ class Parser:
         return Query(queryId, queryString, relevants)
 
 if __name__ == '__main__':
+    # micro benchmark of the tokenizer, with the indexed fields of the
+    # documents in the CFC files given as arguments. Ex: python Parser.py
+    # cfc/cf74 cfc/cf75
+    def baselineTokenize(parser, string, regex=WORD_REGEX):
+        """
+        The tokenize method as it was before the single pass tokenization, the
+        baseline of the micro benchmark below: the regex is compiled on every
+        call, each word is set to lower case, and the stop words are removed
+        one at a time with list.remove.
+
+        param parser: a Parser object, with the stop words.
+        param string: string with the content to be tokenized.
+        param regex: string containing a regex of what is considered a word.
+        return: a list of strings containing the non stop words words.
+        """
+        tokenizer = re.compile(regex)
+        words = [word.lower() for word in tokenizer.findall(string)]
+        for sw in parser.stopWords.intersection(words):
+            while sw in words:
+                words.remove(sw)
+        return words
+
     p = Parser()
-    for r in p.parseQueryFile("cfquery"):
-        print(r,  '\n')
-    #s = ' Salivary amylase levels were determined in normal subjects from birth until adult life and in children with conditions sometimes associated with low pancreatic amylase such as malnutrition, coeliac disease and cystic fibrosis.  Mixed saliva was collected under carefully standardised conditions and amylase was measured by the method of Dahlqvist.  There was a wide scatter of values in the 84 normal subjects, but concentrations rose from very low levels at birth to reach adult levels by the age of 6 months to 1 year. Salivary amylase activity rose normally over ten weeks in one premature infant fed milk by gastrostomy.  Thirteen children with coeliac disease and 9 children with cystic fibrosis mostly had normal salivary amylase concentrations.  Six out of 12 malnourished children with jejunal villous atrophy of uncertain aetiology had low levels which rose to normal as recovery began.'
-    #print e.tokenize(s)
+    fields = []
+    for path in sys.argv[1:]:
+        for item in p.parseCFCFile(path, DOC_LINE_REGEX, p.cfcCollectionAttrs,
+                lambda lastDoc: [lastDoc[attr] for attr in INDEXED_ATTRS]):
+            fields.extend(item)
+
+    repeat = 5
+    tokens = 0
+    start = time.time()
+    for iii in xrange(repeat):
+        tokens = sum(len(p.tokenizer.findall(field)) for field in fields)
+    findallTime = time.time() - start
+
+    # the old treatLastDoc added one Counter per field to the total of the
+    # document, the fields of each document are consecutive
+    nAttrs = len(INDEXED_ATTRS)
+    start = time.time()
+    for iii in xrange(repeat):
+        for begin in xrange(0, len(fields), nAttrs):
+            total = Counter()
+            for field in fields[begin:begin + nAttrs]:
+                total += Counter(baselineTokenize(p, field))
+    baselineTime = time.time() - start
+
+    start = time.time()
+    for iii in xrange(repeat):
+        for field in fields:
+            p.tokenize(field)
+    tokenizeTime = time.time() - start
+
+    start = time.time()
+    for iii in xrange(repeat):
+        for field in fields:
+            p.countWords(field, Counter())
+    countTime = time.time() - start
+
+    print("{} fields, {} tokens".format(len(fields), tokens))
+    if not tokens:
+        print("No tokens to measure, please give the paths of CFC files")
+        sys.exit(-1)
+    print("regex only: {:.0f} tokens/s".format(repeat * tokens / findallTime))
+    print("old tokenize + Counter (before): {:.0f} tokens/s"
+            .format(repeat * tokens / baselineTime))
+    print("countWords (after): {:.0f} tokens/s"
+            .format(repeat * tokens / countTime))
+    print("tokenize (after, list only): {:.0f} tokens/s"
+            .format(repeat * tokens / tokenizeTime))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from Postings import encodeVByte
+
+# the positions of the words of each indexed field of a document start this
+# far from the end of the previous field, so phrases and NEAR operators with
+# distances up to FIELD_POSITION_GAP don't match words of different fields,
+# see QueryLanguage.nearDistance
+FIELD_POSITION_GAP = 100
+
+def encodePositions(positions, out):
+    """
+    Append the positions of a word in a document to out: the amount of
+    positions, then the gaps between consecutive positions, the first one
+    counted from 0, all encoded with variable bytes, see
+    Postings.encodeVByte.
+
+    param positions: a sorted list of non negative integers.
+    param out: a bytearray where the bytes are appended.
+    return: None
+    """
+    encodeVByte(len(positions), out)
+    last = 0
+    for position in positions:
+        encodeVByte(position - last, out)
+        last = position
+
+def positionsAt(data, indexes):
+    """
+    Decode the positions of some of the postings of a term. The positions of
+    the other postings are skipped without being decoded.
+
+    param data: a bytearray with the positions of the postings of the term,
+    encoded with encodePositions.
+    param indexes: a sorted list with the indexes of the postings in the
+    posting list of the term.
+    return: a list with the positions of each posting in indexes, lists of
+    integers.
+    """
+    result = []
+    offset = 0
+    posting = 0
+    for index in indexes:
+        # skip the postings before index, counting the last byte of each of
+        # their numbers
+        while posting < index:
+            count, offset = decodeNumber(data, offset)
+            while count:
+                if data[offset] & 0x80:
+                    count -= 1
+                offset += 1
+            posting += 1
+        count, offset = decodeNumber(data, offset)
+        positions = []
+        last = 0
+        for iii in xrange(count):
+            gap, offset = decodeNumber(data, offset)
+            last += gap
+            positions.append(last)
+        result.append(positions)
+        posting += 1
+    return result
+
+def decodeNumber(data, offset):
+    """
+    Decode one number encoded with variable bytes.
+
+    param data: a bytearray.
+    param offset: the position of the first byte of the number.
+    return: a tuple (number, offset of the next number).
+    """
+    number = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        if byte & 0x80:
+            return number | ((byte & 0x7f) << shift), offset
+        number |= byte << shift
+        shift += 7
+
+def splitPositions(data):
+    """
+    Split the positions of a term into the encoded positions of each of its
+    postings, without decoding them.
+
+    param data: a bytearray with the positions encoded with encodePositions.
+    yield: a bytearray with the encoded positions of each posting.
+    """
+    offset = 0
+    while offset < len(data):
+        start = offset
+        count, offset = decodeNumber(data, offset)
+        while count:
+            if data[offset] & 0x80:
+                count -= 1
+            offset += 1
+        yield data[start:offset]
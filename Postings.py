@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+import array
+import bisect
+import sys
+
+def encodeVByte(number, out):
+    """
+    Append the variable byte encoding of a non negative integer to out.
+
+    The number is split in groups of 7 bits, starting with the least
+    significant ones, one group per byte. The high bit is set only on the last
+    byte of the number.
+
+    param number: a non negative integer.
+    param out: a bytearray where the bytes are appended.
+    return: None
+    """
+    while number >= 0x80:
+        out.append(number & 0x7f)
+        number >>= 7
+    out.append(number | 0x80)
+
+def decodeVByte(data):
+    """
+    Decode a sequence of integers encoded with encodeVByte.
+
+    param data: a bytearray with the encoded integers.
+    yield: each of the integers in data.
+    """
+    number = 0
+    shift = 0
+    for byte in data:
+        if byte & 0x80:
+            yield number | ((byte & 0x7f) << shift)
+            number = 0
+            shift = 0
+        else:
+            number |= byte << shift
+            shift += 7
+
+class PostingList(object):
+    """
+    A compressed posting list. The docIDs are kept sorted, stored as the gaps
+    between consecutive docIDs encoded with variable bytes, and the weights
+    are stored in a float32 array. Iterating over the list decodes it lazily,
+    yielding (docID, weight) tuples just like a list of tuples would.
+
+    The list can optionally have skip pointers, added by the addSkips
+    method, that let a PostingCursor jump over whole blocks of postings
+    without decoding them. Changing the list drops them.
+    """
+    __slots__ = ("data", "weights", "lastDocId", "skips")
+
+    def __init__(self, data=None, weights=None, lastDocId=None, skips=None):
+        """
+        Constructor method.
+
+        param data: bytearray with the variable byte encoded docID gaps.
+        param weights: array.array of float32 with the weights.
+        param lastDocId: the greatest docID in the list. If it's None it's
+        calculated from data.
+        param skips: the skip pointers of the list, see the addSkips method,
+        or None if the list has no skip pointers.
+        """
+        self.data = bytearray() if data is None else data
+        self.weights = array.array("f") if weights is None else weights
+        if lastDocId is None:
+            lastDocId = 0
+            for gap in decodeVByte(self.data):
+                lastDocId += gap
+        self.lastDocId = lastDocId
+        self.skips = skips
+
+    @classmethod
+    def fromPairs(cls, pairs):
+        """
+        Build a posting list out of (docID, weight) pairs, in any order.
+
+        param pairs: an iterable of (docID, weight) tuples.
+        return: a PostingList object.
+        """
+        lst = cls()
+        for docId, weight in sorted(pairs):
+            lst.append(docId, weight)
+        return lst
+
+    def __len__(self):
+        return len(self.weights)
+
+    def __iter__(self):
+        weights = self.weights
+        docId = 0
+        gap = 0
+        shift = 0
+        iii = 0
+        for byte in self.data:
+            if byte & 0x80:
+                docId += gap | ((byte & 0x7f) << shift)
+                yield docId, weights[iii]
+                iii += 1
+                gap = 0
+                shift = 0
+            else:
+                gap |= byte << shift
+                shift += 7
+
+    def __repr__(self):
+        return "PostingList({})".format(list(self))
+
+    def append(self, docId, weight):
+        """
+        Add a posting to the list.
+
+        Appending docIDs in increasing order only encodes the new gap. A docID
+        smaller than the last one forces the list to be decoded and encoded
+        again, so callers should feed the docIDs in order.
+
+        param docId: the docID of the posting.
+        param weight: the weight (or frequency) of the posting.
+        return: None
+        """
+        self.skips = None
+        if docId >= self.lastDocId:
+            encodeVByte(docId - self.lastDocId, self.data)
+            self.weights.append(weight)
+            self.lastDocId = docId
+        else:
+            pairs = list(self)
+            bisect.insort(pairs, (docId, weight))
+            self.data = bytearray()
+            self.weights = array.array("f")
+            self.lastDocId = 0
+            for docId, weight in pairs:
+                self.append(docId, weight)
+
+    def extend(self, other):
+        """
+        Add the postings of another list to the end of this one.
+
+        When the first docID of the other list is not smaller than the last
+        docID of this one, the encoded gaps of the other list are copied as
+        they are, only its first gap is encoded again.
+
+        param other: a PostingList object.
+        return: None
+        """
+        if not len(other):
+            return
+        self.skips = None
+        if not len(self):
+            self.data = bytearray(other.data)
+            self.weights = array.array("f", other.weights)
+            self.lastDocId = other.lastDocId
+            return
+        # the first gap of the other list is its first docID
+        end = 0
+        while not other.data[end] & 0x80:
+            end += 1
+        first = next(decodeVByte(other.data[:end + 1]))
+        if first >= self.lastDocId:
+            encodeVByte(first - self.lastDocId, self.data)
+            self.data += other.data[end + 1:]
+            self.weights.extend(other.weights)
+            self.lastDocId = other.lastDocId
+        else:
+            for docId, weight in other:
+                self.append(docId, weight)
+
+    def addSkips(self, interval):
+        """
+        Add skip pointers to the list, one every interval postings. The k-th
+        skip pointer points to the posting at position (k + 1) * interval,
+        and holds the docID of the posting before it, from which the gaps of
+        the following postings are counted, and the position of its first
+        byte in self.data.
+
+        The skip pointers are kept in self.skips as a tuple (interval,
+        docIDs, offsets), where docIDs and offsets are array.array objects.
+
+        param interval: amount of postings between skip pointers. If it's 0
+        the skip pointers are removed.
+        return: None
+        """
+        if not interval:
+            self.skips = None
+            return
+        skipDocIds = array.array("i")
+        skipOffsets = array.array("I")
+        docId = 0
+        gap = 0
+        shift = 0
+        count = 0
+        for offset, byte in enumerate(self.data):
+            if byte & 0x80:
+                docId += gap | ((byte & 0x7f) << shift)
+                gap = 0
+                shift = 0
+                count += 1
+                if count % interval == 0 and count < len(self.weights):
+                    skipDocIds.append(docId)
+                    skipOffsets.append(offset + 1)
+            else:
+                gap |= byte << shift
+                shift += 7
+        self.skips = (interval, skipDocIds, skipOffsets)
+
+    def iterFrom(self, skip):
+        """
+        Decode the list starting at a skip pointer. The list is decoded one
+        block at a time, so only the blocks that are actually iterated are
+        copied out of self.data.
+
+        param skip: the number of the skip pointer plus one, 0 decodes the
+        list from the start.
+        yield: the (docID, weight) tuples from the posting the skip pointer
+        points to.
+        """
+        interval, skipDocIds, skipOffsets = self.skips
+        data = self.data
+        weights = self.weights
+        if skip:
+            docId = skipDocIds[skip - 1]
+            begin = skipOffsets[skip - 1]
+        else:
+            docId = 0
+            begin = 0
+        iii = skip * interval
+        for block in xrange(skip, len(skipOffsets) + 1):
+            end = skipOffsets[block] if block < len(skipOffsets) else len(data)
+            gap = 0
+            shift = 0
+            for byte in data[begin:end]:
+                if byte & 0x80:
+                    docId += gap | ((byte & 0x7f) << shift)
+                    yield docId, weights[iii]
+                    iii += 1
+                    gap = 0
+                    shift = 0
+                else:
+                    gap |= byte << shift
+                    shift += 7
+            begin = end
+
+    def docIds(self):
+        """
+        yield: the docIDs of the list, in increasing order.
+        """
+        docId = 0
+        for gap in decodeVByte(self.data):
+            docId += gap
+            yield docId
+
+def gallop(values, target, lo=0):
+    """
+    Find the first position of a sorted sequence, from lo on, with a value
+    greater than or equal to target. The steps from lo grow exponentially
+    until they pass target, and then the last step is binary searched, so
+    finding a target d positions ahead costs O(log d), which makes
+    intersecting a short list with a long one cheap.
+
+    param values: a sorted sequence, like a list or an array.array.
+    param target: the value searched.
+    param lo: the position where the search starts.
+    return: the position, len(values) if every value from lo on is smaller
+    than target.
+    """
+    step = 1
+    hi = lo
+    while hi < len(values) and values[hi] < target:
+        lo = hi + 1
+        hi += step
+        step *= 2
+    return bisect.bisect_left(values, target, lo, min(hi, len(values)))
+
+def intersect(values, others):
+    """
+    Intersect two sorted sequences of distinct values, galloping over the
+    longer one for each value of the shorter one, see gallop.
+
+    param values: a sorted sequence, like a list or an array.array.
+    param others: another sorted sequence.
+    return: a sorted list with the values in both sequences.
+    """
+    if len(values) > len(others):
+        values, others = others, values
+    result = []
+    iii = 0
+    end = len(others)
+    for value in values:
+        iii = gallop(others, value, iii)
+        if iii == end:
+            break
+        if others[iii] == value:
+            result.append(value)
+    return result
+
+# docID of a cursor past the end of its posting list
+END_OF_LIST = sys.maxsize
+
+class PostingCursor(object):
+    """
+    Walks a posting list one posting at a time, for the document at a time
+    scoring methods. docId and weight hold the current posting, docId is
+    END_OF_LIST once the list is exhausted. The skip pointers of the list,
+    if any, are used to advance the cursor.
+    """
+    __slots__ = ("lst", "postings", "docId", "weight")
+
+    def __init__(self, lst):
+        """
+        Constructor method. The cursor starts at the first posting.
+
+        param lst: a PostingList object.
+        """
+        self.lst = lst
+        self.postings = iter(lst) if lst.skips is None else lst.iterFrom(0)
+        self.next()
+
+    def next(self):
+        """
+        Move to the next posting.
+
+        return: None
+        """
+        try:
+            self.docId, self.weight = next(self.postings)
+        except StopIteration:
+            self.docId = END_OF_LIST
+            self.weight = 0
+
+    def advance(self, docId):
+        """
+        Move to the first posting with docID greater than or equal to docId.
+
+        param docId: the target docID.
+        return: None
+        """
+        if self.docId >= docId:
+            return
+        skips = self.lst.skips
+        if skips is not None:
+            interval, skipDocIds, skipOffsets = skips
+            # the last skip pointer that comes before docId, jump to it if
+            # it's ahead of the cursor
+            skip = bisect.bisect_left(skipDocIds, docId)
+            if skip and self.docId <= skipDocIds[skip - 1]:
+                self.postings = self.lst.iterFrom(skip)
+        # the decoder is iterated directly, calling next for each posting
+        # skipped would be much slower
+        for self.docId, self.weight in self.postings:
+            if self.docId >= docId:
+                return
+        self.docId = END_OF_LIST
+        self.weight = 0
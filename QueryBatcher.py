@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from __future__ import division
+from time import time as getTime
+import bisect
+import threading
+
+# how long the first query of a batch waits for others, in seconds
+DEFAULT_WINDOW = 0
+DEFAULT_MAX_SIZE = 64
+
+# upper bounds of the buckets of the histograms, the last bucket takes the
+# greater values
+LATENCY_BUCKETS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000]
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+
+class Histogram(object):
+    """
+    A thread safe histogram with fixed buckets. The i-th bucket counts the
+    values greater than the (i - 1)-th bound and up to the i-th one, the last
+    bucket counts the values greater than every bound.
+    """
+    def __init__(self, bounds):
+        """
+        Constructor method.
+
+        param bounds: sorted list with the upper bound of each bucket.
+        """
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.maximum = 0
+        self.lock = threading.Lock()
+
+    def add(self, value):
+        """
+        Count a value in its bucket.
+
+        param value: a number.
+        return: None
+        """
+        with self.lock:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.total += value
+            self.maximum = max(self.maximum, value)
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def toDict(self):
+        """
+        return: a dict with the "bounds" and "counts" of the buckets, and
+        the "count", "mean" and "max" of the values, ready to be encoded as
+        JSON.
+        """
+        with self.lock:
+            count = sum(self.counts)
+            return {"bounds": self.bounds, "counts": list(self.counts),
+                    "count": count, "mean": self.total / count if count else 0,
+                    "max": self.maximum}
+
+    def format(self, unit=''):
+        """
+        return: a string with one line per non empty bucket, with its bounds
+        and count.
+        """
+        lines = []
+        stats = self.toDict()
+        lower = 0
+        for bound, count in zip(self.bounds + [None], stats["counts"]):
+            if count:
+                upper = "inf" if bound is None else "{}{}".format(bound, unit)
+                lines.append("\t({}{}, {}]: {}".format(lower, unit, upper, count))
+            lower = bound
+        lines.append("\tcount: {}, mean: {:.3f}{}, max: {:.3f}{}".format(
+            stats["count"], stats["mean"], unit, stats["max"], unit))
+        return "\n".join(lines)
+
+class PendingQuery(object):
+    """
+    A query waiting in a QueryBatcher, with the event set when its results
+    are ready.
+    """
+    def __init__(self, query, K):
+        self.query = query
+        self.K = K
+        self.arrival = getTime()
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+class QueryBatcher(object):
+    """
+    Collects the queries submitted concurrently by many threads and scores
+    them together in batches, see SearchEngine.processQueries, so each
+    posting list is read once per batch instead of once per query.
+
+    A batch is closed when the first of its queries waited for the window,
+    or when it reaches the maximum size. The batches are scored by a fixed
+    amount of threads, each one waits for a batch, scores it and hands the
+    results back to the threads that submitted the queries. The queries that
+    arrive while the batches are being scored wait for the next ones, so
+    even a window of 0 batches the queries of a busy server.
+
+    The latency of each call to score, and the size of each batch, are
+    counted in histograms.
+    """
+    def __init__(self, scoreBatch, window=DEFAULT_WINDOW,
+            maxSize=DEFAULT_MAX_SIZE, threads=1):
+        """
+        Constructor method. Starts the scoring threads.
+
+        param scoreBatch: function that receives a list of tuples (util.Query,
+        K) and returns a list with the results of each query, see
+        QueryServer.scoreBatch. It's called by one thread at a time for each
+        of the threads.
+        param window: how long the first query of a batch waits for others,
+        in seconds.
+        param maxSize: the maximum amount of queries in a batch.
+        param threads: the amount of batches scored at the same time.
+        """
+        self.scoreBatch = scoreBatch
+        self.window = window
+        self.maxSize = max(1, maxSize)
+        self.pending = []
+        self.condition = threading.Condition()
+        # latencies in milliseconds, and sizes of the batches
+        self.latencies = Histogram(LATENCY_BUCKETS)
+        self.batchSizes = Histogram(BATCH_SIZE_BUCKETS)
+        for iii in xrange(threads):
+            thread = threading.Thread(target=self.run)
+            thread.daemon = True
+            thread.start()
+
+    def score(self, queries, K):
+        """
+        Score queries in the next batches, and wait for their results.
+
+        Raises the exception raised by the scoring of the batch, if any.
+
+        param queries: a list of util.Query objects.
+        param K: the size of the rankings.
+        return: a list with the results of each query, lists of tuples
+        (similarity, util.Document) ordered in decrescent similarity.
+        """
+        pending = [PendingQuery(query, K) for query in queries]
+        with self.condition:
+            self.pending.extend(pending)
+            self.condition.notify_all()
+        for item in pending:
+            item.done.wait()
+            if item.error is not None:
+                raise item.error
+        if pending:
+            self.latencies.add(1000 * (getTime() - pending[0].arrival))
+        return [item.results for item in pending]
+
+    def nextBatch(self):
+        """
+        Wait for a batch to be closed and take it out of the pending queries.
+
+        return: a list of PendingQuery objects.
+        """
+        with self.condition:
+            while True:
+                while not self.pending:
+                    self.condition.wait()
+                remaining = self.pending[0].arrival + self.window - getTime()
+                if len(self.pending) >= self.maxSize or remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch = self.pending[:self.maxSize]
+            del self.pending[:self.maxSize]
+            return batch
+
+    def run(self):
+        """
+        Loop of the scoring threads.
+        """
+        while True:
+            batch = self.nextBatch()
+            self.batchSizes.add(len(batch))
+            try:
+                results = self.scoreBatch([(item.query, item.K)
+                    for item in batch])
+                for item, result in zip(batch, results):
+                    item.results = result
+            except Exception as e:
+                for item in batch:
+                    item.error = e
+            for item in batch:
+                item.done.set()
+
+    def stats(self):
+        """
+        return: a dict with the "latency" (in milliseconds) and "batchSize"
+        histograms, see Histogram.toDict.
+        """
+        return {"latency": self.latencies.toDict(),
+                "batchSize": self.batchSizes.toDict()}
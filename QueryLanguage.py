@@ -0,0 +1,425 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from collections import namedtuple
+from Parser import AUTHOR_FIELD
+from Parser import FIELDS
+from Parser import TEXT_FIELDS
+from Parser import YEAR_FIELD
+from Parser import authorNames
+from Positions import FIELD_POSITION_GAP
+import re
+
+# the operators of the query syntax: phrases between double quotes, and the
+# NEAR/k operator between two words or phrases, in upper case
+PHRASE_QUOTE = '"'
+NEAR_OPERATOR = "NEAR/"
+# splits a query string into phrases, NEAR operators and chunks of text
+QUERY_TOKEN_REGEX = re.compile(r'(?P<phrase>"[^"]*"?)|(?P<near>\bNEAR/(?P<distance>\d+)\b)|(?P<text>[^"\s]+)')
+
+# the Boolean operators, in upper case, so the lower case and, or and not of
+# the plain queries are still stop words, and the parentheses that group them
+AND_OPERATOR = "AND"
+OR_OPERATOR = "OR"
+NOT_OPERATOR = "NOT"
+OPEN_PAREN = "("
+CLOSE_PAREN = ")"
+# the fields of the field:term operators, in lower or upper case
+FIELD_NAMES = "|".join(FIELDS + [field.upper() for field in FIELDS])
+# finds the Boolean and field:term operators of a query
+BOOLEAN_REGEX = re.compile(r"\b(?:AND|OR|NOT)\b|\b(?:" + FIELD_NAMES + r"):[^\s()]")
+# splits a Boolean query string into phrases, NEAR operators, Boolean
+# operators, parentheses, field:term operators and chunks of text
+BOOLEAN_TOKEN_REGEX = re.compile(r'(?P<phrase>"[^"]*"?)|(?P<near>\bNEAR/(?P<distance>\d+)\b)|(?P<operator>\b(?:AND|OR|NOT)\b)|(?P<paren>[()])|\b(?P<field>' + FIELD_NAMES + r'):(?P<value>[^"\s()]+)|(?P<text>[^"\s()]+)')
+# the fields whose words are also in the inverted index
+TEXT_FIELD_NAMES = set(field for field, attr in TEXT_FIELDS)
+
+# the words of a phrase, and their offsets from the first word, counting the
+# stop words left out. A single word is a phrase with the offset 0
+Phrase = namedtuple("Phrase", "words offsets")
+# two phrases, or NEAR operators, at most distance positions apart, in any
+# order
+Near = namedtuple("Near", "left right distance")
+# a word of the inverted index, if field is None, or a term of a field of the
+# field index, see Parser.fieldTerms
+Term = namedtuple("Term", "field word")
+# words of the query joined to the others by nothing, that only rank the
+# documents, like the words of a plain query
+Text = namedtuple("Text", "words")
+# the documents that match all, any or none of the operands
+And = namedtuple("And", "operands")
+Or = namedtuple("Or", "operands")
+Not = namedtuple("Not", "operand")
+
+def hasOperators(queryString, positional=True, boolean=True):
+    """
+    Check quickly if a query string may use the operators of the query
+    syntax, so the plain queries are tokenized as they always were.
+
+    param queryString: string containing the query.
+    param positional: whether the phrases and NEAR operators are parsed,
+    otherwise they are plain words.
+    param boolean: whether the Boolean and field:term operators are parsed,
+    otherwise they are plain words.
+    return: True if the query has quotes or NEAR operators if positional is
+    True, or Boolean or field:term operators if boolean is True, False
+    otherwise.
+    """
+    return ((positional and (PHRASE_QUOTE in queryString
+                or NEAR_OPERATOR in queryString))
+            or (boolean and BOOLEAN_REGEX.search(queryString) is not None))
+
+def nearDistance(digits):
+    """
+    param digits: the digits of the distance of a NEAR operator.
+    return: the distance, clamped to FIELD_POSITION_GAP, the greatest one
+    that doesn't reach the words of other fields of the documents.
+    """
+    return min(int(digits), FIELD_POSITION_GAP)
+
+def makePhrase(pairs):
+    """
+    param pairs: a list of tuples (position, word), see
+    Parser.tokenizePositions.
+    return: a Phrase object with the words, or None if pairs is empty.
+    """
+    if not pairs:
+        return None
+    first = pairs[0][0]
+    return Phrase(tuple(word for position, word in pairs),
+            tuple(position - first for position, word in pairs))
+
+def parseQuery(parser, queryString, positional=True, boolean=True):
+    """
+    Parse a query string with phrases between double quotes, like "cystic
+    fibrosis", and NEAR/k operators between two words or phrases, like
+    pseudomonas NEAR/3 aeruginosa. A NEAR operator binds the words or
+    phrases right before and after it, and chains of them are grouped from
+    the left. The words of a phrase are tokenized like the ones of the
+    documents, and the stop words are left out but keep their positions.
+
+    Every word of the query ranks the documents like in a plain query, and
+    the phrases and NEAR operators are constraints that the documents must
+    match.
+
+    The queries with Boolean or field:term operators are parsed by
+    parseBooleanQuery, if boolean is True.
+
+    param parser: the Parser.Parser object that tokenizes the documents.
+    param queryString: string containing the query.
+    param positional: whether the phrases and NEAR operators are parsed,
+    otherwise they are plain words.
+    param boolean: whether the Boolean and field:term operators are parsed,
+    otherwise they are plain words.
+    return: a tuple (words, constraints), where words is a list with all the
+    words of the query, and constraints is a tuple with the Phrase and Near
+    objects the documents must match.
+    """
+    if boolean and BOOLEAN_REGEX.search(queryString):
+        return parseBooleanQuery(parser, queryString, positional)
+    if not positional:
+        return parser.tokenize(queryString), ()
+    words = []
+    # the operands of the query, Phrase objects or None for the chunks of
+    # text without words, and the NEAR operators between them, as ints
+    items = []
+    for match in QUERY_TOKEN_REGEX.finditer(queryString):
+        if match.group("near"):
+            items.append(nearDistance(match.group("distance")))
+        elif match.group("phrase"):
+            pairs = parser.tokenizePositions(match.group("phrase").strip('"'))
+            words.extend(word for position, word in pairs)
+            items.append((makePhrase(pairs), True))
+        else:
+            pairs = parser.tokenizePositions(match.group("text"))
+            words.extend(word for position, word in pairs)
+            if not pairs:
+                items.append((None, False))
+            for pair in pairs:
+                items.append((makePhrase([pair]), False))
+
+    constraints = []
+    iii = 0
+    while iii < len(items):
+        item = items[iii]
+        iii += 1
+        if isinstance(item, int):
+            # a NEAR operator without a left operand
+            continue
+        operand, quoted = item
+        # group the chain of NEAR operators that starts with the operand
+        while (iii + 1 < len(items) and isinstance(items[iii], int)
+                and not isinstance(items[iii + 1], int)):
+            right = items[iii + 1][0]
+            if operand is not None and right is not None:
+                operand = Near(operand, right, items[iii])
+            else:
+                # operators of stop words don't constrain the documents
+                operand = None
+            quoted = True
+            iii += 2
+        if quoted and operand is not None:
+            constraints.append(operand)
+    return words, tuple(constraints)
+
+def combine(operator, operands):
+    """
+    param operator: And or Or.
+    param operands: a list with the operands, None for the ones without
+    words, that are left out.
+    return: an operator object with the operands, the operand itself if
+    there's only one, or None if there's none.
+    """
+    operands = tuple(operand for operand in operands if operand is not None)
+    if not operands:
+        return None
+    if len(operands) == 1:
+        return operands[0]
+    return operator(operands)
+
+def asPhrase(operand):
+    """
+    param operand: an operand of a NEAR operator.
+    return: the operand as a Phrase or Near object, or None if it has no
+    positions, like the field:term operators.
+    """
+    if isinstance(operand, (Phrase, Near)):
+        return operand
+    if isinstance(operand, Term) and operand.field is None:
+        return Phrase((operand.word,), (0,))
+    if isinstance(operand, Text) and len(operand.words) == 1:
+        return Phrase(operand.words, (0,))
+    return None
+
+def unwrap(operand):
+    """
+    param operand: an operand of a Boolean query.
+    return: the operand, or the documents with any of the words of a Text
+    object, when an operator binds it.
+    """
+    if isinstance(operand, Text):
+        return combine(Or, [Term(None, word) for word in operand.words])
+    return operand
+
+def joinOperands(groups):
+    """
+    Join the operands of a Boolean query that have no operator between them.
+    The documents must match every group of operands joined by AND
+    operators, and every phrase, field:term, NOT or parenthesized operand,
+    while the single words only rank them. If nothing else filters the
+    documents, the words are a Text object, that the operators around it may
+    bind, or that ranks the documents like a plain query.
+
+    param groups: a list with the groups of operands joined by AND
+    operators, lists of operands.
+    return: the operand of the groups, or None if they have no words.
+    """
+    operands = []
+    words = []
+    for group in groups:
+        group = [operand for operand in group if operand is not None]
+        if len(group) == 1 and isinstance(group[0], Text):
+            words.extend(group[0].words)
+        elif group:
+            operands.append(combine(And, [unwrap(operand)
+                for operand in group]))
+    text = Text(tuple(words)) if words else None
+    if not operands:
+        return text
+    return combine(And, operands + [text])
+
+def tokenizeBooleanQuery(parser, queryString, positional=True):
+    """
+    Split a Boolean query string into its tokens.
+
+    param parser: the Parser.Parser object that tokenizes the documents.
+    param queryString: string containing the query.
+    param positional: whether the phrases and NEAR operators are parsed,
+    otherwise they are plain words.
+    return: a list with the operators and parentheses as strings, the
+    distances of the NEAR operators as ints, and the operands as Phrase,
+    Term, And or Text objects, one for each word of the chunks of text, or
+    None for the operands without words.
+    """
+    tokens = []
+    for match in BOOLEAN_TOKEN_REGEX.finditer(queryString):
+        if not positional and (match.group("near") or match.group("phrase")):
+            words = parser.tokenize(match.group(0))
+            if not words:
+                tokens.append(None)
+            for word in words:
+                tokens.append(Text((word,)))
+        elif match.group("near"):
+            tokens.append(nearDistance(match.group("distance")))
+        elif match.group("operator") or match.group("paren"):
+            tokens.append(match.group(0))
+        elif match.group("phrase"):
+            tokens.append(makePhrase(parser.tokenizePositions(
+                match.group("phrase").strip('"'))))
+        elif match.group("field"):
+            field = match.group("field").lower()
+            value = match.group("value")
+            if field == AUTHOR_FIELD:
+                names = authorNames(value)
+                tokens.append(Term(field, names[0]) if names else None)
+            elif field == YEAR_FIELD:
+                # the years of the documents have two digits
+                tokens.append(Term(field, int(value) % 100)
+                        if value.isdigit() else None)
+            else:
+                tokens.append(combine(And, [Term(field, word)
+                    for word in parser.tokenize(value)]))
+        else:
+            words = parser.tokenize(match.group("text"))
+            if not words:
+                tokens.append(None)
+            for word in words:
+                tokens.append(Text((word,)))
+    return tokens
+
+def isOperand(token):
+    """
+    return: True if the token is an operand or an open parenthesis, the
+    start of an operand, False otherwise.
+    """
+    return (token == OPEN_PAREN
+            or not isinstance(token, (str, int)))
+
+def parseOr(tokens, pos):
+    """
+    Parse the operands joined by OR operators, from the position pos of the
+    tokens of a Boolean query, see tokenizeBooleanQuery. The parse functions
+    return a tuple (operand, position of the next token).
+    """
+    operands = []
+    operand, pos = parseAnd(tokens, pos)
+    operands.append(operand)
+    while pos < len(tokens) and tokens[pos] == OR_OPERATOR:
+        operand, pos = parseAnd(tokens, pos + 1)
+        operands.append(operand)
+    if len(operands) == 1:
+        return operand, pos
+    return combine(Or, [unwrap(operand) for operand in operands]), pos
+
+def parseAnd(tokens, pos):
+    """
+    Parse the operands joined by AND operators, or by nothing, see parseOr
+    and joinOperands.
+    """
+    groups = []
+    joined = False
+    while pos < len(tokens) and tokens[pos] not in (OR_OPERATOR, CLOSE_PAREN):
+        if tokens[pos] == AND_OPERATOR:
+            joined = True
+            pos += 1
+            continue
+        operand, pos = parseNot(tokens, pos)
+        if joined and groups:
+            groups[-1].append(operand)
+        else:
+            groups.append([operand])
+        joined = False
+    return joinOperands(groups), pos
+
+def parseNot(tokens, pos):
+    """
+    Parse an operand with NOT operators before it, see parseOr.
+    """
+    if tokens[pos] != NOT_OPERATOR:
+        return parseNear(tokens, pos)
+    if pos + 1 == len(tokens) or not (isOperand(tokens[pos + 1])
+            or tokens[pos + 1] == NOT_OPERATOR):
+        # a NOT operator without an operand
+        return None, pos + 1
+    operand, pos = parseNot(tokens, pos + 1)
+    return (None if operand is None else Not(unwrap(operand))), pos
+
+def parseNear(tokens, pos):
+    """
+    Parse an operand followed by NEAR operators, grouped from the left, see
+    parseOr. The NEAR operators of operands without positions become AND
+    operators.
+    """
+    operand, pos = parsePrimary(tokens, pos)
+    while (pos + 1 < len(tokens) and isinstance(tokens[pos], int)
+            and isOperand(tokens[pos + 1])):
+        distance = tokens[pos]
+        right, pos = parsePrimary(tokens, pos + 1)
+        if operand is None or right is None:
+            # operators of stop words don't constrain the documents
+            operand = None
+        elif asPhrase(operand) and asPhrase(right):
+            operand = Near(asPhrase(operand), asPhrase(right), distance)
+        else:
+            operand = And((unwrap(operand), unwrap(right)))
+    return operand, pos
+
+def parsePrimary(tokens, pos):
+    """
+    Parse an operand, or operands between parentheses, see parseOr.
+    """
+    token = tokens[pos]
+    if token == OPEN_PAREN:
+        operand, pos = parseOr(tokens, pos + 1)
+        if pos < len(tokens) and tokens[pos] == CLOSE_PAREN:
+            pos += 1
+        return operand, pos
+    if not isOperand(token):
+        # a NEAR operator without a left operand
+        return None, pos + 1
+    return token, pos + 1
+
+def rankingWords(operand):
+    """
+    param operand: an operand of a Boolean query.
+    return: a list with the words of the operand that rank the documents:
+    the words of the inverted index, and the ones of the title and subjects,
+    apart from the ones after NOT operators.
+    """
+    if operand is None or isinstance(operand, Not):
+        return []
+    if isinstance(operand, Term):
+        if operand.field is None or operand.field in TEXT_FIELD_NAMES:
+            return [operand.word]
+        return []
+    if isinstance(operand, (Phrase, Text)):
+        return list(operand.words)
+    if isinstance(operand, Near):
+        return rankingWords(operand.left) + rankingWords(operand.right)
+    return [word for item in operand.operands for word in rankingWords(item)]
+
+def parseBooleanQuery(parser, queryString, positional=True):
+    """
+    Parse a query string with the Boolean operators AND, OR and NOT, in
+    upper case, parentheses, and field:term operators, like ti:fibrosis,
+    mj:cystic, mn:infant, au:hoiby or au:hoiby-n, and year:1974, besides
+    the phrases and NEAR operators of parseQuery. NOT binds tighter than AND,
+    and AND tighter than OR. The words without an operator next to them only
+    rank the documents, like in cystic fibrosis NOT year:74, see
+    joinOperands.
+
+    The Boolean expression is a constraint that the documents must match,
+    and they are ranked by the words of the query that are not after NOT
+    operators. The author and year operators only filter the documents.
+
+    param parser: the Parser.Parser object that tokenizes the documents.
+    param queryString: string containing the query.
+    param positional: whether the phrases and NEAR operators are parsed,
+    otherwise they are plain words.
+    return: a tuple (words, constraints), where words is a list with the
+    words that rank the documents, and constraints is a tuple with the
+    Boolean expression, a Term, Phrase, Near, And, Or or Not object, or an
+    empty tuple if nothing filters the documents.
+    """
+    tokens = tokenizeBooleanQuery(parser, queryString, positional)
+    operands = []
+    pos = 0
+    while pos < len(tokens):
+        operand, pos = parseOr(tokens, pos)
+        operands.append(operand)
+        # a CLOSE_PAREN without an OPEN_PAREN
+        pos += 1
+    expression = joinOperands([[operand] for operand in operands])
+    if expression is None or isinstance(expression, Text):
+        return rankingWords(expression), ()
+    return rankingWords(expression), (expression,)
@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from SearchEngine import SearchEngine
+from QueryBatcher import DEFAULT_MAX_SIZE
+from QueryBatcher import DEFAULT_WINDOW
+from QueryBatcher import QueryBatcher
+from SocketServer import ThreadingMixIn
+from util import Document
+from util import Query
+import BaseHTTPServer
+import httplib
+import json
+import multiprocessing
+import signal
+
+DEFAULT_HOST = "localhost"
+DEFAULT_PORT = 8337
+# the queries are POSTed to this path, see QueryServer
+SEARCH_PATH = "/search"
+# the statistics of the server are read with GET
+STATS_PATH = "/stats"
+
+def parseAddress(address):
+    """
+    Split an address of the kind "host:port", "host" or ":port" into its
+    parts, the missing ones take the default values.
+
+    param address: string containing the address, may be None.
+    return: a tuple (host, port).
+    """
+    if not address:
+        return DEFAULT_HOST, DEFAULT_PORT
+    host, sep, port = address.rpartition(":")
+    if not sep:
+        return address, DEFAULT_PORT
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError("Invalid port in the address: {}".format(address))
+    return host or DEFAULT_HOST, port
+
+def encodeResults(results):
+    """
+    param results: a list of tuples (similarity, util.Document).
+    return: a list of dicts with the similarity and the fields of each
+    document, ready to be encoded as JSON.
+    """
+    return [dict(similarity=sim, **doc._asdict()) for sim, doc in results]
+
+def decodeResults(results):
+    """
+    Inverse of encodeResults. The strings are encoded back to utf-8, so the
+    documents are equal to the ones of the SearchEngine.
+
+    param results: a list of dicts decoded from JSON.
+    return: a list of tuples (similarity, util.Document).
+    """
+    decoded = []
+    for result in results:
+        doc = Document(result["id"], result["year"],
+                result["title"].encode("utf-8"),
+                result["authors"].encode("utf-8"), result["norm"])
+        decoded.append((result["similarity"], doc))
+    return decoded
+
+def parseRequest(request):
+    """
+    Get the queries of a request.
+
+    The request is a dict with the keys:
+        "queries": a list of dicts with the keys "query", the query string,
+        and optionally "id" and "relevants", the ids of the relevant
+        documents.
+        "K": the size of the rankings.
+        "evaluate": whether or not to evaluate the results of the queries
+        with relevant documents.
+
+    param request: a dict, as described above.
+    return: a tuple (queries, K, evaluate), where queries is a list of
+    util.Query objects.
+    """
+    K = int(request.get("K", 10))
+    evaluate = bool(request.get("evaluate", False))
+    queries = []
+    for iii, item in enumerate(request["queries"]):
+        queries.append(Query(item.get("id", iii + 1),
+            item["query"].encode("utf-8"), item.get("relevants") or []))
+    return queries, K, evaluate
+
+def scoreBatch(eng, items):
+    """
+    Score a batch of queries with a search engine, the queries with the same
+    ranking size are scored together with SearchEngine.processQueries. The
+    rankings are the same ones of SearchEngine.processQuery.
+
+    param eng: a SearchEngine.SearchEngine object with the index loaded.
+    param items: a list of tuples (util.Query, K).
+    return: a list with the results of each query.
+    """
+    results = [None] * len(items)
+    groups = {}
+    for iii, item in enumerate(items):
+        groups.setdefault(item[1], []).append(iii)
+    for K, indexes in groups.iteritems():
+        queries = [items[iii][0] for iii in indexes]
+        if len(queries) == 1:
+            answers = [eng.processQuery(queries[0], K)]
+        else:
+            answers = eng.processQueries(queries, K)
+        for iii, pair in zip(indexes, answers):
+            results[iii] = pair[0]
+    return results
+
+# the search engine of each worker process of a QueryServer
+workerEngine = None
+
+def initWorker(indexPath, scoring, cacheSize, weighting, budget):
+    """
+    Initializer of the worker processes of a QueryServer, each one maps the
+    index on its own.
+    """
+    global workerEngine
+    # the server process handles CTRL+C and terminates the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    workerEngine = SearchEngine(scoring, cacheSize)
+    workerEngine.loadIndex(indexPath)
+    if weighting:
+        workerEngine.setWeighting(weighting)
+    workerEngine.setBudget(*budget)
+
+def workerScoreBatch(items):
+    """
+    Score a batch of queries in a worker process, see scoreBatch.
+    """
+    return scoreBatch(workerEngine, items)
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Handles the HTTP requests of a QueryServer, each one in its own thread.
+    The connections are kept alive, so a client sends all of its queries
+    through a single connection.
+    """
+    protocol_version = "HTTP/1.1"
+    # the headers and body of a response are written together, otherwise
+    # each header is a small packet delayed by the TCP acknowledgments
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path != STATS_PATH:
+            self.sendJson(404, {"error": "Unknown path: {}".format(self.path)})
+            return
+        self.sendJson(200, self.server.stats())
+
+    def do_POST(self):
+        if self.path != SEARCH_PATH:
+            self.sendJson(404, {"error": "Unknown path: {}".format(self.path)})
+            return
+        try:
+            length = int(self.headers.getheader("Content-Length", 0))
+            queries, K, evaluate = parseRequest(
+                    json.loads(self.rfile.read(length)))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.sendJson(400, {"error": "Invalid request: {}".format(e)})
+            return
+        try:
+            response = self.server.answer(queries, K, evaluate)
+        except Exception as e:
+            self.sendJson(500, {"error": "{}: {}".format(type(e).__name__, e)})
+            return
+        self.sendJson(200, response)
+
+    def sendJson(self, status, obj):
+        body = json.dumps(obj)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # the requests are not logged, printing them would slow the server
+        pass
+
+class QueryServer(ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A long running HTTP server that answers queries with JSON, so the index
+    is loaded once for many queries. The requests are POSTed to SEARCH_PATH,
+    see parseRequest for their format, and the statistics of the server are
+    read from STATS_PATH.
+
+    Each client connection is handled by a thread, and the queries of all
+    the clients are scored together in batches by a QueryBatcher.QueryBatcher.
+    The scoring is CPU bound, so with more than one worker the batches are
+    scored by a pool of processes, each one with its own mapping of the
+    index and its own result cache. With a single worker they are scored by
+    the search engine of the server, one batch at a time.
+    """
+    daemon_threads = True
+
+    def __init__(self, eng, address=(DEFAULT_HOST, DEFAULT_PORT), workers=1,
+            indexPath=None, weighting=None, window=DEFAULT_WINDOW,
+            maxBatchSize=DEFAULT_MAX_SIZE):
+        """
+        Constructor method. Binds the address, the server only starts
+        answering with serve_forever.
+
+        param eng: a SearchEngine.SearchEngine object with the index loaded.
+        param address: a tuple (host, port).
+        param workers: the amount of processes scoring the queries.
+        param indexPath: string containing the path to the index, loaded by
+        each worker process. Needed if workers is greater than 1.
+        param weighting: the name of the weighting chosen for the index, if
+        any.
+        param window: how long the first query of a batch waits for others,
+        in seconds.
+        param maxBatchSize: the maximum amount of queries scored together.
+        """
+        # server_close is called when the address can't be bound
+        self.pool = None
+        BaseHTTPServer.HTTPServer.__init__(self, address, RequestHandler)
+        self.eng = eng
+        if workers > 1:
+            self.pool = multiprocessing.Pool(workers, initWorker,
+                    (indexPath, eng.scoring, eng.resultCache.maxSize,
+                        weighting, (eng.maxAccumulators, eng.maxPostings,
+                            eng.budgetStrategy)))
+            score = lambda items: self.pool.apply(workerScoreBatch, (items,))
+        else:
+            # a single thread scores the batches, the search engine and its
+            # cache are not thread safe
+            score = lambda items: scoreBatch(eng, items)
+        self.batcher = QueryBatcher(score, window, maxBatchSize,
+                threads=max(1, workers))
+
+    def answer(self, queries, K, evaluate):
+        """
+        Score the queries of a request and evaluate their results.
+
+        param queries: a list of util.Query objects.
+        param K: the size of the rankings.
+        param evaluate: whether or not to evaluate the results of the queries
+        with relevant documents.
+        return: a dict with the key "answers", a list with a dict with the
+        "results" and the "evaluation" (or None) of each query, ready to be
+        encoded as JSON.
+        """
+        answers = []
+        for query, results in zip(queries, self.batcher.score(queries, K)):
+            evalResults = None
+            # queries without relevant documents or results can't be evaluated
+            if evaluate and query.relevants and results:
+                evalResults = self.eng.evaluateResults(query, results)
+            answers.append({"results": encodeResults(results),
+                "evaluation": evalResults})
+        return {"answers": answers}
+
+    def stats(self):
+        """
+        return: a dict with the histograms of the QueryBatcher, see
+        QueryBatcher.stats, and the counters of the result cache of the
+        server, if it scores the queries.
+        """
+        stats = self.batcher.stats()
+        if self.pool is None:
+            cache = self.eng.resultCache
+            stats["cache"] = {"hits": cache.hits, "misses": cache.misses,
+                    "size": len(cache)}
+        return stats
+
+    def server_close(self):
+        BaseHTTPServer.HTTPServer.server_close(self)
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+
+class QueryClient(object):
+    """
+    Client of a QueryServer. Its processQuery and processQueries methods
+    mirror the ones of SearchEngine.SearchEngine, so it can be used in place
+    of a search engine to process queries.
+    """
+    def __init__(self, address=(DEFAULT_HOST, DEFAULT_PORT), timeout=None):
+        """
+        Constructor method. The connection is only opened by the first query.
+
+        param address: a tuple (host, port) of the server.
+        param timeout: timeout of the connection in seconds, None waits
+        forever.
+        """
+        self.address = address
+        self.connection = httplib.HTTPConnection(address[0], address[1],
+                timeout=timeout)
+
+    def close(self):
+        """
+        Close the connection to the server.
+
+        return: None
+        """
+        self.connection.close()
+
+    def send(self, method, path, body=None):
+        """
+        Send a request to the server.
+
+        Raises an IOError if the server can't be reached or refuses the
+        request.
+
+        param method: the HTTP method.
+        param path: the path of the request.
+        param body: the object sent as JSON, if any.
+        return: the object decoded from the JSON response.
+        """
+        headers = {}
+        if body is not None:
+            body = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        try:
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (httplib.HTTPException, IOError) as e:
+            self.connection.close()
+            raise IOError("Could not reach the server at {}:{}: {}"
+                    .format(self.address[0], self.address[1], e))
+        if response.status != 200:
+            raise IOError("The server answered with status {}: {}"
+                    .format(response.status, json.loads(data).get("error")))
+        return json.loads(data)
+
+    def stats(self):
+        """
+        return: the statistics of the server, see QueryServer.stats.
+        """
+        return self.send("GET", STATS_PATH)
+
+    def request(self, queries, K, evaluate):
+        """
+        Send the queries to the server.
+
+        Raises an IOError if the server can't be reached or refuses the
+        request.
+
+        param queries: a list of util.Query objects.
+        param K: the size of the rankings.
+        param evaluate: whether or not to evaluate the results.
+        return: a list with a pair (results, evalResults) for each query.
+        """
+        response = self.send("POST", SEARCH_PATH, {
+            "queries": [{"id": query.id, "query": query.queryString,
+                "relevants": list(query.relevants)} for query in queries],
+            "K": K, "evaluate": evaluate})
+        return [(decodeResults(answer["results"]), answer["evaluation"])
+                for answer in response["answers"]]
+
+    def processQuery(self, query, K=10, evaluate=False):
+        """
+        See SearchEngine.processQuery.
+        """
+        return self.request([query], K, evaluate)[0]
+
+    def processQueries(self, queries, K=10, evaluate=False):
+        """
+        See SearchEngine.processQueries.
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        return self.request(queries, K, evaluate)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from collections import OrderedDict
+
+class ResultCache(object):
+    """
+    A cache of query results with LRU eviction. The results are keyed by the
+    normalized query, the frequencies of its words, and the size of the
+    ranking, so queries that differ only by the order of the words, case,
+    punctuation or stop words share the same entry.
+
+    The amount of lookups answered and not answered by the cache are kept in
+    the hits and misses fields.
+    """
+    def __init__(self, maxSize):
+        """
+        Constructor method.
+
+        param maxSize: the maximum amount of results kept in the cache, the
+        least recently used ones are evicted first. If it's 0 nothing is
+        cached.
+        """
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def makeKey(qCounter, K, constraints=()):
+        """
+        param qCounter: a collections.Counter with the frequency of the words
+        of the query.
+        param K: the size of the ranking.
+        param constraints: a tuple with the phrases and NEAR operators of the
+        query, see QueryLanguage.parseQuery.
+        return: the key of the results of the query in the cache.
+        """
+        return frozenset(qCounter.iteritems()), K, constraints
+
+    def get(self, key):
+        """
+        Get the results cached under the key, and mark them as the most
+        recently used ones.
+
+        param key: a key created by makeKey.
+        return: a copy of the list of results, or None if they are not in the
+        cache.
+        """
+        try:
+            results = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries[key] = results
+        self.hits += 1
+        return list(results)
+
+    def put(self, key, results):
+        """
+        Cache the results under the key, evicting the least recently used
+        results if the cache is full.
+
+        param key: a key created by makeKey.
+        param results: a list of results.
+        return: None
+        """
+        if self.maxSize <= 0:
+            return
+        self.entries.pop(key, None)
+        self.entries[key] = list(results)
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop all the cached results, the hits and misses are kept.
+
+        return: None
+        """
+        self.entries.clear()
@@ -2,93 +2,393 @@
 #coding: utf-8
 
 from __future__ import division
+from DocumentStore import DocumentStore
+from Finalizer import Finalizer
+from InvertedIndex import InvertedIndex
 from Parser import Parser
+from Parser import fieldKey
+from Positions import encodePositions
+from Positions import positionsAt
+from Positions import splitPositions
+from Postings import END_OF_LIST
+from Postings import PostingCursor
+from Postings import PostingList
+from Postings import gallop
+from Postings import intersect
+from QueryLanguage import And
+from QueryLanguage import Near
+from QueryLanguage import Not
+from QueryLanguage import Or
+from QueryLanguage import Phrase
+from QueryLanguage import Term
+from QueryLanguage import Text
+from QueryLanguage import hasOperators
+from QueryLanguage import parseQuery
+from ResultCache import ResultCache
+from Stats import NULL_STATS
+from Stats import Stats
 from collections import Counter
 from math import log
+from Normalizer import DEFAULT_NORMALIZER
+from Normalizer import NORMALIZERS
 from util import Document
 from util import Query
+from Weighting import DEFAULT_WEIGHTING
+from Weighting import WEIGHTINGS
+from VectorScorer import VectorScorer
+from ImpactScorer import ImpactScorer
+from ImpactScorer import QUIT_STRATEGY
 import Evaluator
+import IndexFile
+import array
 import ast
+import bisect
 import heapq
+import itertools
+import multiprocessing
 import os
 import re
 import sys
+import time
+
+# the ways processQuery can score the documents
+ACCUMULATORS_SCORING = "accumulators"
+NUMPY_SCORING = "numpy"
+MAXSCORE_SCORING = "maxscore"
+DAAT_SCORING = "daat"
+IMPACT_SCORING = "impact"
+SCORINGS = [ACCUMULATORS_SCORING, NUMPY_SCORING, MAXSCORE_SCORING,
+        DAAT_SCORING, IMPACT_SCORING]
+
+# relative margin by which an upper bound must be below the smallest
+# similarity of the top K for MaxScore to skip a document, so the rounding
+# errors of the bounds never prune a document the exhaustive scoring would
+# rank
+PRUNING_TOLERANCE = 1e-9
+
+# default maximum amount of query results kept in the cache
+DEFAULT_CACHE_SIZE = 1000
+
+# first line of an exported index with raw frequencies in the posting lists,
+# followed by the name of the weighting
+RAW_FREQUENCIES_COMMENT = "# pesos: frequências; ponderação: "
+# line of an exported index with words normalized by a normalizer, followed by
+# the name of the normalizer
+NORMALIZER_COMMENT = "# normalização: "
+
+def addToIndex(invertedIndex, docId, wordCounter):
+    """
+    Add the frequencies of the words of a document to an inverted index.
+
+    param invertedIndex: a dict with word keys and (idf, Postings.PostingList)
+    values.
+    param docId: the docID of the document.
+    param wordCounter: a collections.Counter with the frequency of the words
+    in the document.
+    return: None
+    """
+    for word, freq in wordCounter.iteritems():
+        try:
+            idf, lst = invertedIndex[word]
+        except KeyError:
+            lst = PostingList()
+            invertedIndex[word] = (0, lst)
+        lst.append(docId, freq)
+
+def addPositionsToIndex(invertedIndex, positions, docId, wordPositions):
+    """
+    Add the frequencies and the positions of the words of a document to a
+    positional inverted index, see addToIndex.
+
+    param invertedIndex: a dict with word keys and (idf, Postings.PostingList)
+    values.
+    param positions: a dict with word keys and lists of (docID, bytearray)
+    values, where the encoded positions of the words in the document are
+    appended, see Positions.encodePositions.
+    param docId: the docID of the document.
+    param wordPositions: a dict with word keys and sorted lists of the
+    positions of the words in the document.
+    return: None
+    """
+    addToIndex(invertedIndex, docId, dict((word, len(lst))
+        for word, lst in wordPositions.iteritems()))
+    for word, lst in wordPositions.iteritems():
+        data = bytearray()
+        encodePositions(lst, data)
+        try:
+            positions[word].append((docId, data))
+        except KeyError:
+            positions[word] = [(docId, data)]
+
+def joinPositions(positions):
+    """
+    Join the encoded positions of each word in the order of the docIDs, the
+    order of the postings.
+
+    param positions: a dict like the one of addPositionsToIndex.
+    return: a dict with word keys and bytearray values.
+    """
+    joined = {}
+    for word, entries in positions.iteritems():
+        data = bytearray()
+        for docId, entry in sorted(entries):
+            data += entry
+        joined[word] = data
+    return joined
+
+def parsePartialIndex(args):
+    """
+    Worker function of createIndex. Parses a collection file into a partial
+    inverted index with the frequencies of its words, and optionally their
+    positions and the terms of the fields of the documents.
+
+    param args: a tuple (parser, path, positional, fields), with the Parser
+    object used to parse the file, a string containing the path to the file,
+    and bool values, whether to keep the positions of the words and the
+    terms of the fields.
+    return: a tuple (documents, invertedIndex, positions, fieldIndex), where
+    documents is a list of util.Document objects, invertedIndex is a dict
+    like SearchEngine.invertedIndex, positions is a dict like the one of
+    addPositionsToIndex, or None if positional is False, and fieldIndex is a
+    dict like invertedIndex with the terms of the fields, see
+    Parser.fieldTerms, or None if fields is False.
+    """
+    parser, path, positional, fields = args
+    documents = []
+    invertedIndex = {}
+    positions = {} if positional else None
+    fieldIndex = {} if fields else None
+    for item in parser.parseFile(path, positions=positional, fields=fields):
+        doc = item[0]
+        documents.append(doc)
+        if positional:
+            addPositionsToIndex(invertedIndex, positions, doc.id, item[1])
+        else:
+            addToIndex(invertedIndex, doc.id, item[1])
+        if fields:
+            addToIndex(fieldIndex, doc.id, item[2])
+    return documents, invertedIndex, positions, fieldIndex
+
+# the search engine of the worker processes of processQueriesParallel, set
+# before the processes are forked so they inherit it, with the mapping of
+# its index file
+workerEngine = None
+
+def processQueryChunk(args):
+    """
+    Worker function of the parallel processQueriesParallel. Processes a
+    chunk of queries with the inherited workerEngine.
+
+    param args: a tuple (queries, K, evaluate, batch), with a list of
+    util.Query objects, the size of the rankings, whether or not to evaluate
+    the results, and whether or not to score the queries together with
+    processQueries.
+    return: a list with a tuple (results, evalResults, time) for each query,
+    see processQueriesParallel.
+    """
+    queries, K, evaluate, batch = args
+    answers = []
+    if batch:
+        start = time.time()
+        pairs = workerEngine.processQueries(queries, K, evaluate)
+        # the time of the batch is split evenly among its queries
+        elapsed = (time.time() - start) / len(queries)
+        for results, evalResults in pairs:
+            answers.append((results, evalResults, elapsed))
+    else:
+        for query in queries:
+            start = time.time()
+            results, evalResults = workerEngine.processQuery(query, K, evaluate)
+            answers.append((results, evalResults, time.time() - start))
+    return answers
 
 class SearchEngine(object):
-    def __init__(self):
+    def __init__(self, scoring=ACCUMULATORS_SCORING,
+            cacheSize=DEFAULT_CACHE_SIZE):
         """
         Constructor method.
+
+        param scoring: the way the documents are scored by processQuery, one
+        of SCORINGS. See the setScoring method.
+        param cacheSize: maximum amount of query results kept in
+        self.resultCache, 0 disables the cache.
         """
-        self.invertedIndex = dict()
-        self.documents = dict()
+        # the idfs, posting lists and upper bounds of the words, addressed by
+        # term ID. Built from a dict with word keys, see InvertedIndex
+        self.invertedIndex = InvertedIndex()
+        # the docIDs, years, norms, titles and authors of the documents, in
+        # columns, see DocumentStore
+        self.documents = DocumentStore()
+        # the posting lists of the terms of the fields of the documents, like
+        # the title or the authors, used by the field:term operators of the
+        # queries, see Parser.fieldTerms. None if the index has no fields
+        self.fieldIndex = None
+        # the binary index file mapped by self.loadIndex, if any
+        self.indexFile = None
+        # whether the posting lists hold raw frequencies instead of tf-idf
+        # weights, in which case the idf is applied at query time
+        self.rawFrequencies = False
+        # the Weighting applied at query time to the raw frequencies
+        self.weighting = WEIGHTINGS[DEFAULT_WEIGHTING]
+        # amount of postings between the skip pointers of the posting lists,
+        # 0 if they have no skip pointers
+        self.skipInterval = 0
+        # the number of the shard and the amount of shards, if the index is
+        # one of the shards of a collection, see self.splitShards. The idfs
+        # and norms of a shard are the ones of the whole collection
+        self.shard = 0
+        self.nShards = 1
+        # whether or not to print the words of the queries that are not in
+        # the index. The shards leave it to the coordinator
+        self.warnMissingWords = True
+
+        # partial indexes with documents added by self.addFiles, and docIDs
+        # deleted by self.deleteDocuments, waiting to be merged in the index
+        self.segments = []
+        self.deleted = set()
+        # whether the idfs and norms must be calculated again before the index
+        # is used
+        self.statsOutdated = False
         stopWordsPath = "sw.txt"
         self.parser = Parser(stopWordsPath)
 
-    def calculateWeights(self):
+        # the numpy version of the index, built on demand by processQuery
+        self.vectorScorer = None
+        # the impact ordered version of the index, built on demand by
+        # processQuery, and the budgets of its queries, see self.setBudget
+        self.impactScorer = None
+        self.maxAccumulators = 0
+        self.maxPostings = 0
+        self.budgetStrategy = QUIT_STRATEGY
+        # results of the recent queries, with its hits and misses counters
+        self.resultCache = ResultCache(cacheSize)
+        self.setScoring(scoring)
+        # timers and counters of the stages of every query and of loading the
+        # index, see self.enableStats, and the ones of the current query, see
+        # self.processQuery
+        self.stats = NULL_STATS
+        self.queryStats = self.stats
+
+    def enableStats(self, enabled=True):
         """
-        Calculate the idf and tf-idf weights using the self.invertedIndex dict.
+        Turn on or off the timers and counters of the stages of every query
+        and of loading the index, collected in self.stats. When they are off
+        self.stats is a Stats.NullStats object, and the instrumentation
+        costs about nothing.
+
+        param enabled: whether or not to collect the stats.
+        return: None
+        """
+        self.stats = Stats() if enabled else NULL_STATS
+        self.queryStats = self.stats
+
+    def beginQueryStats(self, stats=None):
+        """
+        Choose the Stats.Stats object of the stages of a query, the one given
+        or self.stats. The scoring methods use self.queryStats.
+
+        param stats: a Stats.Stats object for the query only, or None.
+        return: the Stats.Stats object of the query.
+        """
+        self.queryStats = self.stats if stats is None else stats
+        return self.queryStats
+
+    def endQueryStats(self):
+        """
+        Add the stats of a query with its own Stats.Stats object to
+        self.stats, and go back to self.stats.
+
+        return: None
+        """
+        if self.queryStats is not self.stats:
+            self.stats.merge(self.queryStats)
+            self.queryStats = self.stats
+
+    def finalizeIndex(self, tfidf=True, useNumpy=True):
+        """
+        Calculate the idfs of the words, the tf-idf weights of the posting
+        lists, the norms of the documents and the upper bounds of the words,
+        once the posting lists are complete. The posting lists are walked
+        once, the squares of the weights are added to the norms in the same
+        pass in which the weights are calculated, see the Finalizer class.
 
         tf = term frequency of the word in the document.
-        idf = log_2(N/n), where N is the amount of words in the collection, and
-        n is the amount of documents in wich the word appears.
+        idf = log_2(N/n), where N is the amount of documents in the
+        collection, and n is the amount of documents in wich the word appears.
         tf-idf = tf * idf. It's the weight of a word in a document.
 
+        If self.rawFrequencies is True, the frequencies in the posting lists
+        are left untouched, the idfs are calculated with self.weighting, and
+        the norms from the frequencies, the idfs and self.weighting.
+
         This method expects that the inverted index contains frequecy of the
         words, and does not attempt to check if the current values are in fact
         frequencies.  So the user must be aware if there's or not really
         frequencies in the index before calling this method, at the risk of
         getting wrong weights and losing the previous data.
 
-        return: None
+        param tfidf: bool value, if it's False the weights and idfs are left
+        untouched, and only the norms and upper bounds are calculated.
+        param useNumpy: whether or not to use numpy, if it's installed. The
+        results are the same.
+        return: the time it took, in seconds.
         """
-        # N is the amount of words in the collection
+        start = time.time()
+        finalizer = Finalizer(self.documents, useNumpy)
+        # N is the amount of documents in the collection
         N = len(self.documents)
-        for word in self.invertedIndex.iterkeys():
-            idf, lst = self.invertedIndex[word]
-            # n is the amount of documents in wich the word appeared
-            n = len(lst)
-            #print "word: {}  N: {}  n: {}".format(word, N , n)
-            idf = log(N / n, 2) # idf of the word
-            # now calculate the weight for each pair document, frequency
-            for iii, pair in enumerate(lst):
-                docID, freq = pair
-                weight = idf * freq
-                lst[iii] = (docID, weight)
-            self.invertedIndex[word] = (idf, lst)
-
-    def calculateDocNorms(self):
-        """
-        Calculate the leghts/norms of the document vectors, using the weights
-        in the inverted index. And places them at the self.documents dict, on
-        the Document.norm field.
-
-        It calculates the norm based on the current weights in the inverted
-        index. This method does not attempt to check if the weights used are
-        valid or not.
+        idfs = self.invertedIndex.idfs
+        postings = self.invertedIndex.postings
+        if tfidf and not self.rawFrequencies:
+            for termId, lst in enumerate(postings):
+                # n is the amount of documents in wich the word appeared
+                n = len(lst)
+                idfs[termId] = log(N / n, 2) # idf of the word
+            # the docIDs of the compressed lists are left untouched
+            finalizer.setTfIdfWeights(postings, idfs)
 
-        return: None
+        # the term IDs follow the sorted order of the words, so the sums of
+        # the norms don't depend on the order in which the words were added
+        # to the index
+        for termId, lst in enumerate(postings):
+            if self.rawFrequencies:
+                idf = self.weighting.idf(N, len(lst))
+                idfs[termId] = idf
+                finalizer.addTerm(lst, self.documentWeights(lst).weights, idf)
+            else:
+                finalizer.addTerm(lst, lst.weights)
+        self.documents.norms = finalizer.norms()
+        self.invertedIndex.maxScores = finalizer.maxScores()
+        return time.time() - start
+
+    def calculateMaxScores(self):
         """
-        # sum the square of the weight of each component of the each document
-        # vector
-        for word, pair in self.invertedIndex.iteritems():
-            idf, lst = pair
-            for docId, weight in lst:
-                doc = self.documents[docId]
-                subTotal = doc.norm
-                subTotal += weight **2
-                doc = doc._replace(norm=subTotal)
+        Calculate the upper bound of the contribution of each word to the
+        similarity of a document: the greatest weight of the word in a
+        document divided by the norm of the document. Multiplied by the
+        weight of the word in a query, it bounds the contribution of the word
+        to the similarity of any document with the query. Places them in the
+        maxScores column of self.invertedIndex.
 
-                # place the result in the self.documents dict
-                self.documents[docId] = doc
+        Must be called after the norms are calculated.
 
-        # now that we have the sum of the squares, we take the square root
-        # to get the norm
-        for docId in self.documents.iterkeys():
-            doc = self.documents[docId]
-            doc = doc._replace(norm=doc.norm **0.5)
-            self.documents[docId] = doc
+        return: None
+        """
+        maxScores = self.invertedIndex.maxScores
+        norms = self.documents.norms
+        rows = self.documents.rows()
+        for termId, lst in enumerate(self.invertedIndex.postings):
+            maxScore = 0
+            for docId, weight in self.documentWeights(lst):
+                norm = norms[rows[docId]]
+                # documents with a null vector never get a similarity
+                if norm and weight / norm > maxScore:
+                    maxScore = weight / norm
+            maxScores[termId] = maxScore
 
-    def createIndex(self, folderPath, regex=r"^cf\d{2}$", tfidf=True):
+    def createIndex(self, folderPath, regex=r"^cf\d{2}$", tfidf=True,
+            workers=1, rawFrequencies=False, skipInterval=0, positional=False,
+            fields=False):
         """
         Creates the inverted index based on the files of the folderPath, that
         match the regex.
@@ -104,38 +404,320 @@ class SearchEngine(object):
         param tfIdf: bool value, if it's True, calculate the idf for the words
         int the self.invertedIndex dict, and the tf-idf weights for the words
         in the documents. Defaults to True.
+        param workers: amount of processes parsing the files. If it's greater
+        than 1 the files are parsed in parallel into partial indexes, that are
+        merged before the weights and norms are calculated. Defaults to 1.
+        param rawFrequencies: bool value, if it's True and tfidf is True, keep
+        the frequencies in the posting lists and apply self.weighting at query
+        time. Needed to update the index with the addFiles and
+        deleteDocuments methods, and to change its weighting with the
+        setWeighting method. Defaults to False.
+        param skipInterval: amount of postings between the skip pointers of
+        the posting lists, used by the document at a time scorings to jump
+        over the postings they don't need. If it's 0 the lists have no skip
+        pointers. Defaults to 0.
+        param positional: bool value, if it's True keep the positions of the
+        words in the documents, needed by the phrases and NEAR operators of
+        the queries. A positional index can't be updated. Defaults to False.
+        param fields: bool value, if it's True keep the terms of the title,
+        subjects, authors and year of the documents in self.fieldIndex,
+        needed by the field:term operators of the queries. An index with
+        fields can't be updated. Defaults to False.
         return: None.
         """
         print("Creating index using the files in the folder: {}" .format(folderPath))
 
+        if tfidf and not rawFrequencies and self.weighting.name != DEFAULT_WEIGHTING:
+            raise ValueError("Only indexes with raw frequencies can use the weighting: {}"
+                    .format(self.weighting.name))
+
+        paths = self.listCollectionFiles(folderPath, regex)
+        # the documents are only stored in columns, and the words given term
+        # IDs, once all the files are parsed
+        documents = dict(self.documents.iteritems())
+        invertedIndex = self.invertedIndex.toDict()
+        # the encoded positions of the words in each document, joined once
+        # all the files are parsed, and the postings of the fields
+        positions = {} if positional else None
+        fieldIndex = {} if fields else None
+        # each file is parsed into a partial index, in the worker processes
+        # if there are more than one, and merged in the order of the files,
+        # so the posting lists are built in increasing docID order
+        tasks = [(self.parser, path, positional, fields) for path in paths]
+        pool = multiprocessing.Pool(workers) if workers > 1 else None
+        try:
+            partials = (pool.imap(parsePartialIndex, tasks) if pool
+                    else itertools.imap(parsePartialIndex, tasks))
+            for partialDocuments, partialIndex, partialPositions, \
+                    partialFields in partials:
+                self.mergePartialIndex(partialDocuments, partialIndex,
+                        documents, invertedIndex, partialPositions, positions,
+                        partialFields, fieldIndex)
+            if pool:
+                pool.close()
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+        self.documents = DocumentStore.fromDocuments(documents.itervalues())
+        if positional:
+            positions = joinPositions(positions)
+        self.invertedIndex = InvertedIndex.fromDict(invertedIndex, positions)
+        if fields:
+            self.fieldIndex = InvertedIndex.fromDict(fieldIndex)
+
+        self.rawFrequencies = tfidf and rawFrequencies
+        # update self.invertedIndex with the idfs and tf-idf weights, and
+        # self.documents with the norms of the documents
+        elapsed = self.finalizeIndex(tfidf)
+        print("Calculated the weights and norms in {:.3f} s.".format(elapsed))
+        self.skipInterval = skipInterval
+        self.addSkipPointers()
+        self.indexChanged()
+
+    def addSkipPointers(self):
+        """
+        Add skip pointers every self.skipInterval postings to the posting
+        lists that don't have them yet, or remove them if self.skipInterval
+        is 0. See Postings.PostingList.addSkips.
+
+        return: None
+        """
+        for lst in self.invertedIndex.postings:
+            if lst.skips is None or lst.skips[0] != self.skipInterval:
+                lst.addSkips(self.skipInterval)
+
+    def listCollectionFiles(self, folderPath, regex=r"^cf\d{2}$"):
+        """
+        Get the paths of the files in the folderPath that match the regex, in
+        sorted order. Folders are ignored.
+
+        param folderPath: string containing the path to the folder with the
+        collection.
+        param regex: string containing a regex to match the files in the
+        folder. Defaults to a regex for the CFC collection.
+        return: a list of strings containing the paths of the files.
+        """
+        paths = []
         # regex to match the files of the collection.
         validFile = re.compile(regex)
         # list the files and folders in the folderPath variable, and the ones
-        # that match the regex are parsed
-        for fileName in os.listdir(folderPath):
+        # that match the regex are parsed. They are sorted so that the docIDs
+        # are usually appended in increasing order to the posting lists
+        for fileName in sorted(os.listdir(folderPath)):
             if validFile.match(fileName):
                 path = os.path.join(folderPath, fileName)
                 if not os.path.isfile(path): continue
-                # get the the doc details, and word frequencies for each
-                # document in the file
-                for doc, wordCounter in self.parser.parseFile(path):
-                    # add the document details to the self.documents dict
-                    self.documents[doc.id] = doc
-
-                    # now we add the words to the index
-                    for word, freq in wordCounter.items():
-                        idf, lst = self.invertedIndex.get(word, (0, []))
-                        lst.append((doc.id, freq))
-                        self.invertedIndex[word] = (idf, lst)
-        if tfidf:
-            # update self.invertedIndex with tf-idf weights, while also
-            # calculating the idf of the words
-            self.calculateWeights()
-
-        # update the self.documents with norms of the documents
-        self.calculateDocNorms()
-
-    def evaluateResults(self, query, results):
+                paths.append(path)
+
+        return paths
+
+    def mergePartialIndex(self, partialDocuments, partialIndex, documents,
+            invertedIndex, partialPositions=None, positions=None,
+            partialFields=None, fieldIndex=None):
+        """
+        Merge a partial index created by the parsePartialIndex function into
+        the documents and inverted index being built.
+
+        param partialDocuments: a list of util.Document objects.
+        param partialIndex: a dict with word keys and (idf,
+        Postings.PostingList) values, with frequencies as weights.
+        param documents: a dict with docID keys and util.Document values,
+        where partialDocuments are added.
+        param invertedIndex: a dict like partialIndex, where it's merged.
+        param partialPositions: the positions of the words of a positional
+        partial index, see parsePartialIndex, or None.
+        param positions: a dict like partialPositions, where they are merged.
+        param partialFields: the postings of the fields of a partial index,
+        see parsePartialIndex, or None.
+        param fieldIndex: a dict like partialFields, where they are merged.
+        return: None
+        """
+        for doc in partialDocuments:
+            documents[doc.id] = doc
+        if partialPositions is not None:
+            for word, entries in partialPositions.iteritems():
+                positions.setdefault(word, []).extend(entries)
+        if partialFields is not None:
+            self.mergePartialIndex([], partialFields, documents, fieldIndex)
+        for word, pair in partialIndex.iteritems():
+            idf, partialLst = pair
+            try:
+                idf, lst = invertedIndex[word]
+            except KeyError:
+                invertedIndex[word] = pair
+                continue
+            lst.extend(partialLst)
+
+    def unmapIndex(self):
+        """
+        Copy the index mapped by loadIndex to memory, so it can be changed,
+        and close the mapped file. Does nothing if the index isn't mapped.
+
+        return: None
+        """
+        if self.indexFile is None:
+            return
+        self.documents = DocumentStore.copyOf(self.documents)
+        self.invertedIndex = InvertedIndex.copyOf(self.invertedIndex)
+        self.indexFile.close()
+        self.indexFile = None
+
+    def addFiles(self, paths):
+        """
+        Add the documents in collection files to the index, without creating
+        the index again.
+
+        The documents are parsed into a new segment, a partial index waiting
+        to be merged in the index by the mergeSegments method. A document with
+        the docID of a document already in the index replaces it. The idfs
+        and norms are only calculated again when the index is used.
+
+        The index must have been created with rawFrequencies, otherwise a
+        ValueError is raised.
+
+        param paths: a list of strings containing the paths of the files.
+        return: None
+        """
+        self.checkUpdatable()
+        for path in paths:
+            documents, partialIndex, positions, fieldIndex = parsePartialIndex(
+                    (self.parser, path, False, False))
+            # the documents being replaced are deleted first
+            self.deleteDocuments([doc.id for doc in documents
+                if doc.id in self.documents or self.segmentOf(doc.id)],
+                verbose=False)
+            self.segments.append((documents, partialIndex))
+        self.statsOutdated = True
+
+    def deleteDocuments(self, docIds, verbose=True):
+        """
+        Delete documents from the index, without creating the index again.
+
+        Documents of the index are only marked as deleted, and removed when
+        the segments are merged. The idfs and norms are only calculated
+        again when the index is used.
+
+        The index must have been created with rawFrequencies, otherwise a
+        ValueError is raised.
+
+        param docIds: an iterable with the docIDs (RN) of the documents.
+        param verbose: whether or not to warn about unknown docIDs.
+        return: None
+        """
+        self.checkUpdatable()
+        for docId in docIds:
+            segment = self.segmentOf(docId)
+            # documents still in a segment are removed from it right away
+            if segment:
+                documents, partialIndex = segment
+                documents[:] = [doc for doc in documents if doc.id != docId]
+                for word, pair in partialIndex.items():
+                    idf, lst = pair
+                    if docId not in lst.docIds(): continue
+                    lst = PostingList.fromPairs((iii, freq) for iii, freq in lst
+                            if iii != docId)
+                    if lst:
+                        partialIndex[word] = (idf, lst)
+                    else:
+                        del partialIndex[word]
+            elif docId in self.documents and docId not in self.deleted:
+                self.deleted.add(docId)
+            elif verbose:
+                print("[*] The document {} doesn't exist in the index and will be ignored.".format(docId))
+        self.statsOutdated = True
+
+    def segmentOf(self, docId):
+        """
+        return: the segment waiting to be merged with the document with the
+        docID, or None if there's no such segment.
+        """
+        for segment in self.segments:
+            documents, partialIndex = segment
+            for doc in documents:
+                if doc.id == docId:
+                    return segment
+        return None
+
+    def checkUpdatable(self):
+        """
+        Raise a ValueError if the index can't be updated, and copy a mapped
+        index to memory so it can.
+
+        return: None
+        """
+        if not self.rawFrequencies and self.documents:
+            raise ValueError("The index must be created with raw frequencies to be updated")
+        if self.nShards > 1:
+            raise ValueError("A shard can't be updated, the idfs and norms of the collection would change")
+        if self.invertedIndex.hasPositions():
+            raise ValueError("A positional index can't be updated, please create it again")
+        if self.fieldIndex is not None:
+            raise ValueError("An index with fields can't be updated, please create it again")
+        self.rawFrequencies = True
+        self.unmapIndex()
+
+    def mergeSegments(self):
+        """
+        Merge the segments created by addFiles in the index, and remove the
+        documents deleted by deleteDocuments from it. Only the posting lists
+        with deleted documents are encoded again, the segments are appended
+        to the posting lists. The words are given new term IDs.
+
+        return: None
+        """
+        if not self.deleted and not self.segments:
+            return
+        documents = dict(self.documents.iteritems())
+        invertedIndex = self.invertedIndex.toDict()
+        if self.deleted:
+            minDocId = min(self.deleted)
+            for word, pair in invertedIndex.items():
+                idf, lst = pair
+                if lst.lastDocId < minDocId:
+                    continue
+                if not self.deleted.intersection(lst.docIds()):
+                    continue
+                lst = PostingList.fromPairs((docId, freq) for docId, freq in lst
+                        if docId not in self.deleted)
+                if lst:
+                    invertedIndex[word] = (idf, lst)
+                else:
+                    del invertedIndex[word]
+            for docId in self.deleted:
+                del documents[docId]
+            self.deleted = set()
+
+        for segmentDocuments, partialIndex in self.segments:
+            self.mergePartialIndex(segmentDocuments, partialIndex, documents,
+                    invertedIndex)
+        self.segments = []
+        self.documents = DocumentStore.fromDocuments(documents.itervalues())
+        self.invertedIndex = InvertedIndex.fromDict(invertedIndex)
+
+    def refresh(self):
+        """
+        Bring the index up to date after it was changed by addFiles or
+        deleteDocuments: merge the segments and calculate the idfs and the
+        norms of the documents again. The weights in the posting lists are
+        frequencies, so they are left untouched.
+
+        Called before the index is used, does nothing if the index didn't
+        change.
+
+        return: None
+        """
+        if not self.statsOutdated:
+            return
+        self.mergeSegments()
+        self.finalizeIndex()
+        # the lists changed by the merge lost their skip pointers
+        self.addSkipPointers()
+        self.statsOutdated = False
+        self.indexChanged()
+
+    @staticmethod
+    def evaluateResults(query, results):
         """
         A method to get evaluation metrics from the results to the query.
 
@@ -176,10 +758,66 @@ class SearchEngine(object):
         evalResults["MAP"] = MAP
         return evalResults
 
-    def loadIndex(self, path):
+    def getVectorScorer(self):
         """
-        Loads the self.documents and self.invertedIndex dicts data from a file
-        created with the self.saveIndex method.
+        return: the VectorScorer of the current index, creating it if needed.
+        """
+        if self.vectorScorer is None:
+            self.vectorScorer = VectorScorer(self.documents, self.invertedIndex,
+                    self.queryWeight, self.documentWeights, self.missingWord)
+        return self.vectorScorer
+
+    def getImpactScorer(self):
+        """
+        return: the ImpactScorer of the current index, creating it if needed.
+        """
+        if self.impactScorer is None:
+            self.impactScorer = ImpactScorer(self.documents, self.invertedIndex,
+                    self.queryWeight, self.documentWeights, self.missingWord,
+                    self.maxAccumulators, self.maxPostings,
+                    self.budgetStrategy)
+        return self.impactScorer
+
+    def setBudget(self, maxAccumulators=0, maxPostings=0,
+            strategy=QUIT_STRATEGY):
+        """
+        Choose the budgets of the queries scored with IMPACT_SCORING, that
+        bound their latency and memory at the cost of an approximate ranking.
+        See the ImpactScorer class.
+
+        Raises a ValueError if the strategy is unknown or a budget is
+        negative.
+
+        param maxAccumulators: the maximum amount of documents that get a
+        similarity, 0 for no budget.
+        param maxPostings: the maximum amount of postings processed, 0 for no
+        budget.
+        param strategy: one of ImpactScorer.STRATEGIES, whether to stop, or
+        to keep updating the accumulators already created, once the
+        accumulators reach their budget.
+        return: None
+        """
+        # the scorer checks the budgets
+        self.getImpactScorer().setBudget(maxAccumulators, maxPostings,
+                strategy)
+        self.maxAccumulators = maxAccumulators
+        self.maxPostings = maxPostings
+        self.budgetStrategy = strategy
+        # the cached results were scored with other budgets
+        self.resultCache.clear()
+
+    def isApproximate(self):
+        """
+        return: True if processQuery gets approximate rankings, that may
+        differ from the exact ones, False otherwise.
+        """
+        return self.scoring == IMPACT_SCORING and bool(self.maxAccumulators
+                or self.maxPostings)
+
+    def importIndex(self, path):
+        """
+        Loads the self.documents and self.invertedIndex dicts data from a
+        human readable file created with the self.exportIndex method.
 
         If it fails to open the file the exception is not handled.
 
@@ -188,121 +826,1118 @@ class SearchEngine(object):
         """
         print ("Loading index from the file: {}".format(path))
         fin = open(path)
+        stats = self.stats
+        # the regex matching and the literal_eval of the posting lists are
+        # timed line by line, only when the stats are enabled
+        clock = time.time if stats.enabled else int
+        regexTime = 0
+        evalTime = 0
 
         # regex for parsing the self.documents
+        documents = dict(self.documents.iteritems())
         docRegex = re.compile(r"(?P<id>\d+);(?P<year>\d+);(?P<title>.+);(?P<authors>.+)?;(?P<norm>.+)")
         # parsing the documents data
         for line in fin:
             line = line.strip()
             # if there's something in the line it must be data about a document
             if line:
+                if line.startswith(RAW_FREQUENCIES_COMMENT):
+                    self.rawFrequencies = True
+                    name = line[len(RAW_FREQUENCIES_COMMENT):]
+                    self.weighting = WEIGHTINGS[name]
+                if line.startswith(NORMALIZER_COMMENT):
+                    self.parser.setNormalizer(line[len(NORMALIZER_COMMENT):])
                 # if the line starts with a # ignore it
                 if not line.startswith("#"):
+                    start = clock()
                     match = docRegex.match(line)
+                    regexTime += clock() - start
                     docId = int(match.group("id"))
                     year = match.group("year")
                     title = match.group("title")
                     authors = match.group("authors")
                     norm = float(match.group("norm"))
 
-                    self.documents[docId] = Document(docId, year, title, authors, norm)
+                    documents[docId] = Document(docId, year, title, authors, norm)
             # if there's an empty line the documents part have ended
             else:
                 break
 
         # regex for parsing the self.invertedIndex
+        invertedIndex = self.invertedIndex.toDict()
         indexRegex = re.compile(r"(?P<word>.+);(?P<idf>.+);(?P<lst>.+)")
         # parsing the inverted index data
         for line in fin:
             line = line.strip()
             if not line.startswith("#"):
+                start = clock()
                 match = indexRegex.match(line)
+                middle = clock()
                 word = match.group("word")
                 idf = float(match.group("idf"))
-                lst = ast.literal_eval(match.group("lst"))
+                pairs = ast.literal_eval(match.group("lst"))
+                evalTime += clock() - middle
+                regexTime += middle - start
+                lst = PostingList.fromPairs(pairs)
                 pair = (idf, lst)
-                self.invertedIndex[word] = pair
+                invertedIndex[word] = pair
+                stats.count("postingListsParsed")
         fin.close()
+        stats.addTime("regex", regexTime)
+        stats.addTime("literal_eval", evalTime)
+        with stats.timer("buildIndex"):
+            self.documents = DocumentStore.fromDocuments(documents.itervalues())
+            self.invertedIndex = InvertedIndex.fromDict(invertedIndex)
+            # neither are the fields
+            self.fieldIndex = None
+            # the upper bounds are not exported, they depend only on the
+            # weights and norms
+            self.calculateMaxScores()
+
+    def loadIndex(self, path):
+        """
+        Loads the self.documents and self.invertedIndex dicts data from a file
+        created with either the self.saveIndex or the self.exportIndex method.
+
+        A binary index is memory mapped, and self.documents and
+        self.invertedIndex become read only views of the file, so loading it
+        costs about the same as opening it. If it fails to open the file the
+        exception is not handled.
+
+        param path: string containing the path to file to load.
+        return: None.
+        """
+        with self.stats.timer("loadIndex"):
+            if IndexFile.isIndexFile(path):
+                print ("Loading index from the file: {}".format(path))
+                self.indexFile = IndexFile.IndexFile(path)
+                self.documents = self.indexFile.documents
+                self.invertedIndex = self.indexFile.invertedIndex
+                self.fieldIndex = self.indexFile.fieldIndex
+                self.rawFrequencies = self.indexFile.rawFrequencies
+                self.weighting = WEIGHTINGS[self.indexFile.weighting]
+                self.skipInterval = self.indexFile.skipInterval
+                self.shard = self.indexFile.shard
+                self.nShards = self.indexFile.nShards
+                # the words of the queries are normalized like the ones of the
+                # documents
+                self.parser.setNormalizer(self.indexFile.normalizer)
+            else:
+                self.importIndex(path)
+        self.indexChanged()
+
+    def indexChanged(self):
+        """
+        Drop the data structures derived from self.documents and
+        self.invertedIndex. Must be called whenever they change.
+
+        return: None
+        """
+        self.vectorScorer = None
+        self.impactScorer = None
+        self.resultCache.clear()
+
+    def setWeighting(self, name):
+        """
+        Choose the weighting of the words in the documents and queries, one of
+        Weighting.WEIGHTINGS.
 
-    def processQuery(self, query, K=10, evaluate=False):
+        Only an index with raw frequencies in the posting lists can change its
+        weighting, in which case the idfs and norms are calculated again
+        before the index is used, without touching the posting lists. An
+        index with tf-idf weights raises a ValueError for any weighting but
+        the default one.
+
+        param name: string containing the name of the weighting.
+        return: None
+        """
+        if name not in WEIGHTINGS:
+            raise ValueError("Unknown weighting: {}".format(name))
+        if name == self.weighting.name:
+            return
+        if not self.rawFrequencies and self.documents:
+            raise ValueError("Only indexes with raw frequencies can use the weighting: {}"
+                    .format(name))
+        if self.nShards > 1:
+            raise ValueError("The shards must be created again to use the weighting: {}"
+                    .format(name))
+        self.weighting = WEIGHTINGS[name]
+        if self.documents:
+            # the norms of a mapped index can't be changed in place
+            self.unmapIndex()
+            self.statsOutdated = True
+
+    def setNormalizer(self, name):
+        """
+        Choose the normalization of the words of the documents and queries,
+        one of Normalizer.NORMALIZERS, like stemming. Applied when the index
+        is created, and to the words of every query.
+
+        The normalizer of an index is saved with it, and chosen again when
+        the index is loaded. Changing the normalizer of an index means
+        creating it again, so it raises a ValueError if the index has
+        documents.
+
+        param name: string containing the name of the normalizer.
+        return: None
+        """
+        if name not in NORMALIZERS:
+            raise ValueError("Unknown normalizer: {}".format(name))
+        if name == self.parser.normalizer.name:
+            return
+        if self.documents:
+            raise ValueError("The index must be created again to use the normalizer: {}"
+                    .format(name))
+        self.parser.setNormalizer(name)
+
+    def setScoring(self, scoring):
+        """
+        Choose the way processQuery scores the documents:
+            ACCUMULATORS_SCORING: similarities are accumulated in a dict, one
+            posting at a time, and the top K are kept in a heap.
+            NUMPY_SCORING: similarities are accumulated in numpy arrays, see
+            the VectorScorer class. Needs numpy to be installed.
+            MAXSCORE_SCORING: the posting lists are traversed document at a
+            time, skipping the documents that can't enter the top K, see the
+            scoreMaxScore method.
+            DAAT_SCORING: the posting lists are traversed document at a
+            time, and each document is scored at once, see the
+            scoreDocumentAtATime method. Uses less memory than the
+            accumulators on queries that match many documents.
+            IMPACT_SCORING: the posting lists are traversed score at a time,
+            in decrescent impact, see the ImpactScorer class. With the
+            budgets of the setBudget method the rankings are approximate.
+
+        param scoring: one of SCORINGS.
+        return: None
+        """
+        if scoring not in SCORINGS:
+            raise ValueError("Unknown scoring: {}".format(scoring))
+        if scoring == NUMPY_SCORING:
+            # fail early if numpy is not installed
+            VectorScorer.checkAvailable()
+        # the rankings of the approximate scoring differ from the exact ones
+        if IMPACT_SCORING in (scoring, getattr(self, "scoring", None)):
+            self.resultCache.clear()
+        self.scoring = scoring
+
+    def processQuery(self, query, K=10, evaluate=False, stats=None):
         """
         Given an util.Query object returns the top K documents most similar
         according to the vector model, and evaluation results if param evaluate
         is True.
 
+        The documents are scored with the method chosen with setScoring, all
+        of them return the same ranking. The queries with phrases, NEAR,
+        Boolean or field:term operators, see QueryLanguage.parseQuery, are
+        scored with scoreConstrained. The results of recent queries with the
+        same words, frequencies and operators are taken from
+        self.resultCache.
+
         param query: util.Query object.
         param K: get the K most similar documents.
         param evaluate: whether or not to evaluate the results of the query.
+        param stats: a Stats.Stats object that collects the timers and
+        counters of the stages of this query only, like the tokenization or
+        the traversal of the posting lists. They are also added to
+        self.stats, if it's enabled.
         return: a pair (results, evalResulst), where results is a list of
         tuples (similarity, util.Document) ordered in decrescent similarity,
         and evalResults is a dict with data on the evaluation.
         """
-        words = self.parser.tokenize(query.queryString)
-        qCounter = Counter(words)
+        self.refresh()
+        stats = self.beginQueryStats(stats)
+        stats.count("queries")
+        with stats.timer("tokenize"):
+            words, constraints = self.tokenizeQuery(query.queryString)
+            qCounter = Counter(words)
+
+        key = ResultCache.makeKey(qCounter, K, constraints)
+        result = self.resultCache.get(key)
+        if result is None:
+            with stats.timer("score"):
+                if constraints:
+                    result = self.scoreConstrained(qCounter, constraints, K)
+                elif self.scoring == NUMPY_SCORING:
+                    result = self.getVectorScorer().score(qCounter, K)
+                elif self.scoring == MAXSCORE_SCORING:
+                    result = self.scoreMaxScore(qCounter, K)
+                elif self.scoring == DAAT_SCORING:
+                    result = self.scoreDocumentAtATime(qCounter, K)
+                elif self.scoring == IMPACT_SCORING:
+                    result = self.getImpactScorer().score(qCounter, K, stats)
+                else:
+                    result = self.scoreAccumulators(qCounter, K)
+            self.resultCache.put(key, result)
+        else:
+            stats.count("cacheHits")
 
+        evalResults = None
+        # if the param evaluate is True we evaluate the results
+        if evaluate:
+            with stats.timer("evaluate"):
+                evalResults = self.evaluateResults(query, result)
+
+        self.endQueryStats()
+        return result, evalResults
+
+    def tokenizeQuery(self, queryString):
+        """
+        Tokenize a query. The plain queries are tokenized like the documents,
+        and only the ones with quotes, NEAR, Boolean or field:term operators
+        are parsed by QueryLanguage.parseQuery. The phrases and NEAR
+        operators are only parsed if the index has positions, and the Boolean
+        and field:term operators if it has fields, otherwise they are plain
+        words.
+
+        param queryString: string containing the query.
+        return: a tuple (words, constraints), see QueryLanguage.parseQuery.
+        """
+        positional = self.invertedIndex.hasPositions()
+        boolean = self.fieldIndex is not None
+        if hasOperators(queryString, positional, boolean):
+            return parseQuery(self.parser, queryString, positional, boolean)
+        return self.parser.tokenize(queryString), ()
+
+    def processQueries(self, queries, K=10, evaluate=False, batchSize=256):
+        """
+        Batch version of processQuery. The queries are scored together in
+        batches, each posting list is read once per batch, no matter how many
+        queries of the batch share the word. With MAXSCORE_SCORING,
+        DAAT_SCORING and IMPACT_SCORING the queries are scored one at a time,
+        since they walk the posting lists of each query in parallel, and so
+        are the queries with operators, see processQuery. Queries found in
+        self.resultCache are not scored again.
+
+        The rankings are the same ones returned by processQuery for each
+        query.
+
+        param queries: an iterable of util.Query objects.
+        param K: get the K most similar documents for each query.
+        param evaluate: whether or not to evaluate the results of the queries.
+        param batchSize: maximum amount of queries scored together, bounds
+        the memory used by the numpy scoring.
+        return: a list with a pair (results, evalResults) for each query, in
+        the order of the param queries. See processQuery.
+        """
+        self.refresh()
+        stats = self.stats
+        queries = list(queries)
+        stats.count("queries", len(queries))
+        answers = []
+        for start in xrange(0, len(queries), batchSize):
+            batch = queries[start:start + batchSize]
+
+            # gather the queries in which each word of the batch appears,
+            # leaving out the queries in the cache
+            results = []
+            termQueries = {}
+            qCounters = []
+            keys = []
+            # the queries with operators
+            constrained = []
+            with stats.timer("tokenize"):
+                for query in batch:
+                    words, constraints = self.tokenizeQuery(query.queryString)
+                    qCounter = Counter(words)
+                    key = ResultCache.makeKey(qCounter, K, constraints)
+                    result = self.resultCache.get(key)
+                    results.append(result)
+                    if result is not None:
+                        continue
+                    if constraints:
+                        constrained.append((len(results) - 1, qCounter,
+                                constraints, key))
+                        continue
+                    for word, freq in qCounter.iteritems():
+                        termQueries.setdefault(word, []).append((len(qCounters), freq))
+                    qCounters.append(qCounter)
+                    keys.append(key)
+
+            stats.count("cacheHits",
+                    len(batch) - len(qCounters) - len(constrained))
+            with stats.timer("score"):
+                for iii, qCounter, constraints, key in constrained:
+                    results[iii] = self.scoreConstrained(qCounter, constraints,
+                            K)
+                    self.resultCache.put(key, results[iii])
+                if self.scoring == MAXSCORE_SCORING:
+                    scored = [self.scoreMaxScore(qCounter, K)
+                            for qCounter in qCounters]
+                elif self.scoring == DAAT_SCORING:
+                    scored = [self.scoreDocumentAtATime(qCounter, K)
+                            for qCounter in qCounters]
+                elif self.scoring == IMPACT_SCORING:
+                    scorer = self.getImpactScorer()
+                    scored = [scorer.score(qCounter, K, stats)
+                            for qCounter in qCounters]
+                elif self.scoring == NUMPY_SCORING:
+                    scored = self.getVectorScorer().scoreBatch(termQueries,
+                            len(qCounters), K)
+                else:
+                    scored = self.scoreAccumulatorsBatch(termQueries,
+                            len(qCounters), K)
+
+            # the scored queries fill the gaps left by the cached ones
+            scored = iter(zip(keys, scored))
+            for iii, result in enumerate(results):
+                if result is None:
+                    key, result = next(scored)
+                    self.resultCache.put(key, result)
+                    results[iii] = result
+
+            for query, result in zip(batch, results):
+                evalResults = None
+                if evaluate:
+                    with stats.timer("evaluate"):
+                        evalResults = self.evaluateResults(query, result)
+                answers.append((result, evalResults))
+        return answers
+
+    def processQueriesParallel(self, queries, K=10, evaluate=False, jobs=2,
+            batch=False):
+        """
+        Process the queries in a pool of processes, in chunks. The processes
+        are forked with a copy of the search engine, so a memory mapped index
+        is shared by all of them instead of being sent to each one, and each
+        process has its own result cache.
+
+        The rankings and evaluations are the same ones of processQuery.
+
+        param queries: an iterable of util.Query objects.
+        param K: get the K most similar documents for each query.
+        param evaluate: whether or not to evaluate the results of the queries.
+        param jobs: the amount of processes.
+        param batch: whether or not to score the queries of each chunk
+        together with processQueries.
+        return: a list with a tuple (results, evalResults, time) for each
+        query, in the order of the param queries, where time is the seconds
+        it took to process the query. See processQuery.
+        """
+        global workerEngine
+        # the index is brought up to date once, before it's inherited
+        self.refresh()
+        queries = list(queries)
+        if not queries:
+            return []
+        # a few chunks per process, so the processes finish at about the same
+        # time even if some queries are slower than others
+        size = -(-len(queries) // (4 * jobs))
+        tasks = [(queries[start:start + size], K, evaluate, batch)
+                for start in xrange(0, len(queries), size)]
+        answers = []
+        workerEngine = self
+        pool = multiprocessing.Pool(jobs)
+        try:
+            for chunk in pool.imap(processQueryChunk, tasks):
+                answers.extend(chunk)
+            pool.close()
+        finally:
+            workerEngine = None
+            pool.terminate()
+            pool.join()
+        return answers
+
+    def scoreAccumulatorsBatch(self, termQueries, nQueries, K):
+        """
+        Batch version of scoreAccumulators, each posting list is read once
+        and its postings are added to the accumulators of every query of the
+        batch with the word.
+
+        param termQueries: a dict with word keys, and lists of (query index,
+        frequency of the word in the query) as values.
+        param nQueries: the amount of queries in the batch.
+        param K: get the K most similar documents.
+        return: a list with the results of each query, the results are lists
+        of tuples (similarity, util.Document) ordered in decrescent similarity.
+        """
+        accumulatorsLst = [{} for iii in xrange(nQueries)]
+        # sorted like in scoreAccumulators, so the similarities are summed in
+        # the same order
+        stats = self.queryStats
+        postings = 0
+        with stats.timer("traverse"):
+            for word in sorted(termQueries.iterkeys()):
+                termId = self.invertedIndex.termId(word)
+                if termId < 0:
+                    self.missingWord(word)
+                    continue
+                idf = self.invertedIndex.idf(termId)
+                lst = self.invertedIndex.postingList(termId)
+                postings += len(lst)
+                targets = [(accumulatorsLst[iii], self.queryWeight(freq, idf))
+                        for iii, freq in termQueries[word]]
+                for docId, weight in self.documentWeights(lst):
+                    for accumulators, qWeight in targets:
+                        accumulators[docId] = accumulators.get(docId, 0) + weight * qWeight
+        stats.count("postingsScanned", postings)
+        stats.count("accumulators", sum(len(accumulators)
+            for accumulators in accumulatorsLst))
+
+        return [self.selectTopK(accumulators, K)
+                for accumulators in accumulatorsLst]
+
+    def scoreAccumulators(self, qCounter, K):
+        """
+        Get the top K documents most similar to a query, accumulating the
+        similarities in a dict, one posting at a time.
+
+        param qCounter: a collections.Counter with the frequency of the words
+        of the query.
+        param K: get the K most similar documents.
+        return: a list of tuples (similarity, util.Document) ordered in
+        decrescent similarity.
+        """
         accumulators = {}
+        # the words are visited in sorted order, so the similarities are
+        # summed in the same order by every scoring method, and by the batches
+        # of processQueries
+        stats = self.queryStats
+        postings = 0
+        with stats.timer("traverse"):
+            for word in sorted(qCounter.iterkeys()):
+                # in the case a word in the query doesn't exist in the inverted
+                # index the word in the query is ignored
+                termId = self.invertedIndex.termId(word)
+                if termId < 0:
+                    self.missingWord(word)
+                    continue
+                idf = self.invertedIndex.idf(termId)
+                lst = self.invertedIndex.postingList(termId)
+                postings += len(lst)
+                qWeight = self.queryWeight(qCounter[word], idf)
+                for pair in self.documentWeights(lst):
+                    docId, weight = pair
+                    partialAcc = accumulators.get(docId, 0)
+                    partialAcc += weight * qWeight
+                    accumulators[docId] = partialAcc
+        stats.count("postingsScanned", postings)
+        stats.count("accumulators", len(accumulators))
 
-        for word in qCounter.iterkeys():
-            # in the case a word in the query doesn't exist in the inverted
-            # index the word in the query is ignored
-            try:
-                idf, lst  = self.invertedIndex[word]
-            except KeyError:
-                print("[*] The word '{}' doesn't exist in the inverted index and will be ignored.".format(word))
+        return self.selectTopK(accumulators, K)
+
+    def scoreConstrained(self, qCounter, constraints, K):
+        """
+        Get the top K documents most similar to a query with phrases, NEAR,
+        Boolean or field:term operators. The documents that match every
+        constraint are found first, and only they are scored, with the same
+        similarities of scoreAccumulators. Like in a plain query, only the
+        documents with some word of the query are ranked, so the queries
+        that only have NOT, author or year operators get no results.
+
+        Raises a ValueError if the index has no positions, and the query has
+        phrases or NEAR operators, or if it has no fields, and the query has
+        field:term operators.
+
+        param qCounter: a collections.Counter with the frequency of the words
+        of the query.
+        param constraints: a tuple with the Phrase, Near, Term, And, Or and
+        Not objects of the query, see QueryLanguage.parseQuery.
+        param K: get the K most similar documents.
+        return: a list of tuples (similarity, util.Document) ordered in
+        decrescent similarity.
+        """
+        stats = self.queryStats
+        candidates = None
+        with stats.timer("match"):
+            for constraint in constraints:
+                candidates = self.matchBoolean(constraint, candidates)
+                if not candidates:
+                    break
+        stats.count("candidates", len(candidates))
+        return self.scoreCandidates(qCounter, candidates, K)
+
+    def matchBoolean(self, constraint, candidates=None):
+        """
+        Find the documents that match a Boolean expression. The operands of
+        an And object are matched from the one with the fewest documents to
+        the one with the most, each one only among the documents matched by
+        the ones before it, so the common words cost about as much as the
+        rare ones. The posting lists are intersected galloping over the
+        longer lists, see Postings.intersect, or with their skip pointers.
+
+        param constraint: a Term, Phrase, Near, And, Or or Not object, see
+        QueryLanguage.parseQuery.
+        param candidates: a sorted list with the docIDs of the documents
+        searched, or None to search all of them.
+        return: a sorted list with the docIDs of the documents that match.
+        """
+        if isinstance(constraint, Term):
+            return self.matchTerm(constraint, candidates)
+        if isinstance(constraint, (Phrase, Near)):
+            if not self.invertedIndex.hasPositions():
+                raise ValueError("The index has no positions, please create it with the -ps option to use phrases and NEAR operators")
+            return sorted(self.matchConstraint(constraint, candidates))
+        if isinstance(constraint, Not):
+            excluded = set(self.matchBoolean(constraint.operand, candidates))
+            if candidates is None:
+                candidates = self.documents.docIds
+            return [docId for docId in candidates if docId not in excluded]
+        if isinstance(constraint, Or):
+            matched = set()
+            for operand in constraint.operands:
+                matched.update(self.matchBoolean(operand, candidates))
+            return sorted(matched)
+        # the words joined by nothing only rank the documents, and the
+        # operands after NOT operators are matched last, they only remove
+        # documents
+        operands = sorted((operand for operand in constraint.operands
+                if not isinstance(operand, Text)), key=lambda operand:
+                (isinstance(operand, Not), self.estimateMatches(operand)))
+        for operand in operands:
+            candidates = self.matchBoolean(operand, candidates)
+            if not candidates:
+                return []
+        return candidates
+
+    def matchTerm(self, term, candidates=None):
+        """
+        Find the documents that have a word, or a term of a field.
+
+        Raises a ValueError if the term is of a field, and the index has no
+        fields.
+
+        param term: a QueryLanguage.Term object.
+        param candidates: a sorted list with the docIDs of the documents
+        searched, or None to search all of them.
+        return: a sorted list with the docIDs of the documents that have the
+        term.
+        """
+        index, termId = self.lookupTerm(term)
+        if termId < 0:
+            return []
+        lst = index.postingList(termId)
+        if candidates is None:
+            return list(lst.docIds())
+        if lst.skips is None:
+            return intersect(candidates, array.array("i", lst.docIds()))
+        # the skip pointers jump over the postings between the candidates
+        cursor = PostingCursor(lst)
+        matched = []
+        for docId in candidates:
+            cursor.advance(docId)
+            if cursor.docId == END_OF_LIST:
+                break
+            if cursor.docId == docId:
+                matched.append(docId)
+        return matched
+
+    def lookupTerm(self, term):
+        """
+        param term: a QueryLanguage.Term object.
+        return: a tuple (index, termId), the index of the term,
+        self.invertedIndex or self.fieldIndex, and its term ID there, -1 if
+        it's not in the index.
+        """
+        if term.field is None:
+            index = self.invertedIndex
+            key = term.word
+        else:
+            if self.fieldIndex is None:
+                raise ValueError("The index has no fields, please create it with the -fd option to use field:term operators")
+            index = self.fieldIndex
+            key = fieldKey(term.field, term.word)
+        return index, index.termId(key)
+
+    def estimateMatches(self, constraint):
+        """
+        Estimate the amount of documents that match a Boolean expression,
+        from the lengths of the posting lists of its words, without reading
+        the positions. See the matchBoolean method.
+
+        param constraint: a Term, Phrase, Near, And, Or or Not object.
+        return: an upper bound of the amount of documents.
+        """
+        if isinstance(constraint, Term):
+            index, termId = self.lookupTerm(constraint)
+            return 0 if termId < 0 else index.documentFrequency(termId)
+        if isinstance(constraint, Phrase):
+            return min(self.estimateMatches(Term(None, word))
+                    for word in constraint.words)
+        if isinstance(constraint, Near):
+            return min(self.estimateMatches(constraint.left),
+                    self.estimateMatches(constraint.right))
+        if isinstance(constraint, And):
+            return min(self.estimateMatches(operand)
+                    for operand in constraint.operands
+                    if not isinstance(operand, Text))
+        if isinstance(constraint, Or):
+            return sum(self.estimateMatches(operand)
+                    for operand in constraint.operands)
+        return len(self.documents)
+
+    def matchConstraint(self, constraint, candidates=None):
+        """
+        Find the documents that match a phrase or a NEAR operator, and where.
+
+        param constraint: a QueryLanguage.Phrase or QueryLanguage.Near object.
+        param candidates: a sorted list with the docIDs of the documents
+        searched, or None to search all of them.
+        return: a dict with docID keys, and lists of tuples (first position,
+        last position) of the matches in the document as values.
+        """
+        if not isinstance(constraint, Near):
+            return self.matchPhrase(constraint, candidates)
+        left = self.matchConstraint(constraint.left, candidates)
+        if not left:
+            return {}
+        right = self.matchConstraint(constraint.right, sorted(left))
+        distance = constraint.distance
+        matches = {}
+        for docId, rightSpans in right.iteritems():
+            spans = []
+            for leftStart, leftEnd in left[docId]:
+                for rightStart, rightEnd in rightSpans:
+                    # each operand must match different occurrences of the
+                    # words, so overlapping spans don't count
+                    if leftStart <= rightEnd and rightStart <= leftEnd:
+                        continue
+                    # the operands may come in any order
+                    if max(rightStart - leftEnd, leftStart - rightEnd) <= distance:
+                        spans.append((min(leftStart, rightStart),
+                                max(leftEnd, rightEnd)))
+            if spans:
+                matches[docId] = spans
+        return matches
+
+    def matchPhrase(self, phrase, candidates=None):
+        """
+        Find the documents that have the words of a phrase at the right
+        offsets. The posting lists of the words are intersected from the
+        rarest to the most common one, galloping over the longer lists, see
+        Postings.gallop, and the positions are decoded only for the
+        documents that have all the words.
+
+        param phrase: a QueryLanguage.Phrase object.
+        param candidates: a sorted list with the docIDs of the documents
+        searched, or None to search all of them.
+        return: a dict with docID keys, and lists of tuples (first position,
+        last position) of the phrase in the document as values.
+        """
+        # the offsets of each term of the phrase, a word may appear more than
+        # once
+        offsets = {}
+        for word, offset in zip(phrase.words, phrase.offsets):
+            termId = self.invertedIndex.termId(word)
+            if termId < 0:
+                return {}
+            offsets.setdefault(termId, []).append(offset)
+        terms = sorted((self.invertedIndex.documentFrequency(termId), termId)
+                for termId in offsets)
+
+        # the docIDs that have all the terms seen so far, and the index of
+        # each one in the posting list of each term
+        matched = candidates
+        indexes = []
+        for length, termId in terms:
+            docIds = array.array("i",
+                    self.invertedIndex.postingList(termId).docIds())
+            if matched is None:
+                matched = docIds
+                indexes.append(range(len(docIds)))
+                continue
+            keep = []
+            keepIndexes = []
+            iii = 0
+            for row, docId in enumerate(matched):
+                iii = gallop(docIds, docId, iii)
+                if iii == len(docIds):
+                    break
+                if docIds[iii] == docId:
+                    keep.append(row)
+                    keepIndexes.append(iii)
+            matched = [matched[row] for row in keep]
+            indexes = [[lst[row] for row in keep] for lst in indexes]
+            indexes.append(keepIndexes)
+            if not matched:
+                return {}
+
+        # the first position of the phrase must be the same for every term
+        starts = [None] * len(matched)
+        for (length, termId), termIndexes in zip(terms, indexes):
+            positions = positionsAt(self.invertedIndex.positionData(termId),
+                    termIndexes)
+            for row, lst in enumerate(positions):
+                for offset in offsets[termId]:
+                    if starts[row] is None:
+                        starts[row] = set(position - offset
+                                for position in lst)
+                    elif starts[row]:
+                        starts[row].intersection_update(position - offset
+                                for position in lst)
+        length = phrase.offsets[-1]
+        return dict((docId, [(start, start + length)
+                for start in sorted(rowStarts)])
+                for docId, rowStarts in zip(matched, starts) if rowStarts)
+
+    def scoreCandidates(self, qCounter, candidates, K):
+        """
+        Get the top K documents most similar to a query, among some
+        candidates. The posting lists are advanced to each candidate, and the
+        similarities are summed in the same order of scoreAccumulators.
+
+        param qCounter: a collections.Counter with the frequency of the words
+        of the query.
+        param candidates: a sorted list with the docIDs of the documents
+        scored.
+        param K: get the K most similar documents.
+        return: a list of tuples (similarity, util.Document) ordered in
+        decrescent similarity.
+        """
+        accumulators = {}
+        stats = self.queryStats
+        with stats.timer("traverse"):
+            for word in sorted(qCounter.iterkeys()):
+                termId = self.invertedIndex.termId(word)
+                if termId < 0:
+                    self.missingWord(word)
+                    continue
+                idf = self.invertedIndex.idf(termId)
+                lst = self.invertedIndex.postingList(termId)
+                qWeight = self.queryWeight(qCounter[word], idf)
+                cursor = PostingCursor(self.documentWeights(lst))
+                for docId in candidates:
+                    cursor.advance(docId)
+                    if cursor.docId == END_OF_LIST:
+                        break
+                    if cursor.docId == docId:
+                        partialAcc = accumulators.get(docId, 0)
+                        partialAcc += cursor.weight * qWeight
+                        accumulators[docId] = partialAcc
+        stats.count("accumulators", len(accumulators))
+
+        return self.selectTopK(accumulators, K)
+
+    def scoreDocumentAtATime(self, qCounter, K):
+        """
+        Get the top K documents most similar to a query, walking the posting
+        lists of the query in parallel, in increasing docID order. Each
+        document is scored at once and offered to the heap of the top K, so
+        only K similarities are kept in memory, instead of one accumulator
+        per document that shares a word with the query, like in
+        scoreAccumulators.
+
+        The ranking is the same one of scoreAccumulators.
+
+        param qCounter: a collections.Counter with the frequency of the words
+        of the query.
+        param K: get the K most similar documents.
+        return: a list of tuples (similarity, util.Document) ordered in
+        decrescent similarity.
+        """
+        if K <= 0:
+            return []
+
+        stats = self.queryStats
+        postings = 0
+        # a (weight of the word in the query, cursor) tuple for each word of
+        # the query, sorted by word so the similarities are summed in the
+        # same order of scoreAccumulators
+        terms = []
+        for word in sorted(qCounter.iterkeys()):
+            termId = self.invertedIndex.termId(word)
+            if termId < 0:
+                self.missingWord(word)
+                continue
+            idf = self.invertedIndex.idf(termId)
+            lst = self.invertedIndex.postingList(termId)
+            qWeight = self.queryWeight(qCounter[word], idf)
+            terms.append((qWeight, PostingCursor(self.documentWeights(lst))))
+            postings += len(lst)
+
+        norms = self.documents.norms
+        rows = self.documents.rows()
+        heap = [] # min heap to keep the top K similarities
+        heapOperations = 0
+        docId = min([cursor.docId for qWeight, cursor in terms] or [END_OF_LIST])
+        # the similarities are summed and selected in the same pass
+        with stats.timer("traverse"):
+            while docId != END_OF_LIST:
+                # sum the weights of the document, while looking for the next
+                # one, the smallest docID of the cursors
+                acc = 0
+                nextDocId = END_OF_LIST
+                for qWeight, cursor in terms:
+                    if cursor.docId == docId:
+                        acc += cursor.weight * qWeight
+                        cursor.next()
+                    if cursor.docId < nextDocId:
+                        nextDocId = cursor.docId
+
+                acc = acc / norms[rows[docId]]
+                # same heap of selectTopK
+                if len(heap) < K:
+                    heapq.heappush(heap, (acc, docId))
+                    heapOperations += 1
+                elif (acc, docId) > heap[0]:
+                    heapq.heapreplace(heap, (acc, docId))
+                    heapOperations += 1
+                docId = nextDocId
+        stats.count("postingsScanned", postings)
+        stats.count("heapOperations", heapOperations)
+
+        return self.popResults(heap)
+
+    def scoreMaxScore(self, qCounter, K):
+        """
+        Get the top K documents most similar to a query, with the MaxScore
+        dynamic pruning.
+
+        The posting lists are traversed document at a time, in increasing
+        docID order. Each word has an upper bound on its contribution to a
+        similarity, the weight of the word in the query times its upper bound
+        in self.invertedIndex. Once the heap has K documents, the words whose bounds
+        added together can't reach the smallest similarity of the heap are
+        non essential: a document that appears only in their lists can't
+        enter the top K, so only the lists of the other words are walked to
+        find candidates. The non essential lists are used to complete the
+        similarity of a candidate, and the candidate is dropped as soon as
+        its partial similarity plus the bounds of the remaining lists falls
+        below the heap.
+
+        The similarities of the candidates are summed in the sorted order of
+        the words, just like in scoreAccumulators, so the ranking is exactly
+        the same one.
+
+        param qCounter: a collections.Counter with the frequency of the words
+        of the query.
+        param K: get the K most similar documents.
+        return: a list of tuples (similarity, util.Document) ordered in
+        decrescent similarity.
+        """
+        if K <= 0:
+            return []
+
+        stats = self.queryStats
+        # a (bound, term ID, weight of the word in the query, cursor) tuple
+        # for each word of the query. The term IDs follow the order of the
+        # words
+        terms = []
+        for word in sorted(qCounter.iterkeys()):
+            termId = self.invertedIndex.termId(word)
+            if termId < 0:
+                self.missingWord(word)
                 continue
-            qCounter[word] = qCounter[word] * idf
-            for pair in lst:
-                docId, weight = pair
-                partialAcc = accumulators.get(docId, 0)
-                partialAcc += weight * qCounter[word]
-                accumulators[docId] = partialAcc
+            idf = self.invertedIndex.idf(termId)
+            lst = self.invertedIndex.postingList(termId)
+            qWeight = self.queryWeight(qCounter[word], idf)
+            cursor = PostingCursor(self.documentWeights(lst))
+            bound = qWeight * self.invertedIndex.maxScore(termId)
+            terms.append((bound, termId, qWeight, cursor))
+        # the words with smaller bounds are the first to become non essential
+        terms.sort(key=lambda term: term[0])
+        # bounds[iii] is the sum of the bounds of terms[:iii + 1]
+        bounds = []
+        total = 0
+        for term in terms:
+            total += term[0]
+            bounds.append(total)
+
+        norms = self.documents.norms
+        rows = self.documents.rows()
+        heap = [] # min heap to keep the top K similarities
+        threshold = 0
+        # terms[:essential] are the non essential words
+        essential = 0
+        essentialTerms = terms
+        # documents offered by the essential lists, and the ones dropped
+        # before being completed
+        candidates = 0
+        nPruned = 0
+        heapOperations = 0
+        docId = min([cursor.docId for bound, termId, qWeight, cursor in terms]
+                or [END_OF_LIST])
+        with stats.timer("traverse"):
+            while docId != END_OF_LIST:
+                # (term ID, weight * qWeight) of the words of the document, and the
+                # next candidate, the smallest docID of the essential lists
+                contributions = []
+                partialAcc = 0
+                nextDocId = END_OF_LIST
+                for bound, termId, qWeight, cursor in essentialTerms:
+                    if cursor.docId == docId:
+                        contribution = cursor.weight * qWeight
+                        contributions.append((termId, contribution))
+                        partialAcc += contribution
+                        cursor.next()
+                    if cursor.docId < nextDocId:
+                        nextDocId = cursor.docId
+                candidate = docId
+                docId = nextDocId
+                candidates += 1
+                norm = norms[rows[candidate]]
 
+                # complete the similarity with the non essential words, the ones
+                # with greater bounds first
+                pruned = False
+                for iii in xrange(essential - 1, -1, -1):
+                    if partialAcc / norm + bounds[iii] < threshold:
+                        pruned = True
+                        break
+                    bound, termId, qWeight, cursor = terms[iii]
+                    cursor.advance(candidate)
+                    if cursor.docId == candidate:
+                        contribution = cursor.weight * qWeight
+                        contributions.append((termId, contribution))
+                        partialAcc += contribution
+                if pruned:
+                    nPruned += 1
+                    continue
+
+                # sum again in the order of the words, see scoreAccumulators
+                contributions.sort()
+                acc = 0
+                for termId, contribution in contributions:
+                    acc += contribution
+                acc = acc / norm
+                # same heap of selectTopK
+                if len(heap) < K:
+                    heapq.heappush(heap, (acc, candidate))
+                    heapOperations += 1
+                elif (acc, candidate) > heap[0]:
+                    heapq.heapreplace(heap, (acc, candidate))
+                    heapOperations += 1
+                else:
+                    continue
+
+                if len(heap) == K:
+                    # the docIDs still to come are greater than the ones in the
+                    # heap, so a document with the smallest similarity of the
+                    # heap would still enter it, only smaller bounds are pruned
+                    threshold = heap[0][0] * (1 - PRUNING_TOLERANCE)
+                    if essential < len(terms) and bounds[essential] < threshold:
+                        while essential < len(terms) and bounds[essential] < threshold:
+                            essential += 1
+                        essentialTerms = terms[essential:]
+                        docId = min(cursor.docId for bound, termId, qWeight, cursor
+                                in essentialTerms) if essentialTerms else END_OF_LIST
+        stats.count("candidates", candidates)
+        stats.count("pruned", nPruned)
+        stats.count("heapOperations", heapOperations)
+
+        return self.popResults(heap)
+
+    def missingWord(self, word):
+        """
+        Called by the scoring methods for each word of a query that is not in
+        the index, and ignored.
+
+        param word: the word of the query.
+        return: None
+        """
+        if self.warnMissingWords:
+            print("[*] The word '{}' doesn't exist in the inverted index and will be ignored.".format(word))
+
+    def queryWeight(self, freq, idf):
+        """
+        Get the weight of a word in the query, the factor by which the weights
+        of its posting list are multiplied to get the similarities.
+
+        When the posting lists hold raw frequencies, the idf of the document
+        weights is also applied here, so the weights are never changed. See
+        the documentWeights method.
+
+        param freq: the frequency of the word in the query.
+        param idf: the idf of the word.
+        return: a number.
+        """
+        if self.rawFrequencies:
+            return self.weighting.tf(freq) * idf * idf
+        return freq * idf
+
+    def documentWeights(self, lst):
+        """
+        Get the posting list with the weights that are multiplied by the
+        weight of the word in the query. See the queryWeight method.
+
+        param lst: a Postings.PostingList of the self.invertedIndex.
+        return: lst itself if it holds tf-idf weights, otherwise a
+        Postings.PostingList with the tf of the frequencies, according to
+        self.weighting.
+        """
+        if self.rawFrequencies:
+            return self.weighting.documentWeights(lst)
+        return lst
+
+    def selectTopK(self, accumulators, K):
+        """
+        Normalize the accumulators by the norms of the documents, and get the
+        K greatest similarities.
+
+        param accumulators: a dict with docID keys and the dot product of the
+        query and the document as values.
+        param K: get the K most similar documents.
+        return: a list of tuples (similarity, util.Document) ordered in
+        decrescent similarity.
+        """
         # more efficient way of getting the top K similarities without having
         # to sort all the results
+        norms = self.documents.norms
+        rows = self.documents.rows()
         heap = [] # min heap to keep the top K similarities
-        for docId, acc in accumulators.iteritems():
-            doc = self.documents[docId]
-            # normalize the accumulator for the doc with the doc length, at
-            # this point acc holds the final similarity value with the query
-            acc = acc / doc.norm
-            # if the heap is not full, add the similarity regardless
-            if len(heap) < K:
-                heapq.heappush(heap, (acc, doc))
-            # the heap is full, but the current similarity is greater than the
-            # smallest similarity in the heap, so we pop the min heap to remove
-            # the smallest and add the current similarity to the top K
-            elif acc > heap[0][0]:
-                minAcc, minDoc = heapq.heappop(heap)
-                heapq.heappush(heap, (acc, doc))
-            # else the current similarity is smaller than the smallest
-            # similarity in the heap, so we ignore the current one
-            else:
-                continue
+        stats = self.queryStats
+        heapOperations = 0
+        # the normalization and the selection are timed together, they are
+        # done in the same pass over the accumulators
+        with stats.timer("select"):
+            for docId, acc in accumulators.iteritems():
+                # normalize the accumulator for the doc with the doc length, at
+                # this point acc holds the final similarity value with the query
+                acc = acc / norms[rows[docId]]
+                # if the heap is not full, add the similarity regardless
+                if len(heap) < K:
+                    heapq.heappush(heap, (acc, docId))
+                    heapOperations += 1
+                # the heap is full, but the current similarity is greater than the
+                # smallest similarity in the heap, so we pop the min heap to remove
+                # the smallest and add the current similarity to the top K. Ties
+                # are broken by the docID, so the ranking doesn't depend on the
+                # order of the accumulators
+                elif (acc, docId) > heap[0]:
+                    minAcc, minDocId = heapq.heappop(heap)
+                    heapq.heappush(heap, (acc, docId))
+                    heapOperations += 2
+                # else the current similarity is smaller than the smallest
+                # similarity in the heap, so we ignore the current one
+                else:
+                    continue
+        stats.count("heapOperations", heapOperations)
 
         #assert len(heap) == K, "len(heap) = {}".format(len(heap))
 
+        return self.popResults(heap)
+
+    def popResults(self, heap):
+        """
+        Empty a heap of the top K similarities into the ranking. Only the
+        documents of the ranking are built out of self.documents.
+
+        param heap: a min heap of (similarity, docID) tuples.
+        return: a list of tuples (similarity, util.Document) ordered in
+        decrescent similarity.
+        """
         # now we get the ordered ranking, from the heap, results will be a pair
         # of (similarity, util.Document)
         result = []
-        while heap:
-            pair = heapq.heappop(heap)
-            result.append(pair)
+        with self.queryStats.timer("results"):
+            while heap:
+                acc, docId = heapq.heappop(heap)
+                result.append((acc, self.documents[docId]))
 
         # reverse the results so that the document with greatest similarity is
         # at the top of the answer
         result.reverse()
 
-        evalResults = None
-        # if the param evaluate is True we evaluate the results
-        if evaluate:
-            evalResults = self.evaluateResults(query, result)
+        return result
 
-        return result, evalResults
-
-    def saveIndex(self, path):
+    def exportIndex(self, path):
         """
         Saves the self.documents and self.invertedIndex dicts, in a human
-        readable form to the specified path.
+        readable form to the specified path. The file can be read back with
+        the self.loadIndex method, but it's much slower to load than the one
+        written by the self.saveIndex method.
+
+        The text format doesn't keep the skip pointers of the posting lists.
 
         If it fails in opening the file the exception is not handled
 
@@ -310,8 +1945,13 @@ class SearchEngine(object):
         will be saved
         return: None
         """
-        print("Saving index in the file: {}.".format(path))
+        self.refresh()
+        print("Exporting index to the file: {}.".format(path))
         with open(path, "w") as fout:
+            if self.rawFrequencies:
+                fout.write(RAW_FREQUENCIES_COMMENT + self.weighting.name + "\n")
+            if self.parser.normalizer.name != DEFAULT_NORMALIZER:
+                fout.write(NORMALIZER_COMMENT + self.parser.normalizer.name + "\n")
             fout.write("# dados dos documentos\n# id;ano;titulo;autores;norma\n")
             for docID, doc in self.documents.iteritems():
                 fout.write("{};{};{};{};{}\n".format(doc.id, doc.year, doc.title, doc.authors, doc.norm))
@@ -319,7 +1959,101 @@ class SearchEngine(object):
             fout.write("\n# índice invertido\n# palavra;idf;listaInvertida(docID, peso)\n")
             for word, pair in self.invertedIndex.iteritems():
                 idf, lst = pair
-                fout.write("{};{};{}\n".format(word, idf, lst))
+                fout.write("{};{};{}\n".format(word, idf, list(lst)))
+
+    def saveIndex(self, path):
+        """
+        Saves the self.documents and self.invertedIndex dicts to the specified
+        path, in the binary format described in the IndexFile module.
+
+        If it fails in opening the file the exception is not handled
+
+        param path: string containing the path of the file in which the dicts
+        will be saved
+        return: None
+        """
+        self.refresh()
+        print("Saving index in the file: {}.".format(path))
+        IndexFile.writeIndex(path, self.documents, self.invertedIndex,
+                self.rawFrequencies, self.weighting.name, self.skipInterval,
+                self.parser.normalizer.name, self.shard, self.nShards,
+                self.fieldIndex)
+
+    def splitShards(self, nShards):
+        """
+        Partition the index in shards, each one with a range of docIDs with
+        about the same amount of documents, and the posting lists of the
+        words of its documents.
+
+        The idfs of the words, and the norms of the documents, are the ones
+        of the whole collection, so a query gets the same similarities from
+        the shards as from the whole index, see the ShardedIndex module. The
+        upper bounds of the words are the ones of each shard.
+
+        param nShards: the amount of shards.
+        return: a list of SearchEngine objects, one per shard.
+        """
+        self.refresh()
+        nDocs = len(self.documents)
+        # the first row and the first docID of each shard but the first one
+        bounds = [nDocs * iii // nShards for iii in xrange(1, nShards)]
+        firstDocIds = [self.documents.docIds[row] if row < nDocs
+                else sys.maxint for row in bounds]
+
+        documents = [[] for iii in xrange(nShards)]
+        for row, doc in enumerate(self.documents.itervalues()):
+            documents[bisect.bisect_right(bounds, row)].append(doc)
+        invertedIndexes = [{} for iii in xrange(nShards)]
+        # the positions of the postings are split along with them
+        positional = self.invertedIndex.hasPositions()
+        positions = [{} for iii in xrange(nShards)] if positional else None
+        for termId, word in enumerate(self.invertedIndex.iterkeys()):
+            idf = self.invertedIndex.idf(termId)
+            lst = self.invertedIndex.postingList(termId)
+            if positional:
+                entries = splitPositions(self.invertedIndex.positionData(termId))
+            for docId, weight in lst:
+                shard = bisect.bisect_right(firstDocIds, docId)
+                invertedIndex = invertedIndexes[shard]
+                if word not in invertedIndex:
+                    invertedIndex[word] = (idf, PostingList())
+                    if positional:
+                        positions[shard][word] = bytearray()
+                invertedIndex[word][1].append(docId, weight)
+                if positional:
+                    positions[shard][word] += next(entries)
+
+        # the postings of the fields are split like the ones of the words
+        fieldIndexes = None
+        if self.fieldIndex is not None:
+            fieldIndexes = [{} for iii in xrange(nShards)]
+            for word, pair in self.fieldIndex.iteritems():
+                idf, lst = pair
+                for docId, freq in lst:
+                    fieldIndex = fieldIndexes[
+                            bisect.bisect_right(firstDocIds, docId)]
+                    if word not in fieldIndex:
+                        fieldIndex[word] = (idf, PostingList())
+                    fieldIndex[word][1].append(docId, freq)
+
+        shards = []
+        for shard in xrange(nShards):
+            eng = SearchEngine(self.scoring, self.resultCache.maxSize)
+            eng.documents = DocumentStore.fromDocuments(documents[shard])
+            eng.invertedIndex = InvertedIndex.fromDict(invertedIndexes[shard],
+                    positions[shard] if positional else None)
+            if fieldIndexes is not None:
+                eng.fieldIndex = InvertedIndex.fromDict(fieldIndexes[shard])
+            eng.rawFrequencies = self.rawFrequencies
+            eng.weighting = self.weighting
+            eng.parser.setNormalizer(self.parser.normalizer.name)
+            eng.shard = shard
+            eng.nShards = nShards
+            eng.calculateMaxScores()
+            eng.skipInterval = self.skipInterval
+            eng.addSkipPointers()
+            shards.append(eng)
+        return shards
 
 if __name__ == '__main__':
     e = SearchEngine()
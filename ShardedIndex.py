@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from itertools import chain
+from QueryServer import scoreBatch
+from SearchEngine import SearchEngine
+import IndexFile
+import heapq
+import multiprocessing
+import signal
+
+# the search engine of each shard process of a ShardedSearchEngine
+shardEngine = None
+
+def initShard(path, scoring, cacheSize):
+    """
+    Initializer of the process of a shard, maps the index file of the shard.
+    """
+    global shardEngine
+    # the coordinator handles CTRL+C and terminates the shards
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    shardEngine = SearchEngine(scoring, cacheSize)
+    # most words are missing from some of the shards
+    shardEngine.warnMissingWords = False
+    shardEngine.loadIndex(path)
+
+def scoreShard(items):
+    """
+    Score a batch of queries in the process of a shard, see
+    QueryServer.scoreBatch.
+    """
+    return scoreBatch(shardEngine, items)
+
+def checkShards(paths):
+    """
+    Check that the files in the paths are all the shards of a collection, in
+    order.
+
+    Raises a ValueError if they are not, and doesn't handle the exceptions
+    raised when opening the files.
+
+    param paths: a list of strings containing the paths to the shards.
+    return: None
+    """
+    for iii, path in enumerate(paths):
+        indexFile = IndexFile.IndexFile(path)
+        shard, nShards = indexFile.shard, indexFile.nShards
+        indexFile.close()
+        if nShards != len(paths) or shard != iii:
+            raise ValueError("{} is the shard {} of {} shards, expected the shard {} of {}"
+                    .format(path, shard, nShards, iii, len(paths)))
+
+def mergeResults(shardResults, K):
+    """
+    Merge the top K documents of each shard into the global top K, ordered
+    by similarity and then docID, like the heaps of the SearchEngine.
+
+    param shardResults: a list with the results of each shard, lists of
+    tuples (similarity, util.Document).
+    param K: the size of the ranking.
+    return: a list of tuples (similarity, util.Document) ordered in
+    decrescent similarity.
+    """
+    return heapq.nlargest(K, chain(*shardResults),
+            key=lambda pair: (pair[0], pair[1].id))
+
+class ShardedSearchEngine(object):
+    """
+    Coordinator of the shards of a collection, created by
+    SearchEngine.splitShards. Each shard is mapped by its own process, the
+    queries are sent to every shard at the same time, and the top K of each
+    shard are merged into the global top K.
+
+    The idfs and norms of the shards are the ones of the whole collection,
+    so the similarities, and the rankings, are the same ones of a single
+    index. Its processQuery and processQueries methods mirror the ones of
+    SearchEngine.SearchEngine. The words of the queries that are not in the
+    collection are ignored without warnings.
+    """
+    def __init__(self, paths, scoring, cacheSize):
+        """
+        Constructor method. Checks the shards and starts their processes.
+
+        Raises a ValueError if the paths are not the shards of a collection,
+        and doesn't handle the exceptions raised when opening the files.
+
+        param paths: a list of strings containing the paths to the shards,
+        in order.
+        param scoring: the scoring of the shards, see SearchEngine.setScoring.
+        param cacheSize: maximum amount of query results kept in the cache of
+        each shard.
+        """
+        checkShards(paths)
+        self.paths = paths
+        self.pools = [multiprocessing.Pool(1, initShard,
+            (path, scoring, cacheSize)) for path in paths]
+
+    def close(self):
+        """
+        Terminate the processes of the shards.
+
+        return: None
+        """
+        for pool in self.pools:
+            pool.terminate()
+            pool.join()
+
+    def scatter(self, items):
+        """
+        Score queries in every shard at the same time, and merge their
+        results.
+
+        param items: a list of tuples (util.Query, K).
+        return: a list with the results of each query.
+        """
+        pending = [pool.apply_async(scoreShard, (items,))
+                for pool in self.pools]
+        shardResults = [result.get() for result in pending]
+        return [mergeResults([results[iii] for results in shardResults], K)
+                for iii, (query, K) in enumerate(items)]
+
+    def processQuery(self, query, K=10, evaluate=False):
+        """
+        See SearchEngine.processQuery.
+        """
+        return self.processQueries([query], K, evaluate)[0]
+
+    def processQueries(self, queries, K=10, evaluate=False):
+        """
+        See SearchEngine.processQueries, each shard scores the queries
+        together.
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        answers = []
+        for query, results in zip(queries,
+                self.scatter([(query, K) for query in queries])):
+            evalResults = None
+            if evaluate:
+                evalResults = SearchEngine.evaluateResults(query, results)
+            answers.append((results, evalResults))
+        return answers
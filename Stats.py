@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from time import time as getTime
+
+class StageTimer(object):
+    """
+    Context manager that adds the time spent in its block to a stage of a
+    Stats object.
+    """
+    __slots__ = ("stats", "stage", "start")
+
+    def __init__(self, stats, stage):
+        self.stats = stats
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = getTime()
+
+    def __exit__(self, *args):
+        self.stats.addTime(self.stage, getTime() - self.start)
+
+class NullTimer(object):
+    """
+    Context manager that does nothing, the timer of a disabled Stats.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+NULL_TIMER = NullTimer()
+
+class Stats(object):
+    """
+    Timers and counters of the stages of the search engine, like the
+    tokenization, the traversal of the posting lists and the selection of
+    the top K of a query, or the parsing of an exported index.
+
+    The timers hold the seconds spent in each stage, and the counters hold
+    amounts, like the postings scanned or the accumulators created. The
+    stages and counters are kept in the order they first appear.
+    """
+    enabled = True
+
+    def __init__(self):
+        """
+        Constructor method, all the timers and counters start empty.
+        """
+        self.timers = {}
+        self.counters = {}
+        self.timerOrder = []
+        self.counterOrder = []
+
+    def timer(self, stage):
+        """
+        param stage: the name of the stage.
+        return: a context manager that adds the time spent in its block to
+        the stage.
+        """
+        return StageTimer(self, stage)
+
+    def addTime(self, stage, seconds):
+        """
+        Add time to a stage.
+
+        param stage: the name of the stage.
+        param seconds: the time spent in the stage.
+        return: None
+        """
+        if stage not in self.timers:
+            self.timers[stage] = 0
+            self.timerOrder.append(stage)
+        self.timers[stage] += seconds
+
+    def count(self, name, amount=1):
+        """
+        Add an amount to a counter.
+
+        param name: the name of the counter.
+        param amount: the amount added.
+        return: None
+        """
+        if name not in self.counters:
+            self.counters[name] = 0
+            self.counterOrder.append(name)
+        self.counters[name] += amount
+
+    def merge(self, other):
+        """
+        Add the timers and counters of other Stats object to this one.
+
+        param other: a Stats object.
+        return: None
+        """
+        for stage in other.timerOrder:
+            self.addTime(stage, other.timers[stage])
+        for name in other.counterOrder:
+            self.count(name, other.counters[name])
+
+    def clear(self):
+        """
+        Empty all the timers and counters.
+
+        return: None
+        """
+        self.__init__()
+
+    def toDict(self):
+        """
+        return: a dict with the "timers" and "counters" dicts.
+        """
+        return {"timers": dict(self.timers), "counters": dict(self.counters)}
+
+    def format(self):
+        """
+        return: a string with one line per timer, in milliseconds, and per
+        counter.
+        """
+        lines = ["\t{}: {:.3f} ms".format(stage, 1000 * self.timers[stage])
+                for stage in self.timerOrder]
+        lines.extend("\t{}: {}".format(name, self.counters[name])
+                for name in self.counterOrder)
+        return "\n".join(lines)
+
+class NullStats(Stats):
+    """
+    A disabled Stats object, its timers and counters do nothing, so the
+    instrumented code costs about the same as without instrumentation.
+    """
+    enabled = False
+
+    def timer(self, stage):
+        return NULL_TIMER
+
+    def addTime(self, stage, seconds):
+        pass
+
+    def count(self, name, amount=1):
+        pass
+
+# the Stats of the search engines without instrumentation
+NULL_STATS = NullStats()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+# numpy is only needed by this scoring engine, so the rest of the search
+# engine keeps working without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class VectorScorer(object):
+    """
+    Scores queries with numpy arrays instead of python dicts. The posting
+    lists are converted to arrays of rows and weights the first time a word
+    is queried, where a row is the position of a document in the sorted
+    array of docIDs of the collection. The scores of a query are accumulated
+    in a dense array with one entry per document, normalized by an array with
+    the norms of the documents, and the top K are selected with
+    argpartition.
+    """
+    def __init__(self, documents, invertedIndex, queryWeight, documentWeights,
+            missingWord):
+        """
+        Constructor method.
+
+        param documents: the SearchEngine.documents of the index.
+        param invertedIndex: the SearchEngine.invertedIndex of the index.
+        param queryWeight: function that receives the frequency of a word in
+        the query and its idf, and returns the weight of the word in the
+        query. See SearchEngine.queryWeight.
+        param documentWeights: function that receives a posting list, and
+        returns the posting list with the weights that are multiplied by the
+        weight of the word in the query. See SearchEngine.documentWeights.
+        param missingWord: function called with each word of a query that is
+        not in the index. See SearchEngine.missingWord.
+        """
+        self.checkAvailable()
+        self.documents = documents
+        self.invertedIndex = invertedIndex
+        self.queryWeight = queryWeight
+        self.documentWeights = documentWeights
+        self.missingWord = missingWord
+
+        # the columns of the documents are already sorted by docID
+        self.docIds = np.frombuffer(documents.docIds, dtype=np.int32)
+        self.norms = np.frombuffer(documents.norms, dtype=np.float64)
+
+        # term ID keys and (idf, rows, weights) values
+        self.postings = {}
+
+    @staticmethod
+    def checkAvailable():
+        """
+        Raise an ImportError if numpy is not installed.
+
+        return: None
+        """
+        if np is None:
+            raise ImportError("The numpy scoring needs numpy to be installed")
+
+    def getPostings(self, termId):
+        """
+        Get the posting list of a term as numpy arrays.
+
+        param termId: the term ID of the word in the inverted index.
+        return: a tuple (idf, rows, weights), where rows and weights are numpy
+        arrays with the rows of the documents and the weights of the word in
+        them.
+        """
+        try:
+            return self.postings[termId]
+        except KeyError:
+            pass
+        idf = self.invertedIndex.idf(termId)
+        lst = self.documentWeights(self.invertedIndex.postingList(termId))
+        docIds = np.fromiter(lst.docIds(), dtype=np.int32, count=len(lst))
+        rows = np.searchsorted(self.docIds, docIds)
+        # the weights are summed as doubles, just like in the accumulators
+        weights = np.frombuffer(lst.weights, dtype=np.float32).astype(np.float64)
+        result = (idf, rows, weights)
+        self.postings[termId] = result
+        return result
+
+    def score(self, qCounter, K):
+        """
+        Get the top K documents most similar to the query.
+
+        The ranking is the same one of SearchEngine.scoreAccumulators, only
+        documents that share at least one word with the query are ranked.
+
+        param qCounter: a collections.Counter with the frequency of the words
+        of the query.
+        param K: get the K most similar documents.
+        return: a list of tuples (similarity, util.Document) ordered in
+        decrescent similarity.
+        """
+        scores = np.zeros(len(self.docIds), dtype=np.float64)
+        seen = np.zeros(len(self.docIds), dtype=bool)
+        # sorted like in SearchEngine.scoreAccumulators, so the similarities
+        # are summed in the same order
+        for word, freq in sorted(qCounter.iteritems()):
+            termId = self.invertedIndex.termId(word)
+            if termId < 0:
+                self.missingWord(word)
+                continue
+            idf, rows, weights = self.getPostings(termId)
+            # the rows of a posting list are unique, so the fancy indexing
+            # adds each weight exactly once
+            scores[rows] += weights * self.queryWeight(freq, idf)
+            seen[rows] = True
+
+        return self.selectTopK(scores, seen, K)
+
+    def scoreBatch(self, termQueries, nQueries, K):
+        """
+        Get the top K documents most similar to each query of a batch.
+
+        The scores of the whole batch are accumulated in a matrix with one row
+        per query and one column per document, so each posting list is read
+        once per batch, no matter how many queries share the word. The
+        rankings are the same ones of the score method.
+
+        param termQueries: a dict with word keys, and lists of (query index,
+        frequency of the word in the query) as values.
+        param nQueries: the amount of queries in the batch.
+        param K: get the K most similar documents.
+        return: a list with the results of each query, the results are lists
+        of tuples (similarity, util.Document) ordered in decrescent similarity.
+        """
+        shape = (nQueries, len(self.docIds))
+        scores = np.zeros(shape, dtype=np.float64)
+        seen = np.zeros(shape, dtype=bool)
+        for word in sorted(termQueries.iterkeys()):
+            termId = self.invertedIndex.termId(word)
+            if termId < 0:
+                self.missingWord(word)
+                continue
+            idf, rows, weights = self.getPostings(termId)
+            queries = np.array([iii for iii, freq in termQueries[word]])
+            qWeights = np.array([self.queryWeight(freq, idf)
+                for iii, freq in termQueries[word]])
+            block = np.ix_(queries, rows)
+            scores[block] += np.outer(qWeights, weights)
+            seen[block] = True
+
+        return [self.selectTopK(scores[iii], seen[iii], K)
+                for iii in xrange(nQueries)]
+
+    def selectTopK(self, scores, seen, K):
+        """
+        Normalize the scores by the norms of the documents, and get the K
+        greatest similarities.
+
+        param scores: numpy array with the dot product of the query and each
+        document.
+        param seen: numpy array of bools, True for the documents that share
+        at least one word with the query.
+        param K: get the K most similar documents.
+        return: a list of tuples (similarity, util.Document) ordered in
+        decrescent similarity.
+        """
+        candidates = np.flatnonzero(seen)
+        similarities = scores[candidates] / self.norms[candidates]
+
+        # keep the candidates with similarity at least as great as the K-th
+        # greatest one, ties included, and order them by similarity and then
+        # docID, like the heap of the accumulators does
+        if len(candidates) > K:
+            pivot = len(candidates) - K
+            kth = similarities[np.argpartition(similarities, pivot)[pivot]]
+            keep = np.flatnonzero(similarities >= kth)
+            candidates = candidates[keep]
+            similarities = similarities[keep]
+        docIds = self.docIds[candidates]
+        order = np.lexsort((docIds, similarities))[::-1][:K]
+
+        return [(float(similarities[iii]), self.documents[int(docIds[iii])])
+                for iii in order]
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from __future__ import division
+from Postings import PostingList
+from math import log
+import array
+
+class TfIdf(object):
+    """
+    The classic weighting of the vector model, and the one baked in the
+    posting lists of an index created without raw frequencies:
+        tf = frequency of the word in the document (or query).
+        idf = log_2(N/n), where N is the amount of documents in the collection
+        and n is the amount of documents in which the word appears.
+        weight = tf * idf.
+
+    Weightings are only applied at query time to indexes that keep raw
+    frequencies in the posting lists, so changing the weighting of such an
+    index only calculates the idfs and norms again.
+    """
+    name = "tfidf"
+
+    def idf(self, N, n):
+        """
+        param N: amount of documents in the collection.
+        param n: amount of documents in which the word appears.
+        return: the idf of the word.
+        """
+        return log(N / n, 2)
+
+    def tf(self, freq):
+        """
+        param freq: the frequency of a word in a document or query.
+        return: the tf component of the weight of the word.
+        """
+        return freq
+
+    def documentWeights(self, lst):
+        """
+        Get the tf component of the weights of a posting list of raw
+        frequencies.
+
+        param lst: a Postings.PostingList with frequencies as weights.
+        return: a Postings.PostingList with the tf of the frequencies as
+        weights. The compressed docIDs and skip pointers are shared with lst.
+        """
+        return lst
+
+class LogTfIdf(TfIdf):
+    """
+    Sublinear tf scaling, a word appearing twice as often in a document
+    doesn't get twice the weight:
+        tf = 1 + log_2(frequency).
+        idf = log_2(N/n).
+    """
+    name = "logtfidf"
+
+    def tf(self, freq):
+        return 1 + log(freq, 2)
+
+    def documentWeights(self, lst):
+        weights = array.array("f", [1 + log(freq, 2) for freq in lst.weights])
+        return PostingList(lst.data, weights, lst.lastDocId, lst.skips)
+
+class Tf(TfIdf):
+    """
+    Frequencies only, every word has the same importance:
+        tf = frequency.
+        idf = 1.
+    """
+    name = "tf"
+
+    def idf(self, N, n):
+        return 1.0
+
+# the weightings that can be chosen by name
+WEIGHTINGS = dict((weighting.name, weighting)
+        for weighting in [TfIdf(), LogTfIdf(), Tf()])
+WEIGHTING_NAMES = sorted(WEIGHTINGS.iterkeys())
+DEFAULT_WEIGHTING = TfIdf.name
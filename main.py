@@ -3,19 +3,58 @@
 
 from __future__ import division
 from SearchEngine import SearchEngine
+from SearchEngine import ACCUMULATORS_SCORING
+from SearchEngine import DEFAULT_CACHE_SIZE
+from SearchEngine import DAAT_SCORING
+from SearchEngine import IMPACT_SCORING
+from SearchEngine import MAXSCORE_SCORING
+from SearchEngine import SCORINGS
+from Parser import Parser
+from QueryServer import QueryClient
+from QueryServer import QueryServer
+from QueryBatcher import DEFAULT_MAX_SIZE
+from QueryBatcher import DEFAULT_WINDOW
+from QueryServer import DEFAULT_HOST
+from QueryServer import DEFAULT_PORT
+from QueryServer import SEARCH_PATH
+from QueryServer import parseAddress
+from ShardedIndex import ShardedSearchEngine
+from Stats import Stats
+from ImpactScorer import QUIT_STRATEGY
+from ImpactScorer import STRATEGIES
+from Positions import FIELD_POSITION_GAP
 from time import time as getTime
 #from time import clock as getTime
 from util import Query
+from Normalizer import DEFAULT_NORMALIZER
+from Normalizer import NORMALIZER_NAMES
+from Weighting import DEFAULT_WEIGHTING
+from Weighting import WEIGHTING_NAMES
 import Evaluator
 import argparse
+import cProfile
+import os
+import pstats
+import socket
 import sys
 
 CREATE_INDEX_CMD = "createindex"
 INTERACTIVE_QUERY_CMD = "iquery"
 PROCESS_QUERY_FILE_CMD = "queryfile"
+EXPORT_INDEX_CMD = "exportindex"
+ADD_FILES_CMD = "addfiles"
+DELETE_DOCS_CMD = "deletedocs"
+SERVE_CMD = "serve"
 RANKING_SIZE = 20
 
-INDEX_PATH = "cfcIndex.txt"
+INDEX_PATH = "cfcIndex.bin"
+EXPORT_PATH = "cfcIndex.txt"
+# the path of each shard of a sharded index, formatted with its number
+SHARD_PATH_FORMAT = "cfcIndex.{}.bin"
+# where the cProfile output is saved by default, and how many of its
+# functions are printed
+PROFILE_PATH = "cfcProfile.prof"
+PROFILE_ENTRIES = 20
 
 def createParser():
     description = """
@@ -26,59 +65,403 @@ def createParser():
         function can be either:
         <{}> for creating the index;
         <{}> for an interactive query mode;
-        <{}> for parsing a cfc query file.
+        <{}> for parsing a cfc query file;
+        <{}> for exporting the index to the human readable {};
+        <{}> for adding cfc files to an updatable index;
+        <{}> for deleting documents from an updatable index;
+        <{}> for answering queries over HTTP with the index loaded once.
         """.format(CREATE_INDEX_CMD, INTERACTIVE_QUERY_CMD,
-            PROCESS_QUERY_FILE_CMD)
+            PROCESS_QUERY_FILE_CMD, EXPORT_INDEX_CMD, EXPORT_PATH,
+            ADD_FILES_CMD, DELETE_DOCS_CMD, SERVE_CMD)
     rsHelp = """
         optional argument for specifying the amont of documents that
         should be returned by a query, defaults to {}
         """.format(RANKING_SIZE)
     inHelp = """
         argument for passing input path to the program, needed by the
-        {}, and {} functionalities.
-        """.format(CREATE_INDEX_CMD, PROCESS_QUERY_FILE_CMD)
+        {}, {}, and {} functionalities.
+        """.format(CREATE_INDEX_CMD, PROCESS_QUERY_FILE_CMD, ADD_FILES_CMD)
+
+    scHelp = """
+        optional argument for choosing how the documents are scored by the
+        {} and {} functionalities, can be either: {}. Defaults to {}
+        """.format(INTERACTIVE_QUERY_CMD, PROCESS_QUERY_FILE_CMD,
+            ", ".join(SCORINGS), ACCUMULATORS_SCORING)
+
+    maHelp = """
+        optional argument for the {} scoring, the maximum amount of
+        documents that get a similarity in a query, bounding its memory and
+        latency at the cost of an approximate ranking. The {} functionality
+        compares the approximate rankings with the exact ones. Defaults to
+        0, no budget
+        """.format(IMPACT_SCORING, PROCESS_QUERY_FILE_CMD)
+
+    mpHelp = """
+        optional argument for the {} scoring, the maximum amount of postings
+        processed in a query, the ones with the greatest impacts. Defaults
+        to 0, no budget
+        """.format(IMPACT_SCORING)
+
+    stHelp = """
+        optional argument for the {} scoring, what a query does once the
+        budget of the -ma argument is reached: {} stops at once, {} keeps
+        adding the postings of the documents that already have a
+        similarity. Defaults to {}
+        """.format(IMPACT_SCORING, STRATEGIES[0], STRATEGIES[1],
+            QUIT_STRATEGY)
+
+    bHelp = """
+        optional flag for the {} functionality, scores all the queries of
+        the file together in batches instead of one at a time.
+        """.format(PROCESS_QUERY_FILE_CMD)
+
+    wHelp = """
+        optional argument for the {} functionality, the amount of processes
+        parsing the collection files in parallel, and for the {}
+        functionality, the amount of processes scoring the queries.
+        Defaults to 1
+        """.format(CREATE_INDEX_CMD, SERVE_CMD)
+
+    csHelp = """
+        optional argument for the {} and {} functionalities, the maximum
+        amount of query results kept in the cache, 0 disables the cache.
+        Defaults to {}
+        """.format(INTERACTIVE_QUERY_CMD, PROCESS_QUERY_FILE_CMD,
+            DEFAULT_CACHE_SIZE)
+
+    skHelp = """
+        optional argument for the {} functionality, the amount of postings
+        between the skip pointers of the posting lists, used by the {} and
+        {} scorings to jump over postings. Defaults to 0, no skip pointers
+        """.format(CREATE_INDEX_CMD, MAXSCORE_SCORING, DAAT_SCORING)
+
+    nmHelp = """
+        optional argument for the {} functionality, the normalization of the
+        words of the documents and queries, can be either: {}. The queries
+        of the other functionalities use the normalization of the index.
+        Defaults to {}
+        """.format(CREATE_INDEX_CMD, ", ".join(NORMALIZER_NAMES),
+            DEFAULT_NORMALIZER)
+
+    uHelp = """
+        optional flag for the {} functionality, keeps the frequencies in the
+        index so it can be updated with the {} and {} functionalities.
+        """.format(CREATE_INDEX_CMD, ADD_FILES_CMD, DELETE_DOCS_CMD)
+    psHelp = """
+        optional flag for the {} functionality, keeps the positions of the
+        words in the documents, so the queries can have phrases between
+        double quotes, like "cystic fibrosis", and NEAR/k operators between
+        words or phrases, like pseudomonas NEAR/3 aeruginosa. The distances
+        of the NEAR operators are at most {}, greater ones are reduced to it,
+        so they don't reach the words of other fields of the documents. A
+        positional index can't be updated.
+        """.format(CREATE_INDEX_CMD, FIELD_POSITION_GAP)
+    fdHelp = """
+        optional flag for the {} functionality, keeps the postings of the
+        words of the title (ti), major (mj) and minor (mn) subjects, of the
+        authors (au) and of the year (year) of the documents, so the queries
+        can have field:term operators, like ti:fibrosis or au:hoiby, besides
+        the AND, OR and NOT operators and parentheses. An index with fields
+        can't be updated.
+        """.format(CREATE_INDEX_CMD)
+    rnHelp = """
+        the ids (RN) of the documents deleted by the {} functionality.
+        """.format(DELETE_DOCS_CMD)
+
+    wtHelp = """
+        optional argument for choosing the weighting of the words, can be
+        either: {}. Indexes created with the -u argument apply the weighting
+        at query time, so it can be changed without creating the index
+        again. Defaults to the weighting of the index, or {} when creating
+        it.
+        """.format(", ".join(WEIGHTING_NAMES), DEFAULT_WEIGHTING)
+
+    svHelp = """
+        optional argument with the address host:port of the server, where
+        the {} functionality listens, and where the {} and {}
+        functionalities send the queries instead of loading the index. The
+        scoring and cache of the queries sent to a server are the ones of
+        the server. Defaults to {}:{} for the {} functionality
+        """.format(SERVE_CMD, INTERACTIVE_QUERY_CMD, PROCESS_QUERY_FILE_CMD,
+            DEFAULT_HOST, DEFAULT_PORT, SERVE_CMD)
+
+    bwHelp = """
+        optional argument for the {} functionality, how long in
+        milliseconds the first query of a batch waits for the queries of
+        other clients, that are scored together with it. Defaults to {}
+        """.format(SERVE_CMD, DEFAULT_WINDOW * 1000)
+
+    bsHelp = """
+        optional argument for the {} functionality, the maximum amount of
+        queries scored together in a batch. Defaults to {}
+        """.format(SERVE_CMD, DEFAULT_MAX_SIZE)
+
+    jHelp = """
+        optional argument for the {} functionality, the amount of processes
+        processing the queries in parallel, sharing the memory mapped
+        index. Defaults to 1
+        """.format(PROCESS_QUERY_FILE_CMD)
+
+    shHelp = """
+        optional argument for the {} functionality, splits the index in
+        this amount of shards, saved as {}, and for the {} and {}
+        functionalities, queries the shards in parallel instead of the
+        whole index. Defaults to 1, no shards
+        """.format(CREATE_INDEX_CMD, SHARD_PATH_FORMAT.format("<num>"),
+            INTERACTIVE_QUERY_CMD, PROCESS_QUERY_FILE_CMD)
+
+    pfHelp = """
+        optional argument for any functionality, times the stages of the
+        search engine, like the tokenization, the traversal of the posting
+        lists and the selection of the top K, and counts the postings
+        scanned, accumulators created and heap operations. The {}
+        functionality prints them for each query. The whole run is also
+        profiled with cProfile, its output is saved at the path given,
+        defaults to {}. The stages of the processes of a server, of shards
+        or of the -j argument are not included
+        """.format(INTERACTIVE_QUERY_CMD, PROFILE_PATH)
 
     parser.add_argument("function", help=functionHelp)
     parser.add_argument("-in", "--input", help=inHelp, dest="path")
     parser.add_argument("-rs", "--rankingsize", help=rsHelp,
             type=int, default=RANKING_SIZE, dest="rSize")
+    parser.add_argument("-sc", "--scoring", help=scHelp, choices=SCORINGS,
+            default=ACCUMULATORS_SCORING, dest="scoring")
+    parser.add_argument("-w", "--workers", help=wHelp, type=int, default=1,
+            dest="workers")
+    parser.add_argument("-cs", "--cachesize", help=csHelp, type=int,
+            default=DEFAULT_CACHE_SIZE, dest="cacheSize")
+    parser.add_argument("-sk", "--skips", help=skHelp, type=int, default=0,
+            dest="skipInterval")
+    parser.add_argument("-nm", "--normalizer", help=nmHelp,
+            choices=NORMALIZER_NAMES, default=DEFAULT_NORMALIZER,
+            dest="normalizer")
+    parser.add_argument("-u", "--updatable", help=uHelp, action="store_true",
+            dest="updatable")
+    parser.add_argument("-ps", "--positions", help=psHelp,
+            action="store_true", dest="positional")
+    parser.add_argument("-fd", "--fields", help=fdHelp, action="store_true",
+            dest="fields")
+    parser.add_argument("-rn", "--rns", help=rnHelp, type=int, nargs="+",
+            default=[], dest="rns")
+    parser.add_argument("-wt", "--weighting", help=wtHelp,
+            choices=WEIGHTING_NAMES, dest="weighting")
+    parser.add_argument("-b", "--batch", help=bHelp, action="store_true",
+            dest="batch")
+    parser.add_argument("-sv", "--server", help=svHelp, dest="server")
+    parser.add_argument("-bw", "--batchwindow", help=bwHelp, type=float,
+            default=DEFAULT_WINDOW * 1000, dest="batchWindow")
+    parser.add_argument("-bs", "--batchsize", help=bsHelp, type=int,
+            default=DEFAULT_MAX_SIZE, dest="batchSize")
+    parser.add_argument("-j", "--jobs", help=jHelp, type=int, default=1,
+            dest="jobs")
+    parser.add_argument("-sh", "--shards", help=shHelp, type=int, default=1,
+            dest="shards")
+    parser.add_argument("-ma", "--maxaccumulators", help=maHelp, type=int,
+            default=0, dest="maxAccumulators")
+    parser.add_argument("-mp", "--maxpostings", help=mpHelp, type=int,
+            default=0, dest="maxPostings")
+    parser.add_argument("-st", "--strategy", help=stHelp, choices=STRATEGIES,
+            default=QUIT_STRATEGY, dest="strategy")
+    parser.add_argument("-pf", "--profile", help=pfHelp, nargs="?",
+            const=PROFILE_PATH, dest="profile")
 
     return parser
 
-def loadIndexWrapper(eng):
+def loadIndexWrapper(eng, weighting=None):
     try:
         start = getTime()
         eng.loadIndex(INDEX_PATH)
         print("It took {:.5f} s to load the index."
                 .format(getTime() - start))
-    except IOError:
+    except (IOError, ValueError):
         print("Could not read the index at path: {}".format(INDEX_PATH))
         print("Please create the index first with argument '{}'."
                 .format(CREATE_INDEX_CMD))
         sys.exit(-1)
+    if weighting:
+        setWeightingWrapper(eng, weighting)
     return eng
 
-def menuCreateIndex(eng, cfcFolder):
+def loadShardsWrapper(eng, shards, weighting=None):
+    if weighting:
+        print("The shards use the weighting they were created with.")
+        sys.exit(-1)
+    paths = [SHARD_PATH_FORMAT.format(iii) for iii in xrange(shards)]
+    try:
+        start = getTime()
+        sharded = ShardedSearchEngine(paths, eng.scoring,
+                eng.resultCache.maxSize)
+        print("It took {:.5f} s to check the shards."
+                .format(getTime() - start))
+    except (IOError, ValueError) as e:
+        print("Could not read the {} shards at paths: {}"
+                .format(shards, SHARD_PATH_FORMAT.format("<num>")))
+        print(e)
+        print("Please create the shards first with arguments '{} -sh {}'."
+                .format(CREATE_INDEX_CMD, shards))
+        sys.exit(-1)
+    return sharded
+
+# the engine that processes the queries: a client of a server, the shards of
+# a sharded index, or the search engine with the whole index
+def queryEngineWrapper(eng, weighting=None, server=None, shards=1):
+    if server:
+        return clientWrapper(server)
+    if shards > 1:
+        return loadShardsWrapper(eng, shards, weighting)
+    return loadIndexWrapper(eng, weighting)
+
+def setWeightingWrapper(eng, weighting):
+    try:
+        eng.setWeighting(weighting)
+    except ValueError as e:
+        print(e.message)
+        print("Please create the index with the -u argument.")
+        sys.exit(-1)
+
+def menuCreateIndex(eng, cfcFolder, workers=1, updatable=False,
+        weighting=None, skipInterval=0, normalizer=DEFAULT_NORMALIZER,
+        shards=1, positional=False, fields=False):
     if not cfcFolder:
         print("Please enter the path to the cfc collection files using the -in argument")
         sys.exit(-1)
+    if updatable and positional:
+        print("A positional index can't be updated.")
+        print("Please create the index without the -u or the -ps argument.")
+        sys.exit(-1)
+    if updatable and fields:
+        print("An index with fields can't be updated.")
+        print("Please create the index without the -u or the -fd argument.")
+        sys.exit(-1)
+    if weighting and weighting != DEFAULT_WEIGHTING and not updatable:
+        print("Only indexes with raw frequencies can use the weighting: {}"
+                .format(weighting))
+        print("Please create the index with the -u argument.")
+        sys.exit(-1)
+    if weighting:
+        setWeightingWrapper(eng, weighting)
+    eng.setNormalizer(normalizer)
 
     try:
-        eng.createIndex(cfcFolder)
+        eng.createIndex(cfcFolder, workers=workers, rawFrequencies=updatable,
+                skipInterval=skipInterval, positional=positional,
+                fields=fields)
     except IOError as e:
         print("There was an error while parsing the files in the folder: {}"
                 .format(collectionFolder))
         print("Please make sure there are cfc files in the folder path.")
         print(e.message)
+    if shards > 1:
+        for iii, shard in enumerate(eng.splitShards(shards)):
+            path = SHARD_PATH_FORMAT.format(iii)
+            try:
+                shard.saveIndex(path)
+            except IOError as e:
+                print("Could not save the shard file at path: {}".format(path))
+                print(e.message)
+        return
+    try:
+        eng.saveIndex(INDEX_PATH)
+    except IOError as e:
+        print("Could not save the index file at path: {}".format(INDEX_PATH))
+        print(e.message)
+
+def saveIndexWrapper(eng):
     try:
         eng.saveIndex(INDEX_PATH)
     except IOError as e:
         print("Could not save the index file at path: {}".format(INDEX_PATH))
         print(e.message)
 
-def menuInteractiveQuery(eng, rankingSize):
+def menuAddFiles(eng, path):
+    if not path:
+        print("Please enter the path to the cfc file or folder using the -in argument")
+        sys.exit(-1)
     eng = loadIndexWrapper(eng)
 
+    try:
+        if os.path.isdir(path):
+            paths = eng.listCollectionFiles(path)
+        else:
+            paths = [path]
+        eng.addFiles(paths)
+    except IOError as e:
+        print("There was an error while parsing the files at: {}".format(path))
+        print(e.message)
+        sys.exit(-1)
+    except ValueError as e:
+        print(e.message)
+        print("Please create the index with the -u argument.")
+        sys.exit(-1)
+    saveIndexWrapper(eng)
+
+def menuDeleteDocs(eng, docIds):
+    if not docIds:
+        print("Please enter the ids of the documents using the -rn argument")
+        sys.exit(-1)
+    eng = loadIndexWrapper(eng)
+
+    try:
+        eng.deleteDocuments(docIds)
+    except ValueError as e:
+        print(e.message)
+        print("Please create the index with the -u argument.")
+        sys.exit(-1)
+    saveIndexWrapper(eng)
+
+def menuExportIndex(eng, weighting=None):
+    eng = loadIndexWrapper(eng, weighting)
+
+    try:
+        eng.exportIndex(EXPORT_PATH)
+    except IOError as e:
+        print("Could not export the index to the file at path: {}"
+                .format(EXPORT_PATH))
+        print(e.message)
+
+def clientWrapper(address):
+    try:
+        return QueryClient(parseAddress(address))
+    except ValueError as e:
+        print(e.message)
+        sys.exit(-1)
+
+def menuServe(eng, address, workers=1, weighting=None,
+        batchWindow=DEFAULT_WINDOW, batchSize=DEFAULT_MAX_SIZE):
+    eng = loadIndexWrapper(eng, weighting)
+    try:
+        host, port = parseAddress(address)
+        server = QueryServer(eng, (host, port), workers, INDEX_PATH, weighting,
+                batchWindow, batchSize)
+    except (ValueError, socket.error) as e:
+        print("Could not serve the queries at: {}".format(address))
+        print(e)
+        sys.exit(-1)
+
+    print("Serving the queries at http://{}:{}{} with {} worker(s)."
+            .format(host, port, SEARCH_PATH, workers))
+    print("Press CTRL+C to stop the server.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('')
+    finally:
+        server.server_close()
+
+    print("Latency of the requests:")
+    print(server.batcher.latencies.format(" ms"))
+    print("Size of the batches:")
+    print(server.batcher.batchSizes.format())
+    if server.pool is None:
+        printCacheStats(eng)
+
+def menuInteractiveQuery(eng, rankingSize, weighting=None, server=None,
+        shards=1, profile=False):
+    eng = queryEngineWrapper(eng, weighting, server, shards)
+    # only the search engine in this process times the stages of the query
+    profile = profile and isinstance(eng, SearchEngine)
+
     qId = 1
     while True:
         try:
@@ -92,9 +475,25 @@ def menuInteractiveQuery(eng, rankingSize):
         query = Query(qId, queryString, [])
 
         start = getTime()
-        results, evalResults = eng.processQuery(query, rankingSize)
+        try:
+            if profile:
+                queryStats = Stats()
+                results, evalResults = eng.processQuery(query, rankingSize,
+                        stats=queryStats)
+            else:
+                results, evalResults = eng.processQuery(query, rankingSize)
+        except IOError as e:
+            print(e.message)
+            sys.exit(-1)
+        except ValueError as e:
+            # a query with operators the index can't answer
+            print(e.message)
+            continue
         print("It took {} s to process the query."
                 .format(getTime() - start))
+        if profile:
+            print("Stages of the query:")
+            print(queryStats.format())
 
         for result in results:
             similarity, doc = result
@@ -104,12 +503,104 @@ def menuInteractiveQuery(eng, rankingSize):
             print("\tauthors: {}, year: {}\n"
                     .format(doc.authors, doc.year))
 
-def menuQueryFile(eng, queryFile, rankingSize):
-    eng = loadIndexWrapper(eng)
+    # the caches of a server or of the shards are in their processes
+    if isinstance(eng, SearchEngine):
+        printCacheStats(eng)
+    else:
+        eng.close()
 
+def printStats(eng):
+    stats = eng.stats
+    if stats.timers or stats.counters:
+        print("Stages of the search engine:")
+        print(stats.format())
+
+def dumpProfile(profiler, path):
+    try:
+        profiler.dump_stats(path)
+        print("The cProfile output was saved at: {}".format(path))
+    except IOError as e:
+        print("Could not save the cProfile output at path: {}".format(path))
+        print(e.message)
+    print("Functions with the greatest cumulative time:")
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_ENTRIES)
+
+def printCacheStats(eng):
+    cache = eng.resultCache
+    print("Result cache: {} hits, {} misses, {} cached results."
+            .format(cache.hits, cache.misses, len(cache)))
+
+# yields a tuple (query, results, evalResults, time) for each query
+def processQueryFile(eng, queries, rankingSize, batch, jobs=1):
+    if jobs > 1:
+        answers = eng.processQueriesParallel(queries, rankingSize,
+                evaluate=True, jobs=jobs, batch=batch)
+        for query, answer in zip(queries, answers):
+            results, evalResults, end = answer
+            yield query, results, evalResults, end
+    elif not batch:
+        for query in queries:
+            start = getTime()
+            results, evalResults = eng.processQuery(query, rankingSize,
+                    evaluate=True)
+            yield query, results, evalResults, getTime() - start
+    else:
+        start = getTime()
+        answers = eng.processQueries(queries, rankingSize, evaluate=True)
+        # the time of the batch is split evenly among its queries
+        end = (getTime() - start) / len(queries)
+        for query, pair in zip(queries, answers):
+            results, evalResults = pair
+            yield query, results, evalResults, end
+
+# scores the queries again with the exact ranking, and prints how far the
+# approximate rankings are from it
+def compareWithExact(eng, queries, rankingSize, resultsLst, avgMAP,
+        avgPAtTen):
+    scoring = eng.scoring
+    eng.setScoring(ACCUMULATORS_SCORING)
+    MAPs = []
+    pAtTens = []
+    overlaps = []
+    for query, results in zip(queries, resultsLst):
+        exactResults, evalResults = eng.processQuery(query, rankingSize,
+                evaluate=True)
+        MAPs.append(evalResults["MAP"])
+        pAtTens.append(evalResults["P@10"])
+        overlaps.append(Evaluator.rankingOverlap(
+            [doc.id for sim, doc in results],
+            [doc.id for sim, doc in exactResults]))
+    eng.setScoring(scoring)
+
+    exactMAP = sum(MAPs) / len(MAPs)
+    exactPAtTen = sum(pAtTens) / len(pAtTens)
+    print("\nExact ranking, scored with {}:".format(ACCUMULATORS_SCORING))
+    print("\tP@10: {:.5f}, loss: {:.5f}"
+            .format(exactPAtTen, exactPAtTen - avgPAtTen))
+    print("\tinterpolated MAP: {:.5f}, loss: {:.5f}"
+            .format(exactMAP, exactMAP - avgMAP))
+    print("\tdocuments of the exact rankings found: {:.5f}"
+            .format(sum(overlaps) / len(overlaps)))
+
+def menuQueryFile(eng, queryFile, rankingSize, batch=False, weighting=None,
+        server=None, jobs=1, shards=1):
     if not queryFile:
         print("Please enter the path to the cfc query file using the -in argument")
         sys.exit(-1)
+    eng = queryEngineWrapper(eng, weighting, server, shards)
+    if isinstance(eng, SearchEngine):
+        parser = eng.parser
+    else:
+        parser = Parser()
+        # the queries are scored by the processes of the server or shards
+        jobs = 1
+
+    try:
+        queries = list(parser.parseQueryFile(queryFile))
+    except IOError as e:
+        print("Could not open the cfc query file at: {}.".format(queryFile))
+        print(e.message)
+        sys.exit(-1)
 
     print("ranking size: {}".format(rankingSize))
 
@@ -117,22 +608,19 @@ def menuQueryFile(eng, queryFile, rankingSize):
     recallPointsLst = []
     pAtTens = []
     times = []
+    resultsLst = []
     try:
         print("query id ; P@10 ; interpolated MAP ; time (s)")
-        for query in eng.parser.parseQueryFile(queryFile):
-            start = getTime()
-            results, evalResults = eng.processQuery(query, rankingSize,
-                    evaluate=True)
-            end = getTime() - start
-
+        for query, results, evalResults, end in processQueryFile(eng, queries,
+                rankingSize, batch, jobs):
+            resultsLst.append(results)
             MAPs.append(evalResults["MAP"])
             recallPointsLst.append(evalResults["recallPoints"])
             pAtTens.append(evalResults["P@10"])
             times.append(end)
             print("{:03d} ; {:.5f} ; {:.5f} ; {:.5f} "
                     .format(query.id, pAtTens[-1], MAPs[-1], times[-1]))
-    except IOError as e:
-        print("Could not open the cfc query file at: {}.".format(queryFile))
+    except (IOError, ValueError) as e:
         print(e.message)
         sys.exit(-1)
 
@@ -151,30 +639,83 @@ def menuQueryFile(eng, queryFile, rankingSize):
         p, r = pair
         print("\t({:.5f}, {:.5f}),".format (p, r))
 
+    if isinstance(eng, SearchEngine) and eng.isApproximate():
+        compareWithExact(eng, queries, rankingSize, resultsLst, avgMAP,
+                avgPAtTen)
+
+    # each process has its own cache
+    if not isinstance(eng, SearchEngine):
+        eng.close()
+    elif jobs <= 1:
+        printCacheStats(eng)
+
 if __name__ == '__main__':
     parser = createParser()
     args = parser.parse_args()
-    eng = SearchEngine()
+    try:
+        eng = SearchEngine(args.scoring, args.cacheSize)
+    except ImportError as e:
+        print("Could not use the scoring '{}'.".format(args.scoring))
+        print(e.message)
+        sys.exit(-1)
+    try:
+        eng.setBudget(args.maxAccumulators, args.maxPostings, args.strategy)
+    except ValueError as e:
+        print(e.message)
+        sys.exit(-1)
+    profiler = None
+    if args.profile:
+        eng.enableStats()
+        profiler = cProfile.Profile()
+        profiler.enable()
 
     if args.function == CREATE_INDEX_CMD:
         collectionFolder = args.path
         start = getTime()
-        menuCreateIndex(eng, collectionFolder)
+        menuCreateIndex(eng, collectionFolder, args.workers, args.updatable,
+                args.weighting, args.skipInterval, args.normalizer, args.shards,
+                args.positional, args.fields)
         print("It took {} s to create and save the index."
                 .format(getTime() - start))
 
     elif args.function == INTERACTIVE_QUERY_CMD:
         rankingSize = args.rSize
-        menuInteractiveQuery(eng, rankingSize)
+        menuInteractiveQuery(eng, rankingSize, args.weighting, args.server,
+                args.shards, profiler is not None)
 
     elif args.function == PROCESS_QUERY_FILE_CMD:
         queryFile = args.path
         rankingSize = args.rSize
         start = getTime()
-        menuQueryFile(eng, queryFile, rankingSize)
+        menuQueryFile(eng, queryFile, rankingSize, args.batch,
+                args.weighting, args.server, args.jobs, args.shards)
         print("It took {} s to load the index and process all the queries."
                 .format(getTime() - start))
+
+    elif args.function == SERVE_CMD:
+        menuServe(eng, args.server, args.workers, args.weighting,
+                args.batchWindow / 1000, args.batchSize)
+
+    elif args.function == EXPORT_INDEX_CMD:
+        menuExportIndex(eng, args.weighting)
+
+    elif args.function == ADD_FILES_CMD:
+        start = getTime()
+        menuAddFiles(eng, args.path)
+        print("It took {} s to add the files and save the index."
+                .format(getTime() - start))
+
+    elif args.function == DELETE_DOCS_CMD:
+        start = getTime()
+        menuDeleteDocs(eng, args.rns)
+        print("It took {} s to delete the documents and save the index."
+                .format(getTime() - start))
     else:
         parser.print_help()
         #parser.print_usage()
 
+    if profiler is not None:
+        profiler.disable()
+        printStats(eng)
+        dumpProfile(profiler, args.profile)
+
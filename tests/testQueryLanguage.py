@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#coding: utf-8
+
+from Benchmark import generateCollection
+from collections import Counter
+from SearchEngine import SearchEngine
+from util import Query
+import shutil
+import tempfile
+import unittest
+
+# plain queries, that must rank the documents like before the query syntax,
+# with the words of the synthetic collection of Benchmark.generateCollection
+PLAIN_QUERIES = [
+    "za zb zc zd ze zf",
+    "ZA ZB ZC ZD ZE ZF",
+    "za zb zc AND zd ze zf",
+    "ZA OR ZB NOT ZC",
+    "ti:za mj:zb zc",
+    'the "za" zb',
+    "za NEAR/3 zb zc",
+]
+
+class PlainQueryTest(unittest.TestCase):
+    """
+    Checks that the plain queries, the ones without operators and the ones
+    with operators the index can't answer, are ranked with the words of the
+    query only.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp()
+        generateCollection(cls.folder, nQueries=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder)
+
+    def checkPlain(self, eng, queryStrings):
+        """
+        Check that the queries are ranked like the bag of their words.
+        """
+        eng.warnMissingWords = False
+        for qId, queryString in enumerate(queryStrings):
+            results, evalResults = eng.processQuery(
+                    Query(qId, queryString, []), 20)
+            expected = eng.scoreAccumulators(
+                    Counter(eng.parser.tokenize(queryString)), 20)
+            self.assertTrue(results, queryString)
+            self.assertEqual([(similarity, doc.id)
+                for similarity, doc in results], [(similarity, doc.id)
+                    for similarity, doc in expected], queryString)
+
+    def testDefaultIndex(self):
+        eng = SearchEngine()
+        eng.createIndex(self.folder)
+        self.checkPlain(eng, PLAIN_QUERIES)
+
+    def testIndexWithFields(self):
+        eng = SearchEngine()
+        eng.createIndex(self.folder, positional=True, fields=True)
+        # the words joined by nothing are not a filter
+        self.checkPlain(eng, ["za zb zc zd ze zf", "ZA ZB ZC ZD ZE ZF"])
+        results = eng.processQuery(Query(0, "za zb zc AND zd ze zf", []),
+                len(eng.documents))[0]
+        matched = set(eng.matchBoolean(eng.tokenizeQuery("zc AND zd")[1][0]))
+        self.assertEqual(set(doc.id for similarity, doc in results), matched)
+
+    def testIndexWithoutPositions(self):
+        eng = SearchEngine()
+        eng.createIndex(self.folder, fields=True)
+        self.checkPlain(eng, ['the "za" zb', "za NEAR/3 zb zc"])
+        # the phrases of the Boolean queries are plain words too
+        results = eng.processQuery(Query(0, '"za zb" AND zc', []), 20)[0]
+        expected = eng.processQuery(Query(1, "za zb AND zc", []), 20)[0]
+        self.assertTrue(results)
+        self.assertEqual(results, expected)
+
+if __name__ == '__main__':
+    unittest.main()